@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+from postgres_stat_profiler.api_auth.api_keystore import api_keystore
+
+# api key verification benchmark: the cost of api_keystore.checkKey per authenticated request, for a valid key
+# (first and last of the keystore), an invalid key, and a request just after the keystore file changed (reload).
+# for reference, also the cost of verification by decrypting the keystore file on every request
+#
+#   python -m benchmarks.auth_benchmark --requests 20000
+#
+
+def getPercentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def getTimes(check, key, requests):
+    times = []
+    for i in range(requests):
+        start = time.perf_counter()
+        check(key)
+        times.append(time.perf_counter() - start)
+    return {u'mean_us': sum(times) / len(times) * 1000000, u'p99_us': getPercentile(times, 0.99) * 1000000}
+
+
+# verification by decrypting every keystore line until one matches, reading the file on every request
+def getFileScanCheck(keystore):
+    def check(testkey):
+        with open(keystore.keyfilename, 'r') as cf:
+            for cfline in cf.readlines():
+                if keystore.fernet.decrypt(cfline.encode(u'utf-8')).decode(u'utf-8') == testkey:
+                    return True
+        return False
+    return check
+
+
+def runScenarios(options):
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        keystore = api_keystore(uuid.uuid4().hex, os.path.join(directory, u'.pg-stat-profiler.keystr'))
+        first, last, invalid = keystore.getApiKey(0), keystore.getApiKey(4), uuid.uuid4().hex + uuid.uuid4().hex
+        for name, key in [(u'valid first key', first), (u'valid last key', last), (u'invalid key', invalid)]:
+            results[name] = getTimes(keystore.checkKey, key, options[u'requests'])
+
+        def reloadcheck(key):
+            os.utime(keystore.keyfilename, ns=(0, time.time_ns()))
+            return keystore.checkKey(key)
+        results[u'after keystore change'] = getTimes(reloadcheck, last, max(1, options[u'requests'] // 100))
+
+        filescan = getFileScanCheck(keystore)
+        for name, key in [(u'file scan, valid last key', last), (u'file scan, invalid key', invalid)]:
+            results[name] = getTimes(filescan, key, max(1, options[u'requests'] // 10))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'postgres_stat_profiler api key verification benchmark')
+    parser.add_argument(u'--requests', type=int, default=20000, help=u'verifications measured per scenario')
+    parser.add_argument(u'--json', action=u'store_true', help=u'print results as json')
+    args = parser.parse_args(argv)
+    options = vars(args)
+    results = runScenarios(options)
+    if args.json:
+        print(json.dumps({u'options': options, u'results': results}, indent=2))
+    else:
+        for name, times in results.items():
+            print(u'{:<28} mean {:>9.2f} us  p99 {:>9.2f} us'.format(name, times[u'mean_us'], times[u'p99_us']))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import sys
+import time
+import json
+import base64
+import logging
+import argparse
+import resource
+import multiprocessing
+from postgres_stat_profiler.config.profile import profile
+from postgres_stat_profiler.collection import connectionpool
+from postgres_stat_profiler.collection.postgresCollector import postgrescollector
+from benchmarks.syntheticstatements import syntheticstatements
+from benchmarks.standins import standinpool
+
+# collector benchmark: runs postgrescollector.collect for 1, 10 and 100 profiles (by default) against synthetic
+# pg_stat_statements sources and stand-in report connections, offline. reports rows per second, per-phase latency
+# (see collection/phasetimer.py) and peak rss. each profile count runs in a fresh process so that peak rss is its own
+#
+#   python -m benchmarks.collector_benchmark --profiles 1 10 100 --entries 5000 --textlength 500 --churn 0.02
+#
+
+class collecterrors(logging.Handler):
+
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.count = 0
+
+    def emit(self, record):
+        if u'collect error' in record.getMessage():
+            self.count = self.count + 1
+
+
+def getProfile(index, options):
+    credentials = base64.urlsafe_b64encode(b'bench:bench').decode(u'utf-8')
+    return profile({u'name': u'bench{}'.format(index), u'status': u'enabled',
+                    u'queryencryption': options[u'queryencryption'],
+                    u'queryencryptionsecret': base64.urlsafe_b64encode(b'benchsecret').decode(u'utf-8'),
+                    u'monitored_connection': {u'type': u'postgresql', u'host': u'monitored{}'.format(index), u'port': 5432,
+                                              u'sslmode': u'disable', u'credentials': credentials, u'database': u'bench'},
+                    u'report_connection': {u'type': u'postgresql', u'host': u'report', u'port': 5432,
+                                           u'sslmode': u'disable', u'credentials': credentials, u'database': u'bench'},
+                    u'collection_settings': {u'capturemode': options[u'capturemode'], u'topn': options[u'topn']},
+                    u'report_settings': {u'partitioninterval': u'none', u'rollups': u'disabled'}})
+
+
+def getPercentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+# one profile count, in its own process. the first cycle of each collector has no previous snapshot and is not measured
+def runScenario(profilecount, options):
+    # collector warnings are counted (collect errors) rather than printed
+    errors = collecterrors()
+    logging.getLogger().handlers = [errors]
+    logging.getLogger().setLevel(logging.WARNING)
+    pool = standinpool()
+    connectionpool._pool = pool
+    collectors = []
+    sources = []
+    for i in range(0, profilecount):
+        collector = postgrescollector(getProfile(i, options), checkstatus=False)
+        source = syntheticstatements(options[u'entries'], options[u'textlength'], options[u'churn'], options[u'activity'], seed=i)
+        pool.addSource(collector.monitordb.getConnstring(), source)
+        collectors.append(collector)
+        sources.append(source)
+    for collector in collectors:
+        collector.collect()
+    phases = {}
+    collecttimes = []
+    rowsread = 0
+    rowswritten = pool.rowswritten
+    for cycle in range(0, options[u'cycles']):
+        for source in sources:
+            source.advance()
+        for collector, source in zip(collectors, sources):
+            start = time.perf_counter()
+            collector.collect()
+            collecttimes.append(time.perf_counter() - start)
+            rowsread = rowsread + len(source.getRows())
+            for phase, seconds in collector.getLastPhaseTimes().items():
+                phases.setdefault(phase, []).append(seconds)
+    elapsed = sum(collecttimes)
+    return {u'profiles': profilecount,
+            u'collects': len(collecttimes),
+            u'errors': errors.count,
+            u'rows_read_per_sec': rowsread / elapsed if elapsed > 0 else 0.0,
+            u'rows_written_per_sec': (pool.rowswritten - rowswritten) / elapsed if elapsed > 0 else 0.0,
+            u'collect_ms': {u'mean': 1000 * elapsed / len(collecttimes), u'p95': 1000 * getPercentile(collecttimes, 0.95)},
+            u'phase_ms': dict([(phase, {u'mean': 1000 * sum(times) / len(times), u'p95': 1000 * getPercentile(times, 0.95)})
+                               for phase, times in phases.items()]),
+            # kilobytes on linux
+            u'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0}
+
+
+def printResult(result):
+    print(u'profiles {:>4}  collects {:>5}  errors {}  rows read/s {:>10.0f}  rows written/s {:>10.0f}  collect ms mean {:>8.2f} p95 {:>8.2f}  peak rss {:>7.1f} MB'.format(
+          result[u'profiles'], result[u'collects'], result[u'errors'], result[u'rows_read_per_sec'], result[u'rows_written_per_sec'],
+          result[u'collect_ms'][u'mean'], result[u'collect_ms'][u'p95'], result[u'peak_rss_mb']))
+    for phase, times in result[u'phase_ms'].items():
+        print(u'    {:<18} mean {:>8.3f} ms  p95 {:>8.3f} ms'.format(phase, times[u'mean'], times[u'p95']))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=u'postgres_stat_profiler collector benchmark (offline)')
+    parser.add_argument(u'--profiles', type=int, nargs=u'+', default=[1, 10, 100])
+    parser.add_argument(u'--entries', type=int, default=1000, help=u'pg_stat_statements entries per profile')
+    parser.add_argument(u'--textlength', type=int, default=200, help=u'query text length')
+    parser.add_argument(u'--churn', type=float, default=0.01, help=u'fraction of entries replaced each cycle')
+    parser.add_argument(u'--activity', type=float, default=0.3, help=u'fraction of entries called each cycle')
+    parser.add_argument(u'--cycles', type=int, default=5, help=u'measured collection cycles')
+    parser.add_argument(u'--capturemode', choices=[u'topn', u'full'], default=u'topn')
+    parser.add_argument(u'--topn', type=int, default=100)
+    parser.add_argument(u'--queryencryption', choices=[u'enabled', u'disabled'], default=u'enabled')
+    parser.add_argument(u'--json', action=u'store_true', help=u'print results as json')
+    args = parser.parse_args(argv)
+    options = vars(args)
+    results = []
+    context = multiprocessing.get_context(u'spawn')
+    for profilecount in args.profiles:
+        with context.Pool(1) as scenariopool:
+            result = scenariopool.apply(runScenario, (profilecount, options))
+        results.append(result)
+        if not args.json:
+            printResult(result)
+    if args.json:
+        print(json.dumps({u'options': options, u'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
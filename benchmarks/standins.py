@@ -0,0 +1,108 @@
+from contextlib import contextmanager
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+
+# local stand-ins for the collectors' monitored and report database connections, so that collection can be
+# benchmarked offline. the monitored database answers the cumulative collect query from a syntheticstatements
+# source; the report database accepts every write and counts the rows, and answers every other query with no rows.
+# timings therefore measure the collector's own work, without database or network time
+#
+class standinpool:
+
+    def __init__(self):
+        # monitored connection string -> syntheticstatements
+        self.sources = {}
+        self.collectquery = cumulative_statstatements().getCollectQuery()
+        self.rowswritten = 0
+        self.statements = 0
+
+    def addSource(self, connstring, source):
+        self.sources[connstring] = source
+
+    @contextmanager
+    def connection(self, connstring):
+        yield standinconnection(self, self.sources.get(connstring))
+
+    def getConnection(self, connstring):
+        return standinconnection(self, self.sources.get(connstring))
+
+    def putConnection(self, connstring, conn):
+        pass
+
+    def closeAll(self):
+        pass
+
+
+class standinconnection:
+
+    def __init__(self, pool, source):
+        self.pool = pool
+        self.source = source
+        self.closed = False
+        self.broken = False
+
+    def execute(self, query, parameters=None, prepare=None):
+        self.pool.statements = self.pool.statements + 1
+        if self.source is not None and query == self.pool.collectquery:
+            return standinresult(self.source.getRows())
+        return standinresult([])
+
+    def cursor(self, name=None):
+        return standincursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class standinresult:
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return list(self.rows)
+
+    def fetchone(self):
+        return self.rows[0] if len(self.rows) > 0 else None
+
+
+class standincursor:
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def execute(self, query, parameters=None, prepare=None):
+        return self.conn.execute(query, parameters)
+
+    def executemany(self, query, parameterlist):
+        self.conn.pool.statements = self.conn.pool.statements + 1
+        self.conn.pool.rowswritten = self.conn.pool.rowswritten + len(parameterlist)
+
+    def copy(self, query):
+        return standincopy(self.conn.pool)
+
+
+class standincopy:
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def set_types(self, types):
+        pass
+
+    def write_row(self, row):
+        self.pool.rowswritten = self.pool.rowswritten + 1
@@ -0,0 +1,77 @@
+import random
+
+# synthetic pg_stat_statements content for one monitored database server, advanced cycle by cycle.
+# rows have the shape of the cumulative collect query results (see cumulative_statstatements.getCollectQuery)
+# entries: statements held, textlength: length of each query text, churn: fraction of the entries replaced by
+# new statements each cycle (eviction), activity: fraction of the entries called each cycle
+#
+class syntheticstatements:
+
+    verbs = [u'SELECT', u'SELECT', u'SELECT', u'INSERT', u'UPDATE', u'DELETE']
+    databases = [(16384, u'app'), (16385, u'reporting')]
+    users = [(10, u'postgres'), (16390, u'app_user'), (16391, u'batch_user')]
+
+    def __init__(self, entries=1000, textlength=200, churn=0.01, activity=0.3, seed=0):
+        self.entries = entries
+        self.textlength = textlength
+        self.churn = churn
+        self.activity = activity
+        self.random = random.Random(seed)
+        self.nextid = 0
+        self.rows = [self._getNewRow() for i in range(0, entries)]
+
+    def getRows(self):
+        return self.rows
+
+    # one cycle of activity: churned entries are replaced, then active entries accumulate counters
+    def advance(self):
+        for i in self.random.sample(range(0, self.entries), int(self.entries * self.churn)):
+            self.rows[i] = self._getNewRow()
+        for i in self.random.sample(range(0, self.entries), int(self.entries * self.activity)):
+            self.rows[i] = self._getCalledRow(self.rows[i])
+
+    def _getNewRow(self):
+        self.nextid = self.nextid + 1
+        dbid, dbname = self.random.choice(self.databases)
+        userid, username = self.random.choice(self.users)
+        row = {u'username': username, u'dbname': dbname, u'dbid': dbid, u'userid': userid,
+               u'queryid': self.random.getrandbits(63) - 2 ** 62, u'query': self._getText(), u'toplevel': True,
+               u'calls': 0, u'total_exec_time': 0.0, u'min_exec_time': 0.0, u'max_exec_time': 0.0,
+               u'mean_exec_time': 0.0, u'stddev_exec_time': 0.0, u'rows': 0, u'plans': 0, u'total_plan_time': 0.0,
+               u'min_plan_time': 0.0, u'max_plan_time': 0.0, u'stddev_plan_time': 0.0}
+        for name in [u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                     u'local_blks_hit', u'local_blks_read', u'local_blks_dirtied', u'local_blks_written',
+                     u'temp_blks_read', u'temp_blks_written', u'wal_records', u'wal_fpi']:
+            row[name] = 0
+        row[u'blk_read_time'] = 0.0
+        row[u'blk_write_time'] = 0.0
+        row[u'wal_bytes'] = 0
+        return self._getCalledRow(row)
+
+    # rows are replaced rather than changed in place: a collector may hold the previous rows
+    def _getCalledRow(self, previous):
+        row = dict(previous)
+        calls = self.random.randint(1, 100)
+        exectime = self.random.expovariate(1.0) * calls
+        row[u'calls'] = row[u'calls'] + calls
+        row[u'total_exec_time'] = row[u'total_exec_time'] + exectime
+        row[u'max_exec_time'] = max(row[u'max_exec_time'], exectime / calls * 3)
+        row[u'min_exec_time'] = exectime / calls / 3 if row[u'min_exec_time'] == 0.0 else min(row[u'min_exec_time'], exectime / calls / 3)
+        row[u'mean_exec_time'] = row[u'total_exec_time'] / row[u'calls']
+        row[u'stddev_exec_time'] = row[u'mean_exec_time'] / 2
+        row[u'rows'] = row[u'rows'] + calls * self.random.randint(0, 10)
+        row[u'shared_blks_hit'] = row[u'shared_blks_hit'] + calls * self.random.randint(0, 50)
+        row[u'shared_blks_read'] = row[u'shared_blks_read'] + self.random.randint(0, calls)
+        if not row[u'query'].startswith(u'SELECT'):
+            row[u'shared_blks_dirtied'] = row[u'shared_blks_dirtied'] + calls
+            row[u'wal_records'] = row[u'wal_records'] + calls
+            row[u'wal_bytes'] = row[u'wal_bytes'] + calls * self.random.randint(50, 500)
+        return row
+
+    def _getText(self):
+        verb = self.random.choice(self.verbs)
+        text = u'{} /* statement {} */ c1, c2, c3 FROM schema_{}.table_{} WHERE id = $1'.format(
+            verb, self.nextid, self.nextid % 7, self.nextid % 101)
+        if len(text) < self.textlength:
+            text = text + u' AND c4 IN (' + u', '.join([u'$' + str(i) for i in range(2, self.textlength)])
+        return text[:self.textlength]
@@ -3,133 +3,80 @@ import os
 import logging
 import logging.handlers
 import time
-from flask import Flask, abort, jsonify, make_response, request, Response
-from flask_apscheduler import APScheduler
+from flask import Flask, abort, jsonify, make_response, request, Response, stream_with_context
 from functools import wraps
-import multiprocessing
+import psycopg
 from postgres_stat_profiler.api_auth.api_request import api_request
 from postgres_stat_profiler.api_auth.api_keystore import api_keystore
 from postgres_stat_profiler.config.profilestore import profilestore
-from postgres_stat_profiler.collection.collectorsupervisor import collectorsupervisor
-from postgres_stat_profiler.helpers.env_helper import fetch_env_allow_empty
+from postgres_stat_profiler.collection.controlchannel import controlchannel
+from postgres_stat_profiler.helpers.env_helper import fetch_secbase, fetch_logbase, fetch_secret
+from postgres_stat_profiler.helpers.log_helper import getLogFormatter
+from postgres_stat_profiler.reporting.reportrequest import reportrequest
+from postgres_stat_profiler.reporting.reportquery import reportquery
+from postgres_stat_profiler.reporting.responsecache import responsecache
+from postgres_stat_profiler.reporting.exportrequest import exportrequest
+from postgres_stat_profiler.reporting.reportexport import reportexport
+from postgres_stat_profiler.metrics.metricsblock import metricsblock, getMetricsBlock
+from postgres_stat_profiler.metrics.openmetrics import openmetrics
+from postgres_stat_profiler.collection.statusboard import statusboard, getStatusBoard
 
 
 
-# log listener which handles all child process logging to the common log file destination
-# note; logging to same file direct from many child processes is not safe
-# this runs in a child process supervised by check_slavejobs
+# api app factory: stateless, so that any number of wsgi worker processes may load it (eg gunicorn
+# 'postgres_stat_profiler:create_app()'). collection runs in the collector daemon (see daemon.py): each worker
+# reads profile changes from the profiles file, notifies the daemon of the changes it makes, and reads runtime
+# status from the daemon's shared memory blocks
 #
-def log_listener(file, queue):
-    listenerlogger = logging.getLogger()
-    h = logging.handlers.RotatingFileHandler(file, 'a', 100000000, 10)
-    f = logging.Formatter('%(asctime)s[%(funcName)-5s] (%(processName)-10s) %(message)s')
-    h.setFormatter(f)
-    listenerlogger.addHandler(h)
-    logging.warning('pg_stat-profiler: loglistener started')
-    while True:
-      while not queue.empty():
-        try:
-            record = queue.get()
-            if record is None:  # We send this as a sentinel to tell the listener to quit.
-                break
-            listenerlogger.handle(record)  # No level or filter logic applied - just do it!
-        except Exception as e:
-            print('pg-stat-profiler : loglistener : Unexpected error [{}]'.format(str(e)))
-      time.sleep(0.1)
-
-# profile supervisor control function: runs periodically in parallel with Flask
-#
-def check_slavejobs(loggingjob,loggingqueue,logfilename,supervisorjob,profilesqueue,supervisor,profile_store):
-  try:
-   # 
-   if not supervisorjob.is_alive():
-      supervisorjob.join()
-      supervisorjob = multiprocessing.Process(target=supervisor.run,args=(profilesqueue,loggingqueue))
-      supervisorjob.start()
-      logging.warning("pg-stat-profiler: supervisor restarted with processid :[{}]".format(str(supervisorjob.pid)))
-   else:
-     #  handle profile state changes passed from individual collectors up via supervisor
-     #  ensures that only this main thread updates the persistent profilesfilestore
-     while not profilesqueue.empty(): 
-        qdata = profilesqueue.get()
-        if 'name' in qdata:
-           profile_store.updateProfile(qdata['name'],qdata)
-   #
-   # restart loglistener if it fails
-   if not loggingjob.is_alive():
-      loggingjob.join()
-      loggingjob = multiprocessing.Process(target=log_listener,args=(logfilename,loggingqueue))
-      loggingjob.start()
-      logging.warning("pg-stat-profiler: loglistener restarted with processid :[{}]".format(str(loggingjob.pid)))
-
-  except Exception as e:
-      logging.warning("pg-stat-profiler: Error checking supervisor and loglistener :[{}]".format(str(e)))
-
-
-   
 def create_app():
  
   app = Flask(__name__)
-  scheduler = APScheduler()
-  scheduler.init_app(app)
-  scheduler.start()
 
   # environment checks - fail to start if missing or not expandable
-  installbase = fetch_env_allow_empty(u'PG_STAT_PROFILER_BASE')
-  secbase = os.path.join(installbase,u'postgres_stat_profiler/resources/sec')
-  if not os.path.isdir(secbase):
-   print('pg-stat-profiler: Failed to find security directory, exiting...')
-   print('pg-stat-profiler: Check [Invalid Install base={}]'.format(str(installbase)))
-   print('pg-stat-profiler: Please supply correct environment variable PG_STAT_PROFILER_BASE'.format(str(installbase)))
-   sys.exit()
-
-  logbase = fetch_env_allow_empty(u'PG_STAT_PROFILER_LOGBASE')
-  if not os.path.isdir(logbase):
-   print('pg-stat-profiler: Failed to initiate logging, exiting...')
-   print('pg-stat-profiler: Reason [Invalid Environment Variable PG_STAT_PROFILER_LOGBASE={}]'.format(str(logbase)))
-   sys.exit()
-
-  apiconfig_secret = os.getenv(u'PG_STAT_PROFILER_CONFIG_SECRET')
-  if not apiconfig_secret:  
-      print("pg-stat-profiler: Failed to find secret, exiting...")
-      print("Failed to find environment variable PG_STAT_PROFILER_CONFIG_SECRET")
-      sys.exit()
+  installbase, secbase = fetch_secbase()
+  logbase = fetch_logbase()
+  apiconfig_secret = fetch_secret(u'PG_STAT_PROFILER_CONFIG_SECRET')
+  apikeygen_secret = fetch_secret(u'PG_STAT_PROFILER_APIKEYGEN_SECRET')
 
-  apikeygen_secret = os.getenv(u'PG_STAT_PROFILER_APIKEYGEN_SECRET')
-  if not apikeygen_secret:  
-      print("pg-stat-profiler: Failed to find secret, exiting...")
-      print("Failed to find environment variable PG_STAT_PROFILER_APIKEYGEN_SECRET")
+  # statement timeout (milliseconds) of report api queries against the report databases
+  try:
+      reporttimeout = int(os.getenv(u'PG_STAT_PROFILER_REPORT_TIMEOUT',u'10000'))
+  except ValueError:
+      print('pg-stat-profiler: Invalid report timeout, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_REPORT_TIMEOUT]')
       sys.exit()
+  # report api responses are cached until the profile's next collection completes
+  try:
+      reportcacheentries = int(os.getenv(u'PG_STAT_PROFILER_REPORT_CACHE_ENTRIES',u'512'))
+      reportcachebytes = int(os.getenv(u'PG_STAT_PROFILER_REPORT_CACHE_MB',u'64')) * 1024 * 1024
+  except ValueError:
+      print('pg-stat-profiler: Invalid report cache size, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_REPORT_CACHE_ENTRIES or PG_STAT_PROFILER_REPORT_CACHE_MB]')
+      sys.exit()
+  report_cache = responsecache(reportcacheentries,reportcachebytes)
 
   try:
-      # set up logging for this main process
-      logfilename = os.path.join(logbase,u'pg-stat-profiler.log')
+      # set up logging for this worker process: workers append to one api log, reopened when rotated externally
+      logfilename = os.path.join(logbase,u'pg-stat-profiler-api.log')
       mainlogger = logging.getLogger()
-      h = logging.handlers.RotatingFileHandler(logfilename, 'a', 100000000, 10)
-      f = logging.Formatter('%(asctime)s[%(funcName)-5s] (%(processName)-10s) %(message)s')
-      h.setFormatter(f)
+      h = logging.handlers.WatchedFileHandler(logfilename)
+      h.setFormatter(getLogFormatter())
       mainlogger.addHandler(h)
-      # set up logging to same file for child processes (via the loggingjob child)
-      loggingqueue = multiprocessing.Queue()
-      loggingjob = multiprocessing.Process(target=log_listener,args=(logfilename,loggingqueue))
-      loggingjob.start()
 
       try: 
          keystorefile = os.path.join(secbase,u'.pg-stat-profiler.keystr')
          profilesfile = os.path.join(secbase,u'.pg-stat-profiler.prof')
          keystore = api_keystore(apiconfig_secret,keystorefile)
          profile_store = profilestore(apiconfig_secret,profilesfile)
-         collection_supervisor = collectorsupervisor(apiconfig_secret,profilesfile)
       except Exception as e:
          print('pg-stat-profiler: Failed to initiate data with secret, exiting... Reason [{}]'.format(str(e)))
          sys.exit()
-      
-      profilesqueue = multiprocessing.Queue()
-      supervisorjob = multiprocessing.Process(target=collection_supervisor.run, args=(profilesqueue,loggingqueue))
-      supervisorjob.start()
-      scheduler.add_job(id=u'periodic_supervisorcheck',func=check_slavejobs,
-            args=[loggingjob,loggingqueue,logfilename,supervisorjob,profilesqueue,collection_supervisor,profile_store],
-            trigger='interval', seconds=10)      
+
+      # the collector daemon's shared memory blocks (collector metrics, profile runtime status), attached once the
+      # daemon has created them, and its control channel
+      metricsname = metricsblock.getInstallName(installbase)
+      statusname = statusboard.getInstallName(installbase)
+      control_channel = controlchannel(os.path.join(secbase,u'.pg-stat-profiler.ctl'))
       app.debug = False
       logging.warning('pg-stat-profiler: api started')
   except Exception as e:
@@ -168,6 +115,24 @@ def create_app():
         return f(*args, **kwargs)
     return decorated
 
+  # wake the daemon's supervisor once a profile change is persisted: it reads the change from the profiles file.
+  # not an error if the daemon is not running, it reads the change when it starts
+  def notify_supervisor():
+    control_channel.notify()
+
+  # a shared memory block of the daemon, None if the daemon has not created it (yet)
+  def attach_shared(accessor,name):
+    try:
+       return accessor(name)
+    except Exception:
+       return None
+
+  # each worker reads the profile changes made meanwhile (by any worker), before handling a request
+  @app.before_request
+  def refresh_profiles():
+    profile_store.refresh()
+    profile_store.setStatusBoard(attach_shared(getStatusBoard,statusname))
+
 
   @app.errorhandler(404)
   def not_found(error):
@@ -228,6 +193,7 @@ def create_app():
   def create_profile(name):
    try:
     if profile_store.addProfileApi(name,request):
+        notify_supervisor()
         return  make_response(jsonify({"result":"ok"}),200) 
     else:
         return make_response(jsonify({"result":"error"}),200) 
@@ -251,6 +217,7 @@ def create_app():
   def update_profile(name):
    try: 
     if profile_store.updateProfileApi(name,request):
+        notify_supervisor()
         return  make_response(jsonify({"result":"ok"}),200) 
     else:
         return  make_response(jsonify({"result":"error"}),200) 
@@ -262,6 +229,7 @@ def create_app():
   def delete_profile(name):
    try: 
     if profile_store.deleteProfileApi(name):
+        notify_supervisor()
         return  make_response(jsonify({"result":"ok"}),200) 
     else:
         return  make_response(jsonify({"result":"error"}),200) 
@@ -269,6 +237,115 @@ def create_app():
       return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500) 
   
 
+  # bulk profile export (without credentials) and import (add or replace, persisted in one write)
+  @app.route('/_api/v1.0/bulk/profiles',methods=['GET'])
+  @requires_api_auth
+  def export_profiles():
+   try:
+    return make_response(jsonify({"result" : profile_store.getBulkApiDetails()}),200)
+   except Exception as e:
+      return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500)
+
+  @app.route('/_api/v1.0/bulk/profiles',methods=['POST'])
+  @requires_api_auth
+  def import_profiles():
+   try:
+    imported, errors = profile_store.importProfilesApi(request)
+    if len(imported) > 0:
+        notify_supervisor()
+    result = "ok" if len(errors) == 0 else "error"
+    return make_response(jsonify({"result":result,"imported":imported,"errors":errors}),200)
+   except Exception as e:
+      return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500)
+
+  # collector metrics in OpenMetrics text format (for prometheus: the api key is accepted as a bearer token)
+  @app.route('/metrics',methods=['GET'])
+  @requires_api_auth
+  def publish_metrics():
+   try:
+    metrics_block = attach_shared(getMetricsBlock,metricsname)
+    snapshot = metrics_block.getSnapshot() if metrics_block is not None else []
+    return Response(openmetrics().getText(snapshot,time.time()),status=200,content_type=openmetrics.content_type)
+   except Exception as e:
+      return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500)
+
+  # report api: read-only queries against the profile's report database
+
+  # response for a report cache entry: 304 if the client holds it, gzip-encoded if large and accepted
+  def report_response(entry):
+    if request.if_none_match.contains_weak(entry[u'etag']):
+       response = Response(status=304)
+    elif entry[u'gzip'] is not None and u'gzip' in request.accept_encodings:
+       response = Response(entry[u'gzip'],status=200,mimetype=entry[u'mimetype'])
+       response.headers['Content-Encoding'] = u'gzip'
+    else:
+       response = Response(entry[u'body'],status=200,mimetype=entry[u'mimetype'])
+    # weak: the gzip and identity encodings of an entry share its etag
+    response.set_etag(entry[u'etag'],weak=True)
+    response.headers['Vary'] = u'Accept-Encoding'
+    response.headers['Cache-Control'] = u'no-cache'
+    return response
+
+  @app.route('/_api/v1.0/profiles/<name>/report/topstatements',methods=['GET'])
+  @requires_api_auth
+  def report_topstatements(name):
+   try:
+    if not profile_store.hasName(name):
+       return make_response(jsonify({"error": "Not Found"}), 404)
+    report = reportrequest(request)
+    if not report.getValid():
+       return make_response(jsonify({"error": report.getError()}), 400)
+    # cached responses are served (or revalidated) without a report database query until the collector
+    # reports a newer collection. before the first collection since start nothing is cached
+    collectepoch = profile_store.getLastCollectEpoch(name)
+    cachekey = (request.path, name, report.getNormalised())
+    entry = report_cache.get(cachekey,collectepoch) if collectepoch is not None else None
+    if entry is None:
+       query = reportquery(name,profile_store.getReportConnstring(name),reporttimeout)
+       latestepoch = collectepoch if collectepoch is not None else query.getLatestEpoch()
+       if latestepoch is None:
+          return make_response(jsonify({"error": "No report data"}), 404)
+       start, end = report.getWindow(latestepoch)
+       rows, nextcursor = query.getTopStatements(report.getTable(),report.getMetric(),start,end,report.getFilters(),
+                                                 report.getLimit(),report.getCursor())
+       body = app.json.dumps({"result": rows, "start": start, "end": end, "metric": report.getMetric(),
+                              "granularity": report.getGranularity(),
+                              "next": reportrequest.encodeCursor(nextcursor) if nextcursor is not None else None})
+       entry = report_cache.put(cachekey,collectepoch,body.encode(u'utf-8'))
+    return report_response(entry)
+   except psycopg.errors.QueryCanceled:
+      return make_response(jsonify({"error": "Report query timed out"}),504)
+   except Exception as e:
+      return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500)
+
+  # streamed (chunked) export of report rows, read in batches: memory use does not depend on the window
+  @app.route('/_api/v1.0/profiles/<name>/report/export',methods=['GET'])
+  @requires_api_auth
+  def report_export(name):
+   try:
+    if not profile_store.hasName(name):
+       return make_response(jsonify({"error": "Not Found"}), 404)
+    export = exportrequest(request)
+    if not export.getValid():
+       return make_response(jsonify({"error": export.getError()}), 400)
+    query = reportquery(name,profile_store.getReportConnstring(name),reporttimeout)
+    latestepoch = profile_store.getLastCollectEpoch(name)
+    if latestepoch is None:
+       latestepoch = query.getLatestEpoch()
+    if latestepoch is None:
+       return make_response(jsonify({"error": "No report data"}), 404)
+    start, end = export.getWindow(latestepoch)
+    output = reportexport(export.getFormat())
+    batches = query.getExportBatches(export.getTable(),start,end,export.getFilters())
+    response = Response(stream_with_context(output.getChunks(batches)),status=200,mimetype=output.getMimetype())
+    # the window exported: a resumed export should ask for the same end
+    response.headers['X-Export-Start'] = str(start)
+    response.headers['X-Export-End'] = str(end)
+    response.headers['Content-Disposition'] = u'attachment; filename={}_{}_{}.{}'.format(name,start,end,export.getFormat())
+    return response
+   except Exception as e:
+      return make_response(jsonify({"error": "API Processing Error ("+str(e)+")"}),500)
+
   return app
 
 
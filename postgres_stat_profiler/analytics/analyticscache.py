@@ -0,0 +1,97 @@
+import numpy as np
+from postgres_stat_profiler.analytics.segmentstore import segmentstore
+
+# read side of the local columnar cache: vectorized scans, filters and group-bys over a profile's
+# incremental history between two epochs, reading the memory-mapped day segments only
+#
+#   cache = analyticscache('/path/to/cache')
+#   cache.groupBy('prod', start, end, by=['queryid'], metrics=['calls', 'total_exec_time'], where={'dbid': 16384})
+#
+class analyticscache:
+
+    def __init__(self, cachedir):
+        self.store = segmentstore(cachedir)
+
+    def getDays(self, profilename):
+        return self.store.getDays(profilename)
+
+    # rows with start <= epoch < end, as a dict of arrays: epoch, the metrics, and the key attributes
+    # where: key attribute -> value, or list of values (eg {'dbid': 16384, 'querytype': ['insert', 'update']})
+    def scan(self, profilename, start, end, metrics=None, where=None):
+        metrics = metrics if metrics is not None else segmentstore.metric_columns
+        parts = dict([(name, []) for name in [u'epoch'] + list(metrics) + segmentstore.key_columns])
+        for segment, columns, keys, rows in self._getSegments(profilename, start, end, metrics, where):
+            parts[u'epoch'].append(np.asarray(columns[u'epoch'][rows]))
+            for name in metrics:
+                parts[name].append(np.asarray(columns[name][rows]))
+            keypositions = columns[u'key'][rows]
+            for i, name in enumerate(segmentstore.key_columns):
+                attribute = np.empty(len(keys), dtype=object)
+                attribute[:] = [key[i] for key in keys]
+                parts[name].append(attribute[keypositions])
+        result = {}
+        for name, arrays in parts.items():
+            if len(arrays) > 0:
+                result[name] = np.concatenate(arrays)
+            else:
+                result[name] = np.empty(0, dtype=object if name in segmentstore.key_columns else np.float64)
+        return result
+
+    # sums of the metrics (and the number of rows) per group of key attributes, largest first metric first
+    def groupBy(self, profilename, start, end, by=[u'queryid'], metrics=[u'calls', u'total_exec_time'], where=None):
+        byposition = [segmentstore.key_columns.index(name) for name in by]
+        groups = {}
+        for segment, columns, keys, rows in self._getSegments(profilename, start, end, metrics, where):
+            keypositions = np.asarray(columns[u'key'][rows])
+            counts = np.bincount(keypositions, minlength=len(keys))
+            sums = [np.bincount(keypositions, weights=np.nan_to_num(np.asarray(columns[name][rows])), minlength=len(keys))
+                    for name in metrics]
+            # per key totals are small: merged into the groups in python
+            for keyposition in np.nonzero(counts)[0].tolist():
+                group = tuple([keys[keyposition][i] for i in byposition])
+                totals = groups.setdefault(group, [0] + [0.0 for name in metrics])
+                totals[0] = totals[0] + int(counts[keyposition])
+                for j in range(0, len(metrics)):
+                    totals[j + 1] = totals[j + 1] + float(sums[j][keyposition])
+        result = []
+        for group, totals in groups.items():
+            row = dict(zip(by, group))
+            row[u'rows'] = totals[0]
+            for j, name in enumerate(metrics):
+                row[name] = totals[j + 1]
+            result.append(row)
+        if len(metrics) > 0:
+            result.sort(key=lambda row: row[metrics[0]], reverse=True)
+        return result
+
+    # (segment, memory-mapped columns, key dictionary, positions of the selected rows) for each day overlapping [start, end)
+    def _getSegments(self, profilename, start, end, metrics, where):
+        firstday = self.store.getDay(start)
+        lastday = self.store.getDay(max(start, end - 1))
+        for day in self.store.getDays(profilename):
+            if day < firstday or day > lastday:
+                continue
+            segment = self.store.getSegmentDir(profilename, day)
+            columns = self.store.getColumns(segment, metrics)
+            keys = self.store.getKeys(segment)
+            if len(columns[u'epoch']) == 0 or len(keys) == 0:
+                continue
+            epochs = columns[u'epoch']
+            selected = (epochs >= start) & (epochs < end)
+            keyselected = self._getKeyMask(keys, where)
+            if keyselected is not None:
+                selected = selected & keyselected[np.asarray(columns[u'key'])]
+            rows = np.nonzero(selected)[0]
+            if len(rows) > 0:
+                yield segment, columns, keys, rows
+
+    # filters on key attributes are evaluated once per key, then applied to the rows through the key column
+    def _getKeyMask(self, keys, where):
+        if not where:
+            return None
+        mask = np.ones(len(keys), dtype=bool)
+        for name, value in where.items():
+            position = segmentstore.key_columns.index(name)
+            values = set(value) if isinstance(value, (list, tuple, set)) else set([value])
+            mask = mask & np.array([key[position] in values for key in keys], dtype=bool)
+        return mask
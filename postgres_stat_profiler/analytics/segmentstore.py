@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import logging
+import numpy as np
+from datetime import datetime, timedelta
+
+# local columnar cache of incremental statement history: one segment per profile per day
+# (<cachedir>/<profile>/<YYYYMMDD>/), holding one fixed-width file per column and a key dictionary.
+# rows are appended after each collection; readers memory-map the column files, so a segment can be read
+# while it is being appended (a reader sees the rows complete in every column)
+#
+class segmentstore:
+
+    # int64 columns: collection epoch, and the row's statement key (position in the segment's key dictionary)
+    index_columns = [u'epoch', u'key']
+    metric_columns = [u'calls', u'total_exec_time', u'min_exec_time', u'max_exec_time', u'mean_exec_time', u'stddev_exec_time',
+                      u'rows', u'plans', u'total_plan_time', u'min_plan_time', u'max_plan_time', u'stddev_plan_time',
+                      u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                      u'local_blks_hit', u'local_blks_read', u'local_blks_dirtied', u'local_blks_written',
+                      u'temp_blks_read', u'temp_blks_written', u'blk_read_time', u'blk_write_time',
+                      u'wal_bytes', u'wal_records', u'wal_fpi']
+    # statement attributes held once per key, in the key dictionary
+    key_columns = [u'dbid', u'userid', u'queryid', u'toplevel', u'querytype', u'username', u'dbname']
+
+    def __init__(self, cachedir):
+        self.cachedir = cachedir
+        # key dictionaries of the segments appended to by this process: segment directory -> {key tuple: position}
+        self.keys = {}
+
+    def getCacheDir(self):
+        return self.cachedir
+
+    # append one collection's incremental records (lists in the order of columns) to the profile's segment of that day
+    def append(self, profilename, epoch, columns, records):
+        if len(records) == 0:
+            return
+        segment = self.getSegmentDir(profilename, self.getDay(epoch))
+        os.makedirs(segment, exist_ok=True)
+        position = dict([(name, i) for i, name in enumerate(columns)])
+        keyindex = self._getKeyIndex(segment)
+        keycount = len(keyindex)
+        keys = np.empty(len(records), dtype=np.int64)
+        for i, record in enumerate(records):
+            key = tuple([record[position[name]] for name in self.key_columns])
+            if key not in keyindex:
+                keyindex[key] = len(keyindex)
+            keys[i] = keyindex[key]
+        if len(keyindex) > keycount:
+            self._putKeys(segment, keyindex)
+        self._appendColumn(segment, u'epoch', np.full(len(records), epoch, dtype=np.int64))
+        self._appendColumn(segment, u'key', keys)
+        for name in self.metric_columns:
+            values = np.array([record[position[name]] if record[position[name]] is not None else np.nan for record in records],
+                              dtype=np.float64)
+            self._appendColumn(segment, name, values)
+
+    def getProfileDir(self, profilename):
+        return os.path.join(self.cachedir, re.sub(r'[^A-Za-z0-9_.-]', u'_', profilename))
+
+    def getSegmentDir(self, profilename, day):
+        return os.path.join(self.getProfileDir(profilename), day)
+
+    def getDay(self, epoch):
+        return (datetime(1970, 1, 1) + timedelta(seconds=int(epoch))).strftime(u'%Y%m%d')
+
+    # days with a segment for the profile, oldest first
+    def getDays(self, profilename):
+        profiledir = self.getProfileDir(profilename)
+        if not os.path.isdir(profiledir):
+            return []
+        return sorted([day for day in os.listdir(profiledir) if re.match(r'^\d{8}$', day)])
+
+    # memory-mapped columns of one segment, trimmed to the rows complete in all of them
+    def getColumns(self, segment, names):
+        names = [name for name in self.index_columns if name not in names] + list(names)
+        rows = min([self._getRows(segment, name) for name in names])
+        columns = {}
+        for name in names:
+            if rows == 0:
+                columns[name] = np.empty(0, dtype=self._getType(name))
+            else:
+                columns[name] = np.memmap(self._getColumnFile(segment, name), dtype=self._getType(name), mode='r', shape=(rows,))
+        return columns
+
+    # key dictionary of one segment: list of key attribute tuples, indexed by the key column
+    def getKeys(self, segment):
+        try:
+            with open(os.path.join(segment, u'keys.json'), 'r') as keyfile:
+                return [tuple(key) for key in json.load(keyfile)]
+        except FileNotFoundError:
+            return []
+
+    def _getKeyIndex(self, segment):
+        if segment not in self.keys:
+            # only the current segment is held in memory
+            self._repair(segment)
+            self.keys = {segment: dict([(key, i) for i, key in enumerate(self.getKeys(segment))])}
+        return self.keys[segment]
+
+    # an append interrupted part way (eg by a restart) leaves columns of different lengths:
+    # trim every column to the rows complete in all of them before appending again
+    def _repair(self, segment):
+        names = self.index_columns + self.metric_columns
+        rows = min([self._getRows(segment, name) for name in names])
+        for name in names:
+            columnfile = self._getColumnFile(segment, name)
+            if os.path.exists(columnfile) and os.path.getsize(columnfile) != rows * np.dtype(self._getType(name)).itemsize:
+                os.truncate(columnfile, rows * np.dtype(self._getType(name)).itemsize)
+
+    # the dictionary is replaced atomically and always before the rows referencing new keys are appended
+    def _putKeys(self, segment, keyindex):
+        keyfile = os.path.join(segment, u'keys.json')
+        with open(keyfile + u'.tmp', 'w') as tmpfile:
+            json.dump([list(key) for key in sorted(keyindex, key=keyindex.get)], tmpfile)
+        os.replace(keyfile + u'.tmp', keyfile)
+
+    def _appendColumn(self, segment, name, values):
+        with open(self._getColumnFile(segment, name), 'ab') as columnfile:
+            columnfile.write(values.astype(self._getType(name)).tobytes())
+
+    def _getRows(self, segment, name):
+        try:
+            return os.path.getsize(self._getColumnFile(segment, name)) // np.dtype(self._getType(name)).itemsize
+        except FileNotFoundError:
+            return 0
+
+    def _getColumnFile(self, segment, name):
+        return os.path.join(segment, name + (u'.i8' if name in self.index_columns else u'.f8'))
+
+    def _getType(self, name):
+        return np.int64 if name in self.index_columns else np.float64
+
+
+# segment store of this process for the cache directory in PG_STAT_PROFILER_ANALYTICS_CACHE, None when not configured
+def getSegmentStore():
+    cachedir = os.getenv(u'PG_STAT_PROFILER_ANALYTICS_CACHE')
+    if not cachedir:
+        return None
+    try:
+        return segmentstore(os.path.expandvars(cachedir))
+    except Exception as e:
+        logging.warning('pg-stat-profiler : analytics cache unavailable : [{}]'.format(str(e)))
+        return None
@@ -1,12 +1,20 @@
 import uuid
 import base64
 import os
+import hmac
+import hashlib
 from cryptography.fernet import Fernet
 
+# api keys, persisted encrypted in the keystore file. requests are verified in memory against salted hashes of
+# the keys, compared in constant time; the hashes are rebuilt only when resetKeys runs or the keystore file changes
+#
 class api_keystore:
 
     def __init__(self,secret,keyfilename):
         self.apikeys = []
+        # (salt, hashes of the keys): replaced as one, so a concurrent check never mixes two generations
+        self.keyhashes = (b'', [])
+        self.filesignature = None
         self.keyfilename = keyfilename
         secret_bytes = secret.encode(u'utf-8')
         fernetkey = base64.urlsafe_b64encode(secret_bytes.ljust(32)[:32])
@@ -17,6 +25,8 @@ class api_keystore:
     def checkKeyfile(self):
        status = False
        self.apikeys = []
+       keys = []
+       signature = self._getFileSignature()
        cf = open(self.keyfilename,'r')
        cflines = cf.readlines()
        for cfline in cflines:
@@ -27,11 +37,14 @@ class api_keystore:
           if result:
              thiskey = self.fernet.encrypt(result.encode(u'utf-8'))
              self.apikeys.append(thiskey)
+             keys.append(result)
              status = True
           else:
              status = False
              break
        cf.close()
+       # an unreadable keystore verifies no keys (until the file changes again)
+       self._setKeyHashes(keys if status else [], signature)
        return status
 
 
@@ -44,27 +57,44 @@ class api_keystore:
     
     def resetKeys(self):
          self.apikeys = []
+         keys = []
          keyfile = open(self.keyfilename,'w')
          for i in range(0, 5):
            apikey = '{}{}'.format(uuid.uuid4().hex,uuid.uuid4().hex)
            thiskey = self.fernet.encrypt(apikey.encode('utf-8'))
            self.apikeys.append(thiskey)
+           keys.append(apikey)
            keyfile.write(thiskey.decode('utf-8') + '\n')
          keyfile.close()
+         self._setKeyHashes(keys, self._getFileSignature())
 
+    # every stored hash is compared, so the time taken does not depend on which key (if any) matches
     def checkKey(self,testKeyString):
-       cf = open(self.keyfilename,'r')
-       cflines = cf.readlines()
-       for cfline in cflines:
-          result = self.fernet.decrypt(cfline.encode(u"utf-8")).decode("utf-8") 
-          if result == testKeyString:
-             cf.close()
-             return True
-       cf.close()
-       return False
-    
+       if self._getFileSignature() != self.filesignature:
+          self.checkKeyfile()
+       salt, keyhashes = self.keyhashes
+       testhash = self._getKeyHash(salt,testKeyString)
+       matched = False
+       for keyhash in keyhashes:
+          matched = hmac.compare_digest(keyhash,testhash) | matched
+       return matched
+
+    # keys are random 256 bit values: one salted sha256 per key is enough, and keeps verification cheap
+    def _setKeyHashes(self,keys,signature):
+       salt = os.urandom(16)
+       self.keyhashes = (salt, [self._getKeyHash(salt,key) for key in keys])
+       self.filesignature = signature
+
+    def _getKeyHash(self,salt,key):
+       return hashlib.sha256(salt + key.encode(u'utf-8')).digest()
+
+    # changes whenever the keystore file is rewritten (None if there is no file)
+    def _getFileSignature(self):
+       try:
+          stat = os.stat(self.keyfilename)
+          return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+       except OSError:
+          return None
+
     def __str__(self):
         return str(self.__dict__)
- 
-            
-           
\ No newline at end of file
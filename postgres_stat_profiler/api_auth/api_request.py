@@ -19,6 +19,9 @@ class api_request:
   def _getRequestkey(self):
     try:
       key = self.request.authorization
+      # 'Authorization: Bearer <apikey>' (eg from metrics scrapers) as well as 'Authorization: <apikey>'
+      if key and getattr(key, 'type', None) == 'bearer' and key.token:
+         return key.token
       if key:
          return key
       return None
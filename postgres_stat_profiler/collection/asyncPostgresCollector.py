@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import psycopg
+from postgres_stat_profiler.collection.connectionpool import getAsyncConnectionPool
+from postgres_stat_profiler.collection.postgresCollector import postgrescollector
+from postgres_stat_profiler.collection.collectioncycle import collectioncycle
+
+# postgres collector for collection mode 'asyncio': same collection as postgrescollector, but using
+# psycopg async connections so that many profiles can be multiplexed on one event loop
+#
+class asyncpostgrescollector(postgrescollector):
+
+    def __init__(self, profile):
+        # status is probed asynchronously by checkStatusAsync, never from the constructor
+        super().__init__(profile, checkstatus=False)
+
+    async def checkStatusAsync(self):
+        await self.monitordb.checkStatusAsync()
+        await self.reportdb.checkStatusAsync()
+
+    # the same steps as postgrescollector.collect (see collectioncycle), on async connections. the cpu-bound steps
+    # (snapshot, top-N selection, query text encryption, incremental records) and partition maintenance and rollups,
+    # when due, run in a worker thread so they do not hold up the other profiles on the event loop. a collector's
+    # steps still run one at a time: its state is never used by two threads at once
+    async def collectAsync(self, interval=60):
+            try:
+               cycle = collectioncycle(self, interval)
+               pool = getAsyncConnectionPool()
+
+               async with pool.connection(self.monitordb.getConnstring()) as mconn:
+                  cycle.mark(u'connect')
+                  cur = await mconn.execute(cycle.getCollectQuery(), prepare=True)
+                  collectrecords = await cur.fetchall()
+               cycle.mark(u'fetch')
+               await asyncio.to_thread(cycle.setCollectRecords,collectrecords)
+
+               if self.partitions.isDue(cycle.getEpoch()):
+                  await asyncio.to_thread(self.partitions.maintain,self.profilename,cycle.getEpoch())
+               cycle.mark(u'partitions')
+
+               async with pool.connection(self.reportdb.getConnstring()) as rconn:
+                  cycle.mark(u'connect')
+                  knownquery = cycle.getKnownQueryTextsQuery()
+                  if knownquery is not None:
+                      cur = await rconn.execute(*knownquery)
+                      cycle.setKnownQueryTexts(await cur.fetchall())
+                  await self._executeStatementsAsync(rconn,await asyncio.to_thread(cycle.getQueryTextStatements))
+                  cycle.mark(u'querytext')
+                  await rconn.commit()
+                  cycle.mark(u'commit')
+                  cycle.setQueryTextsCommitted()
+
+                  await self._copyRecordsAsync(rconn,*cycle.getCumulativeCopy())
+                  await self._executeStatementsAsync(rconn,cycle.getEpochStatements())
+                  cycle.mark(u'cumulative_copy')
+                  await rconn.commit()
+                  cycle.mark(u'commit')
+
+                  incrementalquery = cycle.getIncrementalQuery()
+                  if incrementalquery is not None:
+                      cur = await rconn.execute(*incrementalquery)
+                      cycle.setIncrementalRecords(await cur.fetchall())
+                  else:
+                      await asyncio.to_thread(cycle.setIncrementalRecords)
+                  await self._copyRecordsAsync(rconn,*cycle.getIncrementalCopy())
+                  cycle.mark(u'incremental_copy')
+                  await rconn.commit()
+                  cycle.mark(u'commit')
+                  cycle.setCompleted()
+
+               cycle.appendAnalytics()
+
+               if self.rollups.isDue(cycle.getEpoch()):
+                  await asyncio.to_thread(self.rollups.run,self.profilename,cycle.getEpoch(),self.partitions.isDeleteExpired())
+               cycle.mark(u'rollups')
+               cycle.setFinished()
+               return True
+
+            except Exception as e:
+               logging.warning('pg-stat-profiler: collection : postgres async collect error [{}]'.format(str(e)))
+               self.lasterror = str(e)
+               return False
+
+    async def _executeStatementsAsync(self,rconn,statements):
+        if len(statements) == 0:
+            return
+        async with rconn.cursor() as cur:
+            for query, parameters, many in statements:
+                if many:
+                    await cur.executemany(query,parameters)
+                else:
+                    await cur.execute(query,parameters)
+
+    async def _copyRecordsAsync(self,rconn,copyquery,textcopyquery,copytypes,records):
+        if len(records) == 0:
+            return
+        try:
+            async with rconn.cursor() as cur:
+                async with cur.copy(copyquery) as copy:
+                    copy.set_types(copytypes)
+                    for record in records:
+                        await copy.write_row(record)
+        except (psycopg.DataError, psycopg.NotSupportedError, TypeError) as e:
+            logging.warning('pg-stat-profiler: collection : binary copy failed, retrying in text format [{}]'.format(str(e)))
+            await rconn.rollback()
+            async with rconn.cursor() as cur:
+                async with cur.copy(textcopyquery) as copy:
+                    for record in records:
+                        await copy.write_row(record)
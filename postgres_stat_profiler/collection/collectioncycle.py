@@ -0,0 +1,115 @@
+from postgres_stat_profiler.collection.phasetimer import phasetimer
+from postgres_stat_profiler.collection.statementsnapshot import statementsnapshot
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.models.querytext_statstatements import querytext_statstatements
+from postgres_stat_profiler.models.snapshot_epochs import snapshot_epochs
+
+# one collection cycle of a postgrescollector, without database access: the queries and records of each step,
+# and the collector state each step's results update. the synchronous and asyncio collectors run the same
+# steps in the same order, and differ only in how they execute the queries and copies on their connections.
+# statements are (query, parameters, many): many runs the query once for each parameters entry
+#
+class collectioncycle:
+
+    def __init__(self, dbcollector, interval):
+        self.dbcollector = dbcollector
+        self.interval = interval
+        self.timer = phasetimer()
+        self.rtime_minute, self.rtime_epoch = dbcollector._getCollectTime(interval)
+        self.queryfernet = dbcollector._getQueryFernet()
+        self.cumulativess = cumulative_statstatements()
+        self.querytextss = querytext_statstatements()
+        self.incrementalss = incremental_statstatements()
+        self.collectrecords = []
+        self.incrementalrecords = []
+        self.querytext_seen = {}
+
+    def mark(self, phase):
+        self.timer.mark(phase)
+
+    def getEpoch(self):
+        return self.rtime_epoch
+
+    # monitored database: read every pg_stat_statements entry (server-side prepared)
+    def getCollectQuery(self):
+        return self.cumulativess.getCollectQuery()
+
+    def setCollectRecords(self, collectrecords):
+        self.collectrecords = collectrecords
+        self.cumulativerecords = self.dbcollector._getCumulativeRecords(self.cumulativess,self.rtime_minute,self.rtime_epoch,collectrecords)
+        self.latest = statementsnapshot(self.cumulativess.getColumns(),self.rtime_epoch,self.cumulativerecords)
+        self.persistrecords, self.selectedpositions = self.dbcollector._getPersistRecords(self.latest)
+        self.mark(u'transform')
+
+    # report database, first cycle only: the query text keys already stored, (query, parameters). None when known
+    def getKnownQueryTextsQuery(self):
+        if self.dbcollector.querytexts is not None:
+            return None
+        return self.querytextss.getKnownKeysQuery(), [self.dbcollector.profilename]
+
+    def setKnownQueryTexts(self, knownkeys):
+        self.dbcollector.querytexts = self.dbcollector._getKnownQueryTexts(knownkeys)
+
+    # query texts are written once per (dbid, queryid), and again only if the text changes.
+    # committed ahead of the snapshot copy, which may roll back to retry in text format
+    def getQueryTextStatements(self):
+        upserts, touches, self.querytext_seen = \
+            self.dbcollector._getQueryTextRecords(self.querytextss,self.cumulativess,self.rtime_minute,self.rtime_epoch,
+                                                  self.queryfernet,self.collectrecords,self.cumulativerecords)
+        statements = []
+        if len(upserts) > 0:
+            statements.append((self.querytextss.getUpsertQuery(), upserts, True))
+        if len(touches) > 0:
+            statements.append((self.querytextss.getTouchQuery(), self.dbcollector._getTouchParameters(self.rtime_minute,touches), False))
+        return statements
+
+    def setQueryTextsCommitted(self):
+        self.dbcollector.querytexts.update(self.querytext_seen)
+
+    # (binary copy query, text copy query, column types, records) of the cumulative records persisted this cycle
+    def getCumulativeCopy(self):
+        return self.cumulativess.getCopyQuery(), self.cumulativess.getTextCopyQuery(), self.cumulativess.getCopyTypes(), \
+               self.persistrecords
+
+    def getEpochStatements(self):
+        if len(self.persistrecords) == 0:
+            return []
+        return [(snapshot_epochs().getUpdateQuery(), [self.dbcollector.profilename,self.rtime_epoch], False)]
+
+    # incremental data (activity since the previous snapshot) is computed from the previous snapshot held in memory.
+    # the report database is only read on the first cycle after start: (query, parameters), None if not needed
+    def getIncrementalQuery(self):
+        if self.dbcollector.snapshot is not None:
+            return None
+        return self.incrementalss.getCollectQuery(), [self.dbcollector.profilename,self.interval]
+
+    # incrementalrows: the rows read by getIncrementalQuery, if it was needed
+    def setIncrementalRecords(self, incrementalrows=None):
+        if incrementalrows is None:
+            self.incrementalrecords = self.dbcollector._getIncrementalRecords(self.latest,self.selectedpositions)
+        else:
+            self.incrementalrecords = [self.incrementalss.getInsertRecord(incrementalrow) for incrementalrow in incrementalrows]
+        self.mark(u'incremental')
+
+    def getIncrementalCopy(self):
+        return self.incrementalss.getCopyQuery(), self.incrementalss.getTextCopyQuery(), self.incrementalss.getCopyTypes(), \
+               self.incrementalrecords
+
+    # every write is committed: this snapshot becomes the previous one
+    def setCompleted(self):
+        dbcollector = self.dbcollector
+        dbcollector.snapshot = self.latest
+        dbcollector.lastactivity = dbcollector._getActivity(self.incrementalss,self.incrementalrecords)
+        dbcollector.lastcollectepoch = self.rtime_epoch
+        dbcollector.lastrowcounts = (len(self.collectrecords), len(self.persistrecords) + len(self.incrementalrecords))
+
+    # after the report database connection is released
+    def appendAnalytics(self):
+        self.dbcollector._appendAnalytics(self.incrementalss,self.rtime_epoch,self.incrementalrecords)
+        self.mark(u'analytics')
+
+    # after the rollups, which end the cycle
+    def setFinished(self):
+        self.dbcollector.lastphasetimes = self.timer.getTimes()
+        self.dbcollector.lasterror = None
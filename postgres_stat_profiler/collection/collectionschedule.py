@@ -0,0 +1,72 @@
+import time
+import logging
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+
+# collection schedule for one profile: cycles are aligned to wall-clock interval boundaries so that
+# every collection epoch is a multiple of the interval.
+# with adaptiveinterval enabled the interval is shortened (one step of the valid interval ladder) when the
+# rate of calls spikes above its recent average, and lengthened when the monitored database is idle.
+# after a spike the interval drifts back to the configured interval once activity has settled
+#
+class collectionschedule:
+
+    spike_factor = 2.0
+    idle_cycles = 3
+    settle_cycles = 5
+    ewma_weight = 0.2
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.interval = settings.getInterval()
+        self.ladder = [i for i in collectionsettings.valid_intervals
+                       if settings.getMinInterval() <= i <= settings.getMaxInterval()]
+        if self.interval not in self.ladder:
+            self.ladder = sorted(self.ladder + [self.interval])
+        self.callrate = None
+        self.idlecount = 0
+        self.settlecount = 0
+
+    def getInterval(self):
+        return self.interval
+
+    # seconds until the next interval boundary (plus a small margin so the wake-up is never early)
+    def getNextDelay(self):
+        return self.interval - (time.time() % self.interval) + 0.01
+
+    # seconds since the interval boundary the collection starting now is for
+    def getDrift(self):
+        return time.time() % self.interval
+
+    # feed the activity observed by the last collection: number of incremental rows and total calls
+    def update(self, deltarows, deltacalls):
+        if self.settings.getAdaptiveInterval() != u'enabled':
+            return self.interval
+        rate = deltacalls / float(self.interval)
+        if deltarows == 0:
+            self.idlecount = self.idlecount + 1
+            self.settlecount = 0
+            if self.idlecount >= self.idle_cycles:
+                self.idlecount = 0
+                self._step(1)
+        elif self.callrate is not None and self.callrate > 0 and rate > self.spike_factor * self.callrate:
+            self.idlecount = 0
+            self.settlecount = 0
+            self._step(-1)
+        else:
+            self.idlecount = 0
+            self.settlecount = self.settlecount + 1
+            if self.settlecount >= self.settle_cycles and self.interval != self.settings.getInterval():
+                self.settlecount = 0
+                self._step(1 if self.interval < self.settings.getInterval() else -1)
+        if deltarows > 0:
+            if self.callrate is None:
+                self.callrate = rate
+            else:
+                self.callrate = (1 - self.ewma_weight) * self.callrate + self.ewma_weight * rate
+        return self.interval
+
+    def _step(self, direction):
+        position = self.ladder.index(self.interval) + direction
+        if 0 <= position < len(self.ladder) and self.ladder[position] != self.interval:
+            logging.warning('pg-stat-profiler : collection interval adapted from [{}s] to [{}s]'.format(self.interval,self.ladder[position]))
+            self.interval = self.ladder[position]
@@ -1,14 +1,26 @@
 import time
+import asyncio
 import logging
 from postgres_stat_profiler.collection.postgresCollector import postgrescollector
+from postgres_stat_profiler.collection.asyncPostgresCollector import asyncpostgrescollector
+from postgres_stat_profiler.collection.collectionschedule import collectionschedule
+from postgres_stat_profiler.metrics.metricsblock import getMetricsBlock
+from postgres_stat_profiler.collection.statusboard import getStatusBoard
+from postgres_stat_profiler.helpers.log_helper import attachQueueHandler, setLogProfile
 
 class collector:
 
-    def __init__(self, name, profile):
+    # metricsname: the shared metrics block (see metrics/metricsblock.py), None when metrics are not collected
+    # statusname: the shared status board (see collection/statusboard.py), None to report status via profilesqueue (if any)
+    def __init__(self, name, profile, metricsname=None, statusname=None):
         self.profilename = name
         self.profile = profile
+        self.metricsname = metricsname
+        self.statusname = statusname
+        self.lastcollecttime = None
         self.type = self.profile.getMonitoredDBconnection().getType()
         self.status = u'new'
+        self.schedule = collectionschedule(self.profile.getCollectionSettings())
         self._checkValid()
 
     def _checkValid(self):
@@ -22,36 +34,115 @@ class collector:
 
     def run(self, profilesqueue, loggingqueue):
        try: 
-        h = logging.handlers.QueueHandler(loggingqueue) 
-        logger = logging.getLogger()
-        logger.addHandler(h)
-        logging.warn('pg_stat_profiler: profile data collector [{}] initialising'.format(self.profilename))
+        attachQueueHandler(loggingqueue)
+        setLogProfile(self.profilename)
+        logging.warning('pg_stat_profiler: profile data collector [{}] initialising'.format(self.profilename))
         self.status = u'initialising'
-        sleep_interval = 60.0
-        starttime = time.monotonic()
+        dbcollector = None
         while self.valid:
         
            if self.type != 'postgresql':
               logging.warning('pg-stat-profiler :  collector-run error : profile [{}] unsupported monitordb type [{}]'.format(self.profilename, self.type))
            else:
-              dbcollector = postgrescollector(self.profile)
-           # report status to parent processes to allow api read of status      
+              # the collector is kept between cycles as it holds the previous snapshot used for incremental data
+              if dbcollector is None:
+                 dbcollector = postgrescollector(self.profile)
+              else:
+                 dbcollector.checkStatus()
               reportdbstatus = dbcollector.getReportDBstatus()
               monitordbstatus = dbcollector.getMonitoredDBstatus()
-           # pass result back via queue to grandparent main process - which updates the (persistent, encrypted) profilesfile
-              result = {"name": self.profilename, "reportdbstatus": reportdbstatus, "monitordbstatus": monitordbstatus }
-              profilesqueue.put(result)
+              interval, drift = self.schedule.getInterval(), self.schedule.getDrift()
               if monitordbstatus == u'operational' and reportdbstatus == u'initialised':
                 if self.status != u'started':
-                   logging.warn('pg_stat_profiler: profile data collector [{}] has detected valid databases'.format(self.profilename))
-                   logging.warn('pg_stat_profiler: profile data collector [{}] collection active'.format(self.profilename))
+                   logging.warning('pg_stat_profiler: profile data collector [{}] has detected valid databases'.format(self.profilename))
+                   logging.warning('pg_stat_profiler: profile data collector [{}] collection active'.format(self.profilename))
                    self.status = u'started'
-                dbcollector.collect()
-           time.sleep(sleep_interval - ((time.monotonic() - starttime) % sleep_interval))
+                success = dbcollector.collect(interval)
+                self.schedule.update(*dbcollector.getLastActivity())
+              else:
+                success = False
+              self._recordMetrics(dbcollector,success,interval,drift)
+              self._reportStatus(dbcollector,success,profilesqueue)
+           time.sleep(self.schedule.getNextDelay())
            self._checkValid()
            
        except Exception as e:
         logging.warning('pg-stat-profiler : unexpected collector-run error : [{}]'.format(str(e)))
-     
 
-   
\ No newline at end of file
+    # collection mode 'asyncio': the same collection cycle as run(), as a task on a shared event loop
+    # each profile keeps its own schedule; errors are contained within this profile's task
+    async def runAsync(self, profilesqueue):
+       try: 
+        # runs as its own task, so the log profile set here is this collector's only
+        setLogProfile(self.profilename)
+        logging.warning('pg_stat_profiler: profile data collector [{}] initialising (asyncio)'.format(self.profilename))
+        self.status = u'initialising'
+        dbcollector = None
+        while self.valid:
+
+           if self.type != 'postgresql':
+              logging.warning('pg-stat-profiler :  collector-run error : profile [{}] unsupported monitordb type [{}]'.format(self.profilename, self.type))
+           else:
+              if dbcollector is None:
+                 dbcollector = asyncpostgrescollector(self.profile)
+              await dbcollector.checkStatusAsync()
+              reportdbstatus = dbcollector.getReportDBstatus()
+              monitordbstatus = dbcollector.getMonitoredDBstatus()
+              interval, drift = self.schedule.getInterval(), self.schedule.getDrift()
+              if monitordbstatus == u'operational' and reportdbstatus == u'initialised':
+                if self.status != u'started':
+                   logging.warning('pg_stat_profiler: profile data collector [{}] has detected valid databases'.format(self.profilename))
+                   logging.warning('pg_stat_profiler: profile data collector [{}] collection active'.format(self.profilename))
+                   self.status = u'started'
+                success = await dbcollector.collectAsync(interval)
+                self.schedule.update(*dbcollector.getLastActivity())
+              else:
+                success = False
+              self._recordMetrics(dbcollector,success,interval,drift)
+              self._reportStatus(dbcollector,success,profilesqueue)
+           await asyncio.sleep(self.schedule.getNextDelay())
+           self._checkValid()
+
+       except asyncio.CancelledError:
+        logging.warning('pg_stat_profiler: profile data collector [{}] stopped'.format(self.profilename))
+        raise
+       except Exception as e:
+        logging.warning('pg-stat-profiler : unexpected collector-run error : [{}]'.format(str(e)))
+
+    # report status after each cycle to allow api read of status: written to the shared status board, or (no board)
+    # passed via profilesqueue to the process holding it in memory. the collector daemon passes no queue
+    def _reportStatus(self, dbcollector, success, profilesqueue):
+       try:
+        reportdbstatus = dbcollector.getReportDBstatus()
+        monitordbstatus = dbcollector.getMonitoredDBstatus()
+        if success:
+           self.lastcollecttime = time.time()
+        if monitordbstatus == u'operational' and reportdbstatus == u'initialised':
+           lasterror = dbcollector.getLastError()
+        else:
+           lasterror = u'databases unavailable : monitordb [{}] reportdb [{}]'.format(monitordbstatus,reportdbstatus)
+        board = getStatusBoard(self.statusname)
+        slot = board.getSlot(self.profilename) if board is not None else None
+        if slot is not None:
+           board.setStatus(slot,reportdbstatus,monitordbstatus,dbcollector.getLastCollectEpoch(),self.lastcollecttime,lasterror)
+        elif profilesqueue is not None:
+           profilesqueue.put({"name": self.profilename, "reportdbstatus": reportdbstatus, "monitordbstatus": monitordbstatus,
+                              "lastcollectepoch": dbcollector.getLastCollectEpoch(), "lastcollecttime": self.lastcollecttime,
+                              "lasterror": lasterror})
+       except Exception as e:
+        logging.warning('pg-stat-profiler : collector status error : profile [{}] [{}]'.format(self.profilename,str(e)))
+
+    # a cycle with unavailable databases counts as a failed collection
+    def _recordMetrics(self, dbcollector, success, interval, drift):
+       try:
+        metrics = getMetricsBlock(self.metricsname)
+        if metrics is None:
+           return
+        slot = metrics.getSlot(self.profilename)
+        if slot is None:
+           return
+        rowscollected, rowspersisted = dbcollector.getLastRowCounts()
+        metrics.recordCollection(slot,success,interval,drift,dbcollector.getLastPhaseTimes() if success else {},
+                                 rowscollected,rowspersisted,dbcollector.getLastCollectEpoch() or 0,time.time())
+       except Exception as e:
+        logging.warning('pg-stat-profiler : collector metrics error : profile [{}] [{}]'.format(self.profilename,str(e)))
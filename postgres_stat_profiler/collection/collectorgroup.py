@@ -0,0 +1,69 @@
+import queue
+import asyncio
+import logging
+from postgres_stat_profiler.collection.collector import collector
+from postgres_stat_profiler.helpers.log_helper import attachQueueHandler
+
+# collection mode 'asyncio': one process runs the collectors of many profiles concurrently on an event loop
+# the supervisor assigns profiles to a group and sends ('start', name, profile) or ('stop', name, None)
+# messages over the group's control queue. a profile whose task fails is restarted on its own,
+# without affecting the other profiles in the group
+#
+class collectorgroup:
+
+    def __init__(self, groupid, metricsname=None, statusname=None):
+        self.groupid = groupid
+        self.metricsname = metricsname
+        self.statusname = statusname
+        self.profiles = {}
+        self.tasks = {}
+
+    def run(self, controlqueue, profilesqueue, loggingqueue):
+        try:
+         attachQueueHandler(loggingqueue)
+         logging.warning('pg_stat_profiler: collector group [{}] started'.format(self.groupid))
+         asyncio.run(self._run(controlqueue, profilesqueue))
+        except Exception as e:
+         logging.warning('pg-stat-profiler : collector group [{}] unexpected error : [{}]'.format(self.groupid,str(e)))
+
+    async def _run(self, controlqueue, profilesqueue):
+        while True:
+            # wait for control messages in a worker thread so the event loop keeps running collections
+            messages = await asyncio.to_thread(self._getControlMessages, controlqueue, 5.0)
+            for action, pname, profile in messages:
+                if action == u'start':
+                    self._stopProfile(pname)
+                    self.profiles[pname] = profile
+                    self._startProfile(pname, profilesqueue)
+                elif action == u'stop':
+                    self._stopProfile(pname)
+                    if pname in self.profiles:
+                        del self.profiles[pname]
+            # restart any profile task which has ended unexpectedly
+            for pname in list(self.tasks.keys()):
+                if self.tasks[pname].done():
+                    logging.warning('pg-stat-profiler : collector group [{}] restarting profile collection : [{}]'.format(self.groupid,pname))
+                    del self.tasks[pname]
+                    self._startProfile(pname, profilesqueue)
+
+    def _startProfile(self, pname, profilesqueue):
+        thiscollector = collector(pname, self.profiles[pname], self.metricsname, self.statusname)
+        if thiscollector.getValid():
+            self.tasks[pname] = asyncio.create_task(thiscollector.runAsync(profilesqueue), name=pname)
+        else:
+            logging.warning('pg-stat-profiler : collector group [{}] profile [{}] is not collectable'.format(self.groupid,pname))
+
+    def _stopProfile(self, pname):
+        if pname in self.tasks:
+            self.tasks[pname].cancel()
+            del self.tasks[pname]
+
+    def _getControlMessages(self, controlqueue, timeout):
+        messages = []
+        try:
+            messages.append(controlqueue.get(timeout=timeout))
+            while True:
+                messages.append(controlqueue.get_nowait())
+        except queue.Empty:
+            pass
+        return messages
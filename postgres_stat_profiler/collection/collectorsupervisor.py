@@ -1,34 +1,98 @@
+import os
+import sys
+import signal
+import hashlib
 import logging
-import logging.handlers
 import time
+import zlib
 import multiprocessing
 from postgres_stat_profiler.config.profilestore import profilestore
 from postgres_stat_profiler.collection.collector import collector
+from postgres_stat_profiler.collection.collectorgroup import collectorgroup
+from postgres_stat_profiler.collection.controlchannel import controlchannel
+from postgres_stat_profiler.metrics.metricsblock import getMetricsBlock
+from postgres_stat_profiler.collection.statusboard import getStatusBoard
+from postgres_stat_profiler.helpers.log_helper import attachQueueHandler
 
 class collectorsupervisor():
 
-    def __init__(self,api_secret,profilesfile):
+    # controlname: the control channel socket the api workers notify profile changes on, None to apply them periodically
+    def __init__(self,api_secret,profilesfile,collectionmode=u'process',collectionworkers=1,metricsname=None,statusname=None,controlname=None):
         self.profilesfile = profilesfile
         self.api_secret = api_secret
         self.profilestore = profilestore(self.api_secret,self.profilesfile) 
+        self.controlname = controlname
+        self.controlchannel = None
+        self.runpid = None
         self.collectorjobs = {}
+        # configuration (hash) each running collector was started with: a changed configuration restarts it
+        self.collectorconfigs = {}
+        # collection mode 'asyncio' only: group processes, their control queues and the group of each profile
+        self.collectionmode = collectionmode
+        self.collectionworkers = max(1,int(collectionworkers))
+        self.groupjobs = {}
+        self.groupqueues = {}
+        self.groupprofiles = {}
+        # shared metrics block: the supervisor claims a slot for each collecting profile
+        self.metricsname = metricsname
+        # shared status board: a slot for each enabled profile, kept while disabled so the last status stays readable
+        self.statusname = statusname
         
        
     def getProfilestore(self):
         return self.profilestore
 
+    # profilesqueue: passed to the collectors, None when they report status only to the status board
     def run(self, profilesqueue, loggingqueue):
         try:
-         h = logging.handlers.QueueHandler(loggingqueue) 
-         logger = logging.getLogger()
-         logger.addHandler(h)
-         logging.warn('pg_stat_profiler: profilesupervisor started')
+         attachQueueHandler(loggingqueue)
+         logging.warning('pg_stat_profiler: profilesupervisor started (collection mode [{}])'.format(self.collectionmode))
+         # stopped by the daemon: the collectors are stopped first, they would otherwise outlive the supervisor
+         self.runpid = os.getpid()
+         signal.signal(signal.SIGTERM, self._stop)
+         if self.controlname is not None:
+            self.controlchannel = controlchannel(self.controlname)
+            self.controlchannel.listen()
+         self.profilestore.refresh()
 
          while True:
-            # refresh profiles from file (persistent store) each cycle
-            # 
-            self.profilestore = profilestore(self.api_secret,self.profilesfile)
-            # 
+            self._releaseDeletedStatus()
+            if self.collectionmode == u'asyncio':
+                self._superviseGroups(profilesqueue, loggingqueue)
+            else:
+                self._superviseProcesses(profilesqueue, loggingqueue)
+            # act on api changes as they are notified; otherwise check every 10s for crashed collectors, and for
+            # profiles file changes made outside the api
+            self._applyChanges(10)
+        except Exception as e:
+            logging.warning('pg-stat-profiler : profilesupervisor unexpected error : [{}]'.format(str(e)))
+
+    # collector processes inherit this handler: they just exit
+    def _stop(self, signum, frame):
+        if os.getpid() == self.runpid:
+            jobs = list(self.collectorjobs.values()) + list(self.groupjobs.values())
+            for job in jobs:
+                job.terminate()
+            for job in jobs:
+                job.join(5)
+        sys.exit()
+
+    # wait for a notified change (at most timeout seconds), then read the records appended to the profiles file
+    def _applyChanges(self, timeout):
+        if self.controlchannel is not None:
+            self.controlchannel.wait(timeout)
+        else:
+            time.sleep(timeout)
+        self.profilestore.refresh()
+
+    def _getConfig(self, profile):
+        return hashlib.sha1(profile.getCollectionDetails().encode(u'utf-8')).hexdigest()
+
+    def _isChanged(self, pname, profile):
+        return pname in self.collectorconfigs and self.collectorconfigs[pname] != self._getConfig(profile)
+
+    # collection mode 'process': one collector process per enabled profile
+    def _superviseProcesses(self, profilesqueue, loggingqueue):
             # check jobs against the profile status set by api, and also if jobs have crashed
             # use list() to avoid runtime error when deleting a object property during iteration
             for pname,profile in list(self.profilestore.getProfiles().items()):
@@ -37,17 +101,26 @@ class collectorsupervisor():
                 if pname in self.collectorjobs and profile.getStatus() == 'disabled':
                     logging.warning('pg-stat-profiler : Disabling profile collection : [{}]'.format(pname))
                     self.collectorjobs[pname].terminate()
-                    self.collectorjobs[pname].terminate()
-                    self.collectorjobs[jname].join()
+                    self.collectorjobs[pname].join()
                     del self.collectorjobs[pname]
+                    self._releaseMetrics(pname)
                     logging.warning('pg-stat-profiler : Disable profile execution success : [{}]'.format(pname))
+                # stop existing collector process if its configuration changed via api (restarted below)
+                if pname in self.collectorjobs and self._isChanged(pname, profile):
+                    logging.warning('pg-stat-profiler : Restarting profile collection, configuration changed : [{}]'.format(pname))
+                    self.collectorjobs[pname].terminate()
+                    self.collectorjobs[pname].join()
+                    del self.collectorjobs[pname]
                 # start collector process if crashed, new or newly-enabled via api
                 if pname not in self.collectorjobs and profile.getStatus() == 'enabled':
                     logging.warning('pg-stat-profiler : Enabling profile collection : [{}]'.format(pname))
-                    thiscollector = collector(pname,profile)
+                    self._claimMetrics(pname)
+                    self._claimStatus(pname)
+                    thiscollector = collector(pname,profile,self.metricsname,self.statusname)
                     thisprocess = multiprocessing.Process(target=thiscollector.run,args=(profilesqueue,loggingqueue))
                     self.collectorjobs[pname] = thisprocess
                     self.collectorjobs[pname].start()
+                    self.collectorconfigs[pname] = self._getConfig(profile)
                     logging.warning('pg-stat-profiler : Enable profile collection success : [{}]'.format(pname))
             for jname in list(self.collectorjobs.keys()):
                 # stop existing collector process if deleted via api
@@ -57,10 +130,84 @@ class collectorsupervisor():
                     self.collectorjobs[jname].terminate()
                     self.collectorjobs[jname].join()
                     del self.collectorjobs[jname]
+                    self._releaseMetrics(jname)
                     logging.warning('pg-stat-profiler : Disable profile execution success : [{}]'.format(jname))
-            time.sleep(10)
+
+    # collection mode 'asyncio': enabled profiles are spread over a fixed number of collector group processes,
+    # each multiplexing its profiles on one event loop. profiles are started and stopped via the group control queue
+    def _superviseGroups(self, profilesqueue, loggingqueue):
+            # restart crashed group processes, and resend their profiles
+            for groupid in list(self.groupjobs.keys()):
+                if not self.groupjobs[groupid].is_alive():
+                    self.groupjobs[groupid].join()
+                    del self.groupjobs[groupid]
+                    logging.warning('pg-stat-profiler : collector group [{}] stopped unexpectedly, restarting'.format(groupid))
+                    for pname in [p for p in self.groupprofiles if self.groupprofiles[p] == groupid]:
+                        del self.groupprofiles[pname]
+            for pname,profile in list(self.profilestore.getProfiles().items()):
+                if pname in self.groupprofiles and profile.getStatus() == 'disabled':
+                    logging.warning('pg-stat-profiler : Disabling profile collection : [{}]'.format(pname))
+                    self.groupqueues[self.groupprofiles[pname]].put((u'stop', pname, None))
+                    del self.groupprofiles[pname]
+                    self._releaseMetrics(pname)
+                # the group restarts a profile it is sent again
+                if pname in self.groupprofiles and self._isChanged(pname, profile):
+                    logging.warning('pg-stat-profiler : Restarting profile collection, configuration changed : [{}]'.format(pname))
+                    self.groupqueues[self.groupprofiles[pname]].put((u'start', pname, profile))
+                    self.collectorconfigs[pname] = self._getConfig(profile)
+                if pname not in self.groupprofiles and profile.getStatus() == 'enabled':
+                    logging.warning('pg-stat-profiler : Enabling profile collection : [{}]'.format(pname))
+                    groupid = zlib.crc32(pname.encode(u'utf-8')) % self.collectionworkers
+                    self._claimMetrics(pname)
+                    self._claimStatus(pname)
+                    self._startGroup(groupid, profilesqueue, loggingqueue)
+                    self.groupqueues[groupid].put((u'start', pname, profile))
+                    self.groupprofiles[pname] = groupid
+                    self.collectorconfigs[pname] = self._getConfig(profile)
+            for pname in list(self.groupprofiles.keys()):
+                if pname not in self.profilestore.getProfiles():
+                    logging.warning('pg-stat-profiler : Disabling profile collection : [{}]'.format(pname))
+                    self.groupqueues[self.groupprofiles[pname]].put((u'stop', pname, None))
+                    del self.groupprofiles[pname]
+                    self._releaseMetrics(pname)
+
+    def _startGroup(self, groupid, profilesqueue, loggingqueue):
+        if groupid not in self.groupjobs:
+            self.groupqueues[groupid] = multiprocessing.Queue()
+            thisgroup = collectorgroup(groupid, self.metricsname, self.statusname)
+            self.groupjobs[groupid] = multiprocessing.Process(target=thisgroup.run,
+                                        args=(self.groupqueues[groupid],profilesqueue,loggingqueue))
+            self.groupjobs[groupid].start()
+            logging.warning('pg-stat-profiler : collector group [{}] started with processid [{}]'.format(groupid,self.groupjobs[groupid].pid))
+
+    def _claimMetrics(self, pname):
+        try:
+            metrics = getMetricsBlock(self.metricsname)
+            if metrics is not None:
+                metrics.claimSlot(pname)
         except Exception as e:
-            logging.warning('pg-stat-profiler : profilesupervisor unexpected error : [{}]'.format(str(e)))
+            logging.warning('pg-stat-profiler : metrics slot claim error : profile [{}] [{}]'.format(pname,str(e)))
 
+    def _releaseMetrics(self, pname):
+        try:
+            metrics = getMetricsBlock(self.metricsname)
+            if metrics is not None:
+                metrics.releaseSlot(pname)
+        except Exception as e:
+            logging.warning('pg-stat-profiler : metrics slot release error : profile [{}] [{}]'.format(pname,str(e)))
+
+    def _claimStatus(self, pname):
+        try:
+            board = getStatusBoard(self.statusname)
+            if board is not None:
+                board.claimSlot(pname)
+        except Exception as e:
+            logging.warning('pg-stat-profiler : status slot claim error : profile [{}] [{}]'.format(pname,str(e)))
 
-         
+    def _releaseDeletedStatus(self):
+        try:
+            board = getStatusBoard(self.statusname)
+            if board is not None:
+                board.releaseOtherSlots(self.profilestore.getProfiles())
+        except Exception as e:
+            logging.warning('pg-stat-profiler : status slot release error : [{}]'.format(str(e)))
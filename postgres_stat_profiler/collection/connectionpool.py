@@ -0,0 +1,216 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager, asynccontextmanager
+import psycopg
+from psycopg.rows import dict_row
+from psycopg.pq import TransactionStatus
+
+# small per-process pool of long-lived connections, keyed by connection string
+# collectors reuse their monitored and report database connections across cycles instead of
+# paying the tls handshake and authentication on every probe and collect.
+# connections are health checked on checkout when they have been idle and are replaced transparently.
+# the pool is shared by the threads of a process (asyncio.to_thread workers, api request threads): the idle
+# lists are only read and changed under the lock, a connection checked out is used by one thread only
+#
+class connectionpool:
+
+    def __init__(self, maxsize=2, checkinterval=30.0):
+        self.maxsize = maxsize
+        self.checkinterval = checkinterval
+        self.pid = os.getpid()
+        self.lock = threading.Lock()
+        self.idle = {}
+
+    @contextmanager
+    def connection(self, connstring):
+        # same transaction semantics as 'with psycopg.connect() as conn': commit on success, rollback on error
+        conn = self.getConnection(connstring)
+        try:
+            yield conn
+            if not conn.closed:
+                conn.commit()
+        # BaseException: also return the connection when a generator using it is closed early (GeneratorExit)
+        except BaseException:
+            if not conn.closed and not conn.broken:
+                conn.rollback()
+            self.putConnection(connstring, conn)
+            raise
+        self.putConnection(connstring, conn)
+
+    def getConnection(self, connstring):
+        self._checkProcess()
+        while True:
+            entry = self._takeIdle(connstring)
+            if entry is None:
+                break
+            conn, lastused = entry
+            if self._checkConnection(conn, lastused):
+                return conn
+            logging.warning('pg-stat-profiler : connectionpool : discarding unhealthy connection, reconnecting')
+            self._closeConnection(conn)
+        return psycopg.connect(connstring, row_factory=dict_row)
+
+    def putConnection(self, connstring, conn):
+        self._checkProcess()
+        if conn.closed or conn.broken:
+            return
+        try:
+            if conn.info.transaction_status != TransactionStatus.IDLE:
+                conn.rollback()
+        except Exception:
+            self._closeConnection(conn)
+            return
+        if not self._keepIdle(connstring, conn):
+            self._closeConnection(conn)
+
+    def closeAll(self):
+        for conn, lastused in self._takeAllIdle():
+            self._closeConnection(conn)
+
+    # the most recently used idle connection, None if there is none
+    def _takeIdle(self, connstring):
+        with self.lock:
+            idle = self.idle.get(connstring, [])
+            if len(idle) == 0:
+                return None
+            return idle.pop()
+
+    # False when maxsize connections are already idle: the caller closes conn
+    def _keepIdle(self, connstring, conn):
+        with self.lock:
+            idle = self.idle.setdefault(connstring, [])
+            if len(idle) >= self.maxsize:
+                return False
+            idle.append((conn, time.monotonic()))
+            return True
+
+    def _takeAllIdle(self):
+        with self.lock:
+            entries = [entry for idle in self.idle.values() for entry in idle]
+            self.idle = {}
+            return entries
+
+    def _checkConnection(self, conn, lastused):
+        if conn.closed or conn.broken:
+            return False
+        if time.monotonic() - lastused < self.checkinterval:
+            return True
+        try:
+            conn.execute(u'SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def _checkProcess(self):
+        # connections must never be shared across a fork: a child process starts with an empty pool
+        # (and a new lock, which another thread of the parent may have held at the fork)
+        if self.pid != os.getpid():
+            self.lock = threading.Lock()
+            self.idle = {}
+            self.pid = os.getpid()
+
+    def _closeConnection(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+_pool = None
+_poollock = threading.Lock()
+
+def getConnectionPool():
+    global _pool
+    with _poollock:
+        if _pool is None:
+            _pool = connectionpool()
+    return _pool
+
+
+# asyncio equivalent, used by collectors multiplexed on one event loop (collection mode 'asyncio')
+# one instance per process/event loop. many profiles usually share one report database, so concurrent
+# checkouts per connection string are bounded by maxsize and wait for a free connection rather than
+# opening (and later discarding) one connection per profile
+#
+class asyncconnectionpool(connectionpool):
+
+    def __init__(self, maxsize=4, checkinterval=30.0):
+        super().__init__(maxsize, checkinterval)
+        self.semaphores = {}
+
+    @asynccontextmanager
+    async def connection(self, connstring):
+        semaphore = self.semaphores.setdefault(connstring, asyncio.Semaphore(self.maxsize))
+        async with semaphore:
+            conn = await self.getConnection(connstring)
+            try:
+                yield conn
+                if not conn.closed:
+                    await conn.commit()
+            except Exception:
+                if not conn.closed and not conn.broken:
+                    await conn.rollback()
+                await self.putConnection(connstring, conn)
+                raise
+            await self.putConnection(connstring, conn)
+
+    async def getConnection(self, connstring):
+        self._checkProcess()
+        while True:
+            entry = self._takeIdle(connstring)
+            if entry is None:
+                break
+            conn, lastused = entry
+            if await self._checkConnection(conn, lastused):
+                return conn
+            logging.warning('pg-stat-profiler : connectionpool : discarding unhealthy connection, reconnecting')
+            await self._closeConnection(conn)
+        return await psycopg.AsyncConnection.connect(connstring, row_factory=dict_row)
+
+    async def putConnection(self, connstring, conn):
+        self._checkProcess()
+        if conn.closed or conn.broken:
+            return
+        try:
+            if conn.info.transaction_status != TransactionStatus.IDLE:
+                await conn.rollback()
+        except Exception:
+            await self._closeConnection(conn)
+            return
+        if not self._keepIdle(connstring, conn):
+            await self._closeConnection(conn)
+
+    async def closeAll(self):
+        for conn, lastused in self._takeAllIdle():
+            await self._closeConnection(conn)
+
+    async def _checkConnection(self, conn, lastused):
+        if conn.closed or conn.broken:
+            return False
+        if time.monotonic() - lastused < self.checkinterval:
+            return True
+        try:
+            await conn.execute(u'SELECT 1')
+            await conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    async def _closeConnection(self, conn):
+        try:
+            await conn.close()
+        except Exception:
+            pass
+
+
+_asyncpool = None
+
+def getAsyncConnectionPool():
+    global _asyncpool
+    if _asyncpool is None:
+        _asyncpool = asyncconnectionpool()
+    return _asyncpool
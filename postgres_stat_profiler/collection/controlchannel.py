@@ -0,0 +1,64 @@
+import os
+import time
+import socket
+import logging
+
+# wake-up channel from the api workers to the collector daemon's supervisor: a unix datagram socket, bound by the
+# supervisor in the security directory. a notification carries no data: the profiles file is the only record of a
+# change, and the supervisor reads the records appended since its last read. a notification lost (no daemon
+# running, socket buffer full) only delays the change to the supervisor's next periodic check
+#
+class controlchannel:
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sock = None
+
+    # supervisor: bind the channel, replacing the socket file left by a previous supervisor. False if unavailable
+    def listen(self):
+        try:
+            self.close()
+            try:
+                os.unlink(self.filename)
+            except FileNotFoundError:
+                pass
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self.sock.bind(self.filename)
+            return True
+        except OSError as e:
+            logging.warning('pg-stat-profiler : control channel unavailable, profile changes applied periodically [{}]'.format(str(e)))
+            self.close()
+            return False
+
+    # supervisor: wait at most timeout seconds for a notification. the notifications received meanwhile are taken as one
+    def wait(self, timeout):
+        if self.sock is None:
+            time.sleep(timeout)
+            return False
+        try:
+            self.sock.settimeout(timeout)
+            self.sock.recv(16)
+        except socket.timeout:
+            return False
+        try:
+            self.sock.setblocking(False)
+            while True:
+                self.sock.recv(16)
+        except BlockingIOError:
+            pass
+        return True
+
+    # api: notify the supervisor of a change written to the profiles file. False if no supervisor is listening
+    def notify(self):
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+                sock.setblocking(False)
+                sock.sendto(b'1', self.filename)
+            return True
+        except OSError:
+            return False
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
@@ -0,0 +1,143 @@
+import zlib
+import logging
+import psycopg
+from psycopg import sql
+from datetime import datetime, timedelta
+from postgres_stat_profiler.collection.connectionpool import getConnectionPool
+from postgres_stat_profiler.models.reportlayout import reportlayout
+from postgres_stat_profiler.models.rollup_statstatements import rollup_statstatements
+
+# maintains the result_epoch range partitions of the snapshot tables of one report database for one profile.
+# partitions are created ahead of the collection time; partitions past the retention (and, with rollups enabled,
+# already rolled up) are detached and dropped, so expired history is removed without DELETE. with partitionbyprofile enabled each profile has its own list
+# partition, sub-partitioned by range, and its own retention. otherwise partitions (and the retention recorded
+# in the report database) are shared by every profile writing to it
+#
+class partitionmanager:
+
+    partitioned_tables = [u'cumulative_result_pg_stat_statements', u'incremental_result_pg_stat_statements']
+    bucket_seconds = {u'hourly': 3600, u'daily': 86400}
+    bucket_formats = {u'hourly': u'%Y%m%d%H', u'daily': u'%Y%m%d'}
+
+    def __init__(self, connstring, settings):
+        self.connstring = connstring
+        self.settings = settings
+        self.rollupss = rollup_statstatements()
+        # report_layout row, loaded on first use. empty for databases initialised before partitioning
+        self.layout = None
+        # start epoch of the bucket last maintained
+        self.bucket = None
+        # false for databases with no layout recorded
+        self.recorded = False
+
+    # false until the layout has been read, and for report databases which are not partitioned
+    def isPartitioned(self):
+        return self.layout is not None and self.layout.get(u'partitioninterval') in self.bucket_seconds
+
+    # unpartitioned report databases with a recorded layout expire minute history by DELETE (see rollupmanager).
+    # databases initialised before retention existed record none: expiry is opted into by recording one, e.g.
+    # INSERT INTO postgres_stat_profiler.report_layout VALUES ('none', 'disabled', 90)
+    def isDeleteExpired(self):
+        return self.layout is not None and self.recorded and not self.isPartitioned()
+
+    # true when epoch has entered a bucket not yet maintained (always true before the layout is known)
+    def isDue(self, epoch):
+        if self.layout is None:
+            return True
+        size = self.bucket_seconds.get(self.layout.get(u'partitioninterval'))
+        if size is None:
+            return False
+        return epoch - (epoch % size) != self.bucket
+
+    def maintain(self, profilename, epoch):
+        if not self.isDue(epoch):
+            return
+        try:
+           with getConnectionPool().connection(self.connstring) as conn:
+              if self.layout is None:
+                 self.layout = self._getLayout(conn)
+                 if not self.isDue(epoch):
+                    return
+              interval = self.layout[u'partitioninterval']
+              size = self.bucket_seconds[interval]
+              bucket = epoch - (epoch % size)
+              retentiondays = self.layout[u'retentiondays']
+              if self.layout[u'partitionbyprofile'] == u'enabled':
+                 retentiondays = self.settings.getRetentionDays()
+              for table in self.partitioned_tables:
+                 parent = self._getRangeParent(conn, table, profilename)
+                 for i in range(0, self.settings.getPartitionsAhead() + 1):
+                    self._createPartition(conn, parent, interval, bucket + i * size, size)
+                 conn.commit()
+                 if retentiondays > 0:
+                    self._dropExpired(conn, parent, interval, self._getExpiry(conn, profilename, epoch, retentiondays), size)
+              self.bucket = bucket
+        except Exception as e:
+           logging.warning('pg-stat-profiler : partition maintenance : profile [{}] error [{}]'.format(profilename,str(e)))
+
+    def _getLayout(self, conn):
+        try:
+           row = conn.execute(reportlayout().getSelectQuery()).fetchone()
+           if row is not None:
+              self.recorded = True
+              return row
+        except psycopg.errors.UndefinedTable:
+           conn.rollback()
+        # report databases initialised before retention existed keep all their history (retention 0)
+        logging.warning('pg-stat-profiler : partition maintenance : report database has no recorded layout, history is kept. '
+                        'record a report_layout row to expire minute history')
+        return {u'partitioninterval': u'none', u'partitionbyprofile': u'disabled', u'retentiondays': 0}
+
+    # the partitioned table holding the range partitions: the table itself, or the profile's list partition
+    def _getRangeParent(self, conn, table, profilename):
+        if self.layout[u'partitionbyprofile'] != u'enabled':
+           return table
+        parent = u'{}_p{:08x}'.format(table, zlib.crc32(profilename.encode('utf-8')))
+        conn.execute(sql.SQL(u'CREATE TABLE IF NOT EXISTS postgres_stat_profiler.{} PARTITION OF postgres_stat_profiler.{} '
+                             u'FOR VALUES IN ({}) PARTITION BY RANGE (result_epoch)').format(
+                     sql.Identifier(parent), sql.Identifier(table), sql.Literal(profilename)))
+        return parent
+
+    def _createPartition(self, conn, parent, interval, start, size):
+        conn.execute(sql.SQL(u'CREATE TABLE IF NOT EXISTS postgres_stat_profiler.{} PARTITION OF postgres_stat_profiler.{} '
+                             u'FOR VALUES FROM ({}) TO ({})').format(
+                     sql.Identifier(self._getPartitionName(parent, interval, start)), sql.Identifier(parent),
+                     sql.Literal(start), sql.Literal(start + size)))
+
+    # with rollups enabled, minute history is only expired once the hourly rollup has covered it: up to the profile's
+    # hourly watermark, or for partitions shared by every profile, the lowest watermark of the profiles writing to them
+    def _getExpiry(self, conn, profilename, epoch, retentiondays):
+        expiry = epoch - retentiondays * 86400
+        if self.settings.getRollups() != u'enabled':
+           return expiry
+        if self.layout[u'partitionbyprofile'] == u'enabled':
+           row = conn.execute(self.rollupss.getWatermarkQuery(), [profilename, u'hourly']).fetchone()
+        else:
+           row = conn.execute(self.rollupss.getLowestWatermarkQuery(), [u'hourly']).fetchone()
+        if row is None or row[u'watermark_epoch'] is None:
+           return 0
+        return min(expiry, row[u'watermark_epoch'])
+
+    # partitions wholly before the expiry epoch are detached, then dropped, one transaction each
+    def _dropExpired(self, conn, parent, interval, expiry, size):
+        children = conn.execute(u'SELECT c.relname FROM pg_catalog.pg_inherits i JOIN pg_catalog.pg_class c ON c.oid = i.inhrelid '
+                                u'WHERE i.inhparent = %s::regclass', [u'postgres_stat_profiler.' + parent]).fetchall()
+        for child in children:
+           start = self._getPartitionStart(parent, interval, child[u'relname'])
+           if start is None or start + size > expiry:
+              continue
+           logging.warning('pg-stat-profiler : partition maintenance : dropping expired partition [{}]'.format(child[u'relname']))
+           conn.execute(sql.SQL(u'ALTER TABLE postgres_stat_profiler.{} DETACH PARTITION postgres_stat_profiler.{}').format(
+                        sql.Identifier(parent), sql.Identifier(child[u'relname'])))
+           conn.execute(sql.SQL(u'DROP TABLE postgres_stat_profiler.{}').format(sql.Identifier(child[u'relname'])))
+           conn.commit()
+
+    def _getPartitionName(self, parent, interval, start):
+        return u'{}_{}'.format(parent, (datetime(1970, 1, 1) + timedelta(seconds=start)).strftime(self.bucket_formats[interval]))
+
+    def _getPartitionStart(self, parent, interval, name):
+        try:
+           suffix = name[len(parent) + 1:]
+           return int((datetime.strptime(suffix, self.bucket_formats[interval]) - datetime(1970, 1, 1)).total_seconds())
+        except ValueError:
+           return None
@@ -0,0 +1,26 @@
+import time
+
+# wall clock duration (seconds) of each phase of one collection cycle, in the order the phases ran
+#
+class phasetimer:
+
+    # the phases marked by the collectors. connect: connection checkouts from the pool,
+    # commit: report database commits (the phase before each commit is its writes)
+    phases = [u'connect', u'fetch', u'transform', u'partitions', u'querytext', u'cumulative_copy',
+              u'incremental', u'incremental_copy', u'commit', u'analytics', u'rollups']
+
+    def __init__(self):
+        self.times = {}
+        self.last = time.perf_counter()
+
+    # ends the named phase, which started at the previous mark (or when the timer was created)
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.times[phase] = self.times.get(phase, 0.0) + now - self.last
+        self.last = now
+
+    def getTimes(self):
+        return self.times
+
+    def getTotal(self):
+        return sum(self.times.values())
@@ -1,23 +1,57 @@
-from datetime import datetime
-import base64
-from cryptography.fernet import Fernet
+from datetime import datetime, timedelta
 import psycopg
-from psycopg.rows import dict_row
 import logging
+from postgres_stat_profiler.collection.connectionpool import getConnectionPool
+from postgres_stat_profiler.collection.queryattributecache import queryattributecache
 from postgres_stat_profiler.collection.postgresMonitoredDatabase import postgresMonitoredDatabase
 from postgres_stat_profiler.collection.reportDatabase import reportDatabase
-from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
-from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.collection.partitionmanager import partitionmanager
+from postgres_stat_profiler.collection.collectioncycle import collectioncycle
+from postgres_stat_profiler.collection.rollupmanager import rollupmanager
+from postgres_stat_profiler.analytics.segmentstore import getSegmentStore
+from postgres_stat_profiler.collection.statementselection import statementselection
 
 class postgrescollector:
 
-    def __init__(self, profile):
+    # seconds between last_seen refreshes of an unchanged query text
+    querytext_touch_interval = 3600
+
+    def __init__(self, profile, checkstatus=True):
         self.profile = profile
         self.profilename = self.profile.getName()
         self.queryencryption = self.profile.getQueryEncryption()
         self.queryencryptionsecret = self.profile.getQueryEncryptionSecret()
-        self.monitordb = postgresMonitoredDatabase(self.profile.getMonitoredDBconnection().getPostgresConnectionString())
-        self.reportdb = reportDatabase(self.profile.getReportDBconnection().getPostgresConnectionString())
+        self.capturemode = self.profile.getCollectionSettings().getCaptureMode()
+        self.selection = statementselection(self.profile.getCollectionSettings())
+        self.monitordb = postgresMonitoredDatabase(self.profile.getMonitoredDBconnection().getPostgresConnectionString(),checkstatus)
+        self.reportdb = reportDatabase(self.profile.getReportDBconnection().getPostgresConnectionString(),checkstatus,
+                                       self.profile.getReportSettings())
+        self.partitions = partitionmanager(self.reportdb.getConnstring(),self.profile.getReportSettings())
+        self.rollups = rollupmanager(self.reportdb.getConnstring(),self.profile.getReportSettings())
+        # local columnar copy of the incremental records, when an analytics cache directory is configured
+        self.analytics = getSegmentStore()
+        # previous cumulative snapshot, kept across cycles for in-memory incremental computation
+        self.snapshot = None
+        # activity seen by the last collection (incremental rows, calls), used for adaptive intervals
+        self.lastactivity = (0, 0)
+        # epoch of the last collection completed into the report database
+        self.lastcollectepoch = None
+        # duration of each phase of the last collection (see phasetimer)
+        self.lastphasetimes = {}
+        # rows read from pg_stat_statements and rows written to the report tables by the last collection
+        self.lastrowcounts = (0, 0)
+        # error of the last collection, None if it succeeded
+        self.lasterror = None
+        # query texts known to be in the report database: (dbid, queryid) -> (text hash, last_seen epoch)
+        # loaded from the report database on the first cycle, then maintained in memory
+        self.querytexts = None
+        # query types, ciphertexts and the Fernet key, derived once per statement text rather than every cycle
+        self.attributecache = queryattributecache()
+
+    # re-probe both databases on the pooled connections, without reconnecting
+    def checkStatus(self):
+        self.monitordb.checkStatus()
+        self.reportdb.checkStatus()
 
     def getMonitoredDBstatus(self):
         return self.monitordb.getStatus()
@@ -25,45 +59,196 @@ class postgrescollector:
     def getReportDBstatus(self):
         return self.reportdb.getStatus()
 
-    def collect(self):
+    def getLastActivity(self):
+        return self.lastactivity
+
+    def getLastCollectEpoch(self):
+        return self.lastcollectepoch
+
+    def getLastPhaseTimes(self):
+        return self.lastphasetimes
+
+    def getLastRowCounts(self):
+        return self.lastrowcounts
+
+    def getLastError(self):
+        return self.lasterror
+
+    # returns True if the collection completed into the report database
+    # the steps of the cycle are in collectioncycle: this method runs their queries on the pooled connections
+    def collect(self, interval=60):
             try:
-               now = datetime.now()
-               rtime_minute = now.strftime('%Y-%m-%d %H:%M')
-               rtime_epoch = int((datetime.strptime(rtime_minute,'%Y-%m-%d %H:%M') - datetime(1970, 1, 1)).total_seconds())
-               if self.queryencryption == u'enabled':
-                  secretbytes = base64.urlsafe_b64decode(self.queryencryptionsecret)          
-                  fernetkey = base64.urlsafe_b64encode(secretbytes.ljust(32)[:32])
-                  queryfernet = Fernet(fernetkey)
-               else:
-                  queryfernet = None
-
-               mconn = psycopg.connect(self.monitordb.getConnstring(),row_factory=dict_row)
-               rconn = psycopg.connect(self.reportdb.getConnstring(),row_factory=dict_row)
-
-               # collect from monitored database and insert latest data into report database
-               cumulativess = cumulative_statstatements()
-               cumulative_collectquery = cumulativess.getCollectQuery()
-               collectrecords = mconn.execute(cumulative_collectquery).fetchall()
-               for collectrecord in collectrecords:
-                   cumulative_insertquery = cumulativess.getInsertQuery()
-                   cumulative_insertrecord = cumulativess.getInsertRecord(self.profilename,rtime_minute,rtime_epoch, \
-                                                                          self.queryencryption,queryfernet,collectrecord)
-                   result = rconn.execute(cumulative_insertquery, cumulative_insertrecord)
-               rconn.commit()
-               #logging.warning('pg-stat-profiler: cumulative statements collect success for [{}]'.format(rtime_minute))
-               mconn.close()
-
-               # compare latest and previous rows in cumulative table to generate incremental data (ie for activity within the last minute)
-               incrementalss = incremental_statstatements()
-               incremental_collectquery = incrementalss.getCollectQuery(self.profilename)
-               incrementalrecords = rconn.execute(incremental_collectquery).fetchall()
-               for incrementalrecord in incrementalrecords:
-                   incremental_insertquery = incrementalss.getInsertQuery()
-                   incremental_insertrecord = incrementalss.getInsertRecord(incrementalrecord)
-                   result = rconn.execute(incremental_insertquery,incremental_insertrecord)
-               rconn.commit()
-               #logging.warning('pg-stat-profiler: incremental statements collect success for [{}]'.format(rtime_minute))
-               rconn.close()
+               cycle = collectioncycle(self, interval)
+
+               # connections are long-lived and shared with the status checks, via the per-process pool
+               pool = getConnectionPool()
+
+               # collect from monitored database (server-side prepared collect query)
+               with pool.connection(self.monitordb.getConnstring()) as mconn:
+                  cycle.mark(u'connect')
+                  collectrecords = mconn.execute(cycle.getCollectQuery(), prepare=True).fetchall()
+               cycle.mark(u'fetch')
+               cycle.setCollectRecords(collectrecords)
+
+               # partitions for this collection time exist before it is written (checked once per partition interval)
+               self.partitions.maintain(self.profilename,cycle.getEpoch())
+               cycle.mark(u'partitions')
+
+               with pool.connection(self.reportdb.getConnstring()) as rconn:
+                  cycle.mark(u'connect')
+                  knownquery = cycle.getKnownQueryTextsQuery()
+                  if knownquery is not None:
+                      cycle.setKnownQueryTexts(rconn.execute(*knownquery).fetchall())
+                  self._executeStatements(rconn,cycle.getQueryTextStatements())
+                  cycle.mark(u'querytext')
+                  rconn.commit()
+                  cycle.mark(u'commit')
+                  cycle.setQueryTextsCommitted()
+
+                  # stream latest data into report database with a single COPY
+                  self._copyRecords(rconn,*cycle.getCumulativeCopy())
+                  self._executeStatements(rconn,cycle.getEpochStatements())
+                  cycle.mark(u'cumulative_copy')
+                  rconn.commit()
+                  cycle.mark(u'commit')
+
+                  incrementalquery = cycle.getIncrementalQuery()
+                  if incrementalquery is not None:
+                      cycle.setIncrementalRecords(rconn.execute(*incrementalquery).fetchall())
+                  else:
+                      cycle.setIncrementalRecords()
+                  self._copyRecords(rconn,*cycle.getIncrementalCopy())
+                  cycle.mark(u'incremental_copy')
+                  rconn.commit()
+                  cycle.mark(u'commit')
+                  cycle.setCompleted()
+
+               cycle.appendAnalytics()
+
+               # hourly and daily rollups of the completed hours, and retention (once per hour of collection time)
+               self.rollups.run(self.profilename,cycle.getEpoch(),self.partitions.isDeleteExpired())
+               cycle.mark(u'rollups')
+               cycle.setFinished()
+               return True
 
             except Exception as e:
-               logging.warning('pg-stat-profiler: collection : postgres collect error [{}]'.format(str(e)))
\ No newline at end of file
+               logging.warning('pg-stat-profiler: collection : postgres collect error [{}]'.format(str(e)))
+               self.lasterror = str(e)
+               return False
+
+    def _executeStatements(self,rconn,statements):
+        if len(statements) == 0:
+            return
+        with rconn.cursor() as cur:
+            for query, parameters, many in statements:
+                if many:
+                    cur.executemany(query,parameters)
+                else:
+                    cur.execute(query,parameters)
+
+    # helpers shared by the synchronous and asyncio collectors (no database access)
+    # collection time truncated to the interval boundary. binary copy requires a timestamp value rather than a formatted string
+    def _getCollectTime(self, interval):
+        now = datetime.now()
+        now_epoch = int((now - datetime(1970, 1, 1)).total_seconds())
+        rtime_epoch = now_epoch - (now_epoch % interval)
+        rtime = datetime(1970, 1, 1) + timedelta(seconds=rtime_epoch)
+        return rtime, rtime_epoch
+
+    # records to persist, and the snapshot rows to produce incremental records for (None: every row).
+    # capturemode 'full' persists the entries changed since the previous snapshot,
+    # 'topn' the top statements by their activity since the previous snapshot
+    def _getPersistRecords(self,latest):
+        if self.capturemode == u'full':
+            return latest.getChangedRecords(self.snapshot), None
+        positions = self.selection.getSelectedPositions(latest,self.snapshot)
+        return latest.getRecordsAt(positions), positions
+
+    # in capturemode 'topn' the activity of the statements not selected is kept in one 'other' record per database and user
+    def _getIncrementalRecords(self,latest,selectedpositions):
+        if selectedpositions is None:
+            return latest.getDeltaRecords(self.snapshot)
+        return latest.getDeltaRecords(self.snapshot,selectedpositions) + latest.getOtherRecords(self.snapshot,selectedpositions)
+
+    # a failure here never affects collection into the report database
+    def _appendAnalytics(self,incrementalss,rtime_epoch,incrementalrecords):
+        if self.analytics is None:
+            return
+        try:
+            self.analytics.append(self.profilename,rtime_epoch,incrementalss.getColumns(),incrementalrecords)
+        except Exception as e:
+            logging.warning('pg-stat-profiler: collection : analytics cache append error [{}]'.format(str(e)))
+
+    def _getActivity(self,incrementalss,incrementalrecords):
+        callsposition = incrementalss.getColumns().index(u'calls')
+        return len(incrementalrecords), sum([record[callsposition] for record in incrementalrecords])
+
+    def getAttributeCacheStats(self):
+        return self.attributecache.getStats()
+
+    def _getQueryFernet(self):
+        if self.queryencryption == u'enabled':
+           return self.attributecache.getFernet(self.queryencryptionsecret)
+        return None
+
+    def _getCumulativeRecords(self,cumulativess,rtime_minute,rtime_epoch,collectrecords):
+        return [cumulativess.getInsertRecord(self.profilename,rtime_minute,rtime_epoch,collectrecord, \
+                   self.attributecache.getQueryType(collectrecord['queryid'],collectrecord['query'],cumulativess.getQueryType)) \
+                for collectrecord in collectrecords]
+
+    def _getStoredQueryText(self,queryfernet,collectrecord):
+        if self.queryencryption == u'enabled':
+            return self.attributecache.getCipherText(collectrecord['queryid'],collectrecord['query'],queryfernet)
+        return collectrecord['query']
+
+    # the text hash of preloaded keys is unknown: the stored text is assumed current until it is seen to change
+    def _getKnownQueryTexts(self,knownkeys):
+        return dict([((knownkey['dbid'], knownkey['queryid']), (None, 0)) for knownkey in knownkeys])
+
+    # split the collected statements into query texts to upsert (new or changed, encrypted here only) and
+    # unchanged keys whose last_seen is due a refresh. returns the known-text entries to apply once committed
+    def _getQueryTextRecords(self,querytextss,cumulativess,rtime_minute,rtime_epoch,queryfernet,collectrecords,cumulativerecords):
+        typeposition = cumulativess.getColumns().index(u'querytype')
+        upserts = []
+        touches = []
+        seen = {}
+        for collectrecord, cumulativerecord in zip(collectrecords, cumulativerecords):
+            if collectrecord['queryid'] is None:
+                continue
+            key = (collectrecord['dbid'], str(collectrecord['queryid']))
+            if key in seen:
+                continue
+            texthash = hash(collectrecord['query'])
+            known = self.querytexts.get(key)
+            if known is None or (known[0] is not None and known[0] != texthash):
+                upserts.append(querytextss.getInsertRecord(self.profilename,rtime_minute,cumulativerecord[typeposition], \
+                                                           self._getStoredQueryText(queryfernet,collectrecord),collectrecord))
+                seen[key] = (texthash, rtime_epoch)
+            elif rtime_epoch - known[1] >= self.querytext_touch_interval:
+                touches.append(key)
+                seen[key] = (texthash, rtime_epoch)
+            elif known[0] is None:
+                seen[key] = (texthash, known[1])
+        return upserts, touches, seen
+
+    def _getTouchParameters(self,rtime_minute,touches):
+        return [rtime_minute, [key[0] for key in touches], [key[1] for key in touches], self.profilename]
+
+    # stream all records in one COPY round trip. binary format is used where every column type is known,
+    # text format is the fallback (eg older servers or values the binary dumpers reject)
+    def _copyRecords(self,rconn,copyquery,textcopyquery,copytypes,records):
+        if len(records) == 0:
+            return
+        try:
+            with rconn.cursor() as cur:
+                with cur.copy(copyquery) as copy:
+                    copy.set_types(copytypes)
+                    for record in records:
+                        copy.write_row(record)
+        except (psycopg.DataError, psycopg.NotSupportedError, TypeError) as e:
+            logging.warning('pg-stat-profiler: collection : binary copy failed, retrying in text format [{}]'.format(str(e)))
+            rconn.rollback()
+            with rconn.cursor() as cur:
+                with cur.copy(textcopyquery) as copy:
+                    for record in records:
+                        copy.write_row(record)
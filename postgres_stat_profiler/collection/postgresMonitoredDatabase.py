@@ -1,12 +1,15 @@
 import os
 import logging
 import psycopg
+from postgres_stat_profiler.collection.connectionpool import getConnectionPool, getAsyncConnectionPool
 
 class postgresMonitoredDatabase():
 
-    def __init__(self,connstring):
+    def __init__(self,connstring,checkstatus=True):
         self.connstring = connstring
-        self._checkStatus()
+        self.status = 'unknown'
+        if checkstatus:
+           self._checkStatus()
 
     def setConfig(self,config):
         self.config = config
@@ -17,12 +20,24 @@ class postgresMonitoredDatabase():
     def getStatus(self):
         return self.status
 
+    def checkStatus(self):
+        self._checkStatus()
+
+    async def checkStatusAsync(self):
+        try: 
+           async with getAsyncConnectionPool().connection(self.connstring) as conn:
+                await conn.execute("SELECT * FROM pg_stat_statements LIMIT 1", prepare=True)
+                self.status = 'operational'
+        except Exception as e:
+           logging.warning('pg-stat-profiler : monitored database getstatus : Unexpected error [{}]'.format(str(e)))
+           self.status = 'missing-pg-stat-statements'
+
     def _checkStatus(self):
         try: 
-           with psycopg.connect(self.connstring) as conn:
+           with getConnectionPool().connection(self.connstring) as conn:
              with conn.cursor() as cur:
-                result = cur.execute("SELECT * FROM pg_stat_statements LIMIT 1")   
+                result = cur.execute("SELECT * FROM pg_stat_statements LIMIT 1", prepare=True)
                 self.status = 'operational'
         except Exception as e:
-           logging.warn('pg-stat-profiler : monitored database getstatus : Unexpected error [{}]'.format(str(e)))
+           logging.warning('pg-stat-profiler : monitored database getstatus : Unexpected error [{}]'.format(str(e)))
            self.status = 'missing-pg-stat-statements'
@@ -0,0 +1,73 @@
+import base64
+from collections import OrderedDict
+from cryptography.fernet import Fernet
+
+# bounded least-recently-used cache of the attributes derived from a query text (query type, encrypted text),
+# held by a collector for its whole life so that unchanged statements are not re-tokenized or re-encrypted
+# every cycle. entries are keyed by queryid plus a hash of the text, so a changed text is derived afresh.
+# the Fernet instance for the query encryption secret is derived once and held here too
+#
+class queryattributecache:
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.fernetsecret = None
+        self.fernet = None
+
+    def getSize(self):
+        return len(self.entries)
+
+    def getHits(self):
+        return self.hits
+
+    def getMisses(self):
+        return self.misses
+
+    def getStats(self):
+        return {u'size': len(self.entries), u'hits': self.hits, u'misses': self.misses}
+
+    # deriver: function of the query text returning its query type, called on a miss only
+    def getQueryType(self, queryid, query, deriver):
+        entry = self._getEntry(queryid, query)
+        if u'querytype' not in entry:
+            entry[u'querytype'] = deriver(query)
+        return entry[u'querytype']
+
+    # Fernet tokens are not deterministic: the first ciphertext for a text is reused while the text is unchanged
+    def getCipherText(self, queryid, query, queryfernet):
+        entry = self._getEntry(queryid, query)
+        if u'ciphertext' not in entry:
+            entry[u'ciphertext'] = queryfernet.encrypt(query.encode('utf-8')).decode('utf-8')
+        return entry[u'ciphertext']
+
+    # the Fernet key is the secret padded/truncated to 32 bytes; derived again only if the secret changes
+    def getFernet(self, secret):
+        if self.fernet is None or secret != self.fernetsecret:
+            secretbytes = base64.urlsafe_b64decode(secret)
+            fernetkey = base64.urlsafe_b64encode(secretbytes.ljust(32)[:32])
+            self.fernet = Fernet(fernetkey)
+            self.fernetsecret = secret
+            # ciphertexts made with a previous key are no longer valid
+            for entry in self.entries.values():
+                entry.pop(u'ciphertext', None)
+        return self.fernet
+
+    def clear(self):
+        self.entries.clear()
+
+    def _getEntry(self, queryid, query):
+        key = (queryid, hash(query))
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits = self.hits + 1
+            self.entries.move_to_end(key)
+            return entry
+        self.misses = self.misses + 1
+        entry = {}
+        self.entries[key] = entry
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return entry
@@ -1,15 +1,21 @@
 import os
+import asyncio
 import logging
 import psycopg
 from postgres_stat_profiler.collection.reportschema import reportschema
+from postgres_stat_profiler.collection.connectionpool import getConnectionPool, getAsyncConnectionPool
 
 
 class reportDatabase():
 
-    def __init__(self,connstring):
+    def __init__(self,connstring,checkstatus=True,settings=None):
         self.connstring = connstring
-        self.schema = reportschema()
-        self._checkStatus()
+        self.schema = reportschema(settings)
+        self.upgraded = False
+        if checkstatus:
+           self._checkStatus()
+        else:
+           self.status = 'unknown'
 
     def setConfig(self,config):
         self.config = config
@@ -20,15 +26,38 @@ class reportDatabase():
     def getStatus(self):
         return self.status
 
+    # recheck on each cycle; a failed status is retried as it would be for a new report database
+    def checkStatus(self):
+        self.status = 'new'
+        self._checkStatus()
+
+    async def checkStatusAsync(self):
+        self.status = 'new'
+        try: 
+           async with getAsyncConnectionPool().connection(self.connstring) as conn:
+                await conn.execute(self.schema.getTestCommand(), prepare=True)
+                self.status = 'initialised'
+           if not self.upgraded:
+              await asyncio.to_thread(self._upgrade)
+        except Exception as e:
+           logging.warning('pg-stat-profiler : report database checkstatus : table missing or not granted[{}]'.format(str(e)))
+           # schema initialisation is a rare, one-off sequence of DDL: run the synchronous version off the event loop
+           if 'does not exist' in str(e):
+                 await asyncio.to_thread(self._initialise)
+           else:
+              self.status = 'failed'
+
     def _checkStatus(self):
         try: 
            if not hasattr(self,'status'):
               self.status = 'new'
-           with psycopg.connect(self.connstring) as conn:
+           with getConnectionPool().connection(self.connstring) as conn:
              with conn.cursor() as cur:
                 testcommand = self.schema.getTestCommand()
-                cur.execute(testcommand)   
+                cur.execute(testcommand, prepare=True)
                 self.status = 'initialised'
+           if not self.upgraded:
+              self._upgrade()
         except Exception as e:
            logging.warning('pg-stat-profiler : report database checkstatus : table missing or not granted[{}]'.format(str(e)))
            # check for schema missing and initialise it
@@ -44,7 +73,7 @@ class reportDatabase():
              logging.warning('pg-stat-profiler : report database : initialise attempt on failed database : please grant access to the configured user and retry')
              return
           else:
-           with psycopg.connect(self.connstring) as conn:
+           with getConnectionPool().connection(self.connstring) as conn:
             with conn.cursor() as cur:
               logging.warning('pg-stat-profiler : report database : initialise started')
               for command in self.schema.getCreateSchema():
@@ -86,5 +115,22 @@ class reportDatabase():
               logging.warning('pg-stat-profiler : report database : initialise completed')
             self.status = 'initialised'
         except Exception as e:
-           logging.warn('pg-stat-profiler : reportdatabase initialise : Unexpected error [{}]'.format(str(e)))
-           self.status = 'failed'
\ No newline at end of file
+           logging.warning('pg-stat-profiler : reportdatabase initialise : Unexpected error [{}]'.format(str(e)))
+           self.status = 'failed'
+
+    # bring an existing report database up to the current schema: once per process, idempotent commands only.
+    # failures are logged but do not change the database status
+    def _upgrade(self):
+        try:
+           with getConnectionPool().connection(self.connstring) as conn:
+            with conn.cursor() as cur:
+              for command in self.schema.getUpgradeCommands():
+                 try:
+                   cur.execute(command)
+                   cur.execute(u'COMMIT')
+                 except Exception as e:
+                   cur.execute(u'ROLLBACK')
+                   logging.warning('pg-stat-profiler : reportdatabase upgrade : command [{}] error [{}]'.format(command[:50],str(e)))
+           self.upgraded = True
+        except Exception as e:
+           logging.warning('pg-stat-profiler : reportdatabase upgrade : Unexpected error [{}]'.format(str(e)))
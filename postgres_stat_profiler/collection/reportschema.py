@@ -1,15 +1,24 @@
 from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
 from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.models.querytext_statstatements import querytext_statstatements
+from postgres_stat_profiler.models.rollup_statstatements import rollup_statstatements
+from postgres_stat_profiler.models.snapshot_epochs import snapshot_epochs
+from postgres_stat_profiler.models.reportlayout import reportlayout
+from postgres_stat_profiler.config.reportsettings import reportsettings
 
 class reportschema():
 
-    def __init__(self):
+    # settings: report settings of the profile, deciding the partition layout of a newly initialised database
+    def __init__(self,settings=None):
+        self.layout = reportlayout(settings if settings is not None else reportsettings({}))
         self.create_schema = []
         self.create_tables = []
         self.create_indexes = []
+        self.upgrade_commands = []
         self._getSchemaCommands()
         self._getTableCommands()
         self._getIndexCommands()
+        self._getUpgradeCommands()
 
     def getCreateSchema(self):
         return self.create_schema
@@ -20,6 +29,10 @@ class reportschema():
     def getCreateIndexes(self):
         return self.create_indexes
     
+    # idempotent (IF NOT EXISTS) commands for objects added after a report database was first initialised
+    def getUpgradeCommands(self):
+        return self.upgrade_commands
+
     def getTestCommand(self):
         return u'SELECT * FROM postgres_stat_profiler.cumulative_result_pg_stat_statements LIMIT 1'
 
@@ -33,11 +46,29 @@ class reportschema():
         self.create_schema.append(create_postgres_stat_profiler_schema)
 
     def _getTableCommands(self):
+        cumulativess = cumulative_statstatements(self.layout.getPartitionClause())
+        incrementalss = incremental_statstatements(self.layout.getPartitionClause())
+        querytextss = querytext_statstatements()
+        rollupss = rollup_statstatements()
+        epochs = snapshot_epochs()
+        self.create_tables = self.layout.getCreateTables() + cumulativess.getCreateTables() + incrementalss.getCreateTables() \
+                             + querytextss.getCreateTables() + rollupss.getCreateTables() + epochs.getCreateTables()
+
+    def _getIndexCommands(self):
         cumulativess = cumulative_statstatements()
         incrementalss = incremental_statstatements()
-        self.create_tables = cumulativess.getCreateTables() + incrementalss.getCreateTables()
+        querytextss = querytext_statstatements()
+        rollupss = rollup_statstatements()
+        self.create_indexes = cumulativess.getCreateIndexes() + incrementalss.getCreateIndexes() + querytextss.getCreateIndexes() \
+                              + rollupss.getCreateIndexes()
 
-    def _getIndexCommands(self):
+    # indexes of the snapshot tables are included: report databases initialised before them have none
+    def _getUpgradeCommands(self):
         cumulativess = cumulative_statstatements()
         incrementalss = incremental_statstatements()
-        self.create_indexes = cumulativess.getCreateIndexes() + incrementalss.getCreateIndexes()
+        querytextss = querytext_statstatements()
+        rollupss = rollup_statstatements()
+        epochs = snapshot_epochs()
+        self.upgrade_commands = reportlayout().getUpgradeTables() + querytextss.getCreateTables() + querytextss.getCreateIndexes() \
+                                + rollupss.getCreateTables() + rollupss.getCreateIndexes() + epochs.getCreateTables() \
+                                + incrementalss.getUpgradeCommands() + cumulativess.getCreateIndexes() + incrementalss.getCreateIndexes()
@@ -0,0 +1,65 @@
+import logging
+from postgres_stat_profiler.collection.connectionpool import getConnectionPool
+from postgres_stat_profiler.models.rollup_statstatements import rollup_statstatements
+
+# rolls up one profile's incremental statements into the hourly, then daily, rollup tables and applies the
+# profile's retention. each level is computed incrementally: only the buckets completed since its watermark
+# are read, and the rows and the new watermark are committed together
+#
+class rollupmanager:
+
+    minute_tables = [u'incremental_result_pg_stat_statements', u'cumulative_result_pg_stat_statements']
+
+    def __init__(self, connstring, settings):
+        self.connstring = connstring
+        self.settings = settings
+        self.rollupss = rollup_statstatements()
+        # start epoch of the hour last rolled up
+        self.bucket = None
+
+    # rollups run once per hour of collection time
+    def isDue(self, epoch):
+        return self.settings.getRollups() == u'enabled' and epoch - (epoch % 3600) != self.bucket
+
+    # minuteretention: also delete expired (and already rolled up) minute rows, for report databases whose
+    # snapshot tables are not partitioned (partitioned tables are expired by the partition manager) and which
+    # record their layout (see partitionmanager.isDeleteExpired)
+    def run(self, profilename, epoch, minuteretention=False):
+        if not self.isDue(epoch):
+            return
+        try:
+           with getConnectionPool().connection(self.connstring) as conn:
+              # rows with an epoch before the current hour are complete: later collections have later epochs
+              upto = epoch - (epoch % 3600)
+              for level in self.rollupss.getLevels():
+                 size = self.rollupss.getBucketSeconds(level)
+                 upto = upto - (upto % size)
+                 watermark = self._getWatermark(conn, profilename, level)
+                 if upto > watermark:
+                    conn.execute(self.rollupss.getRollupQuery(level), [profilename, watermark, upto])
+                    conn.execute(self.rollupss.getSetWatermarkQuery(), [profilename, level, upto])
+                    conn.commit()
+                 else:
+                    upto = watermark
+              self._expire(conn, profilename, epoch, minuteretention)
+              self.bucket = epoch - (epoch % 3600)
+        except Exception as e:
+           logging.warning('pg-stat-profiler : rollup : profile [{}] error [{}]'.format(profilename,str(e)))
+
+    def _getWatermark(self, conn, profilename, level):
+        row = conn.execute(self.rollupss.getWatermarkQuery(), [profilename, level]).fetchone()
+        if row is None:
+           return 0
+        return row[u'watermark_epoch']
+
+    def _expire(self, conn, profilename, epoch, minuteretention):
+        for level, days in [(u'hourly', self.settings.getHourlyRetentionDays()), (u'daily', self.settings.getDailyRetentionDays())]:
+           if days > 0:
+              conn.execute(self.rollupss.getRetentionQuery(level), [profilename, epoch - days * 86400])
+        if minuteretention and self.settings.getRetentionDays() > 0:
+           # never expire minute rows which have not been rolled up
+           expiry = min(epoch - self.settings.getRetentionDays() * 86400, self._getWatermark(conn, profilename, u'hourly'))
+           for table in self.minute_tables:
+              conn.execute(u'DELETE FROM postgres_stat_profiler.{} WHERE profilename = %s AND result_epoch < %s'.format(table),
+                           [profilename, expiry])
+        conn.commit()
@@ -0,0 +1,41 @@
+import numpy as np
+
+# selection of the statements to persist for capturemode 'topn'. statements are ranked by their activity
+# since the previous snapshot, so that a statement which is busy now is persisted regardless of its lifetime
+# totals (with no previous snapshot the lifetime totals are ranked).
+# the selection is the union of the top statements by rankmetric and by each of the unionmetrics, so that
+# statements heavy in eg calls, reads or wal but not in time are kept. with coverage set, the number taken
+# for each metric grows beyond topn until that fraction of the metric's total activity is covered
+#
+class statementselection:
+
+    def __init__(self, settings):
+        self.topn = settings.getTopN()
+        self.rankmetric = settings.getRankMetric()
+        self.metrics = [self.rankmetric] + [metric for metric in settings.getUnionMetrics() if metric != self.rankmetric]
+        self.coverage = settings.getCoverage()
+
+    # positions (rows of latest), highest rankmetric activity first. statements with no activity are not selected
+    def getSelectedPositions(self, latest, previous):
+        if latest.getSize() == 0:
+            return []
+        selected = np.zeros(latest.getSize(), dtype=bool)
+        for metric in self.metrics:
+            selected[self._getTopPositions(latest.getActivity(previous, metric))] = True
+        candidates = np.nonzero(selected)[0]
+        activity = latest.getActivity(previous, self.rankmetric)
+        order = np.lexsort((candidates, -activity[candidates]))
+        return candidates[order].tolist()
+
+    def _getTopPositions(self, activity):
+        candidates = np.nonzero(activity > 0)[0]
+        count = self.topn
+        if self.coverage > 0 and len(candidates) > count:
+            ranked = np.sort(activity[candidates])[::-1]
+            covered = np.cumsum(ranked)
+            count = max(count, int(np.searchsorted(covered, self.coverage * covered[-1])) + 1)
+        if len(candidates) > count:
+            # partial sort: only the top count are found
+            top = np.argpartition(-activity[candidates], count - 1)[:count]
+            candidates = candidates[top]
+        return candidates
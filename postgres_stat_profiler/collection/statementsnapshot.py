@@ -0,0 +1,202 @@
+import numpy as np
+
+# in-memory, array-backed copy of one cumulative pg_stat_statements collection
+# held by the collector between cycles so that incremental (delta) rows can be computed
+# without re-reading cumulative history from the report database
+#
+class statementsnapshot:
+
+    # monotonically increasing counters: differenced between snapshots
+    counter_columns = [u'calls', u'total_exec_time', u'rows', u'plans', u'total_plan_time',
+                       u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                       u'local_blks_hit', u'local_blks_read', u'local_blks_dirtied', u'local_blks_written',
+                       u'temp_blks_read', u'temp_blks_written', u'blk_read_time', u'blk_write_time',
+                       u'wal_bytes', u'wal_records', u'wal_fpi']
+    # sum of squared execution times, derived from the lifetime calls, mean and (population) stddev: differenced
+    # like the counters, its activity is the exact sum of squares of the interval's executions. not a column of the
+    # cumulative records: appended to the incremental records
+    sumsq_column = u'sumsq_exec_time'
+    # point-in-time values: carried from the latest snapshot
+    latest_columns = [u'min_exec_time', u'max_exec_time', u'stddev_exec_time',
+                      u'min_plan_time', u'max_plan_time', u'stddev_plan_time']
+    # counters stored as bigint/numeric in the report tables
+    integer_columns = [u'calls', u'rows', u'plans',
+                       u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                       u'local_blks_hit', u'local_blks_read', u'local_blks_dirtied', u'local_blks_written',
+                       u'temp_blks_read', u'temp_blks_written', u'wal_bytes', u'wal_records', u'wal_fpi']
+    # queryid (and querytype) of the synthetic record summing the statements not selected for persistence
+    other_queryid = u'other'
+
+    def __init__(self, columns, epoch, records):
+        # columns: the column names of the (cumulative) records, records: lists in that column order
+        self.columns = columns
+        self.epoch = epoch
+        self.records = records
+        self.position = {}
+        for i, name in enumerate(columns):
+            self.position[name] = i
+        self.keys = [self._getKey(record) for record in records]
+        self.index = {}
+        for i, key in enumerate(self.keys):
+            self.index[key] = i
+        self.counters = np.hstack([self._getMatrix(self.counter_columns), self._getSumsq()])
+        self.latest = self._getMatrix(self.latest_columns)
+        # activity against the last previous snapshot asked for: selection, delta and other records share it
+        self.activity = (None, None)
+
+    def getEpoch(self):
+        return self.epoch
+
+    def getSize(self):
+        return len(self.records)
+
+    def getRecords(self):
+        return self.records
+
+    def getRecordsAt(self, positions):
+        return [self.records[i] for i in positions]
+
+    # activity of one counter since previous, for every row of this snapshot
+    def getActivity(self, previous, name):
+        return self._getActivityMatrix(previous)[:, self.counter_columns.index(name)]
+
+    # compute incremental records (activity since previous) in one batched array operation
+    # statements with no calls since previous produce no record. with no previous snapshot there are no records
+    # positions: optionally restrict the records to these rows of this snapshot
+    def getDeltaRecords(self, previous, positions=None):
+        if previous is None or len(self.records) == 0 or previous.getSize() == 0:
+            return []
+        activity = self._getActivityMatrix(previous)
+        active = activity[:, self.counter_columns.index(u'calls')] > 0
+        if positions is not None:
+            active = active & self._getSelectedMask(positions)
+        rows = np.nonzero(active)[0]
+        values = self._getValues(activity[rows], self.latest[rows])
+        deltarecords = []
+        for j, row in enumerate(rows.tolist()):
+            record = list(self.records[row])
+            for name, column in values.items():
+                if name in self.position:
+                    record[self.position[name]] = column[j]
+            deltarecords.append(record + [values[self.sumsq_column][j]])
+        return deltarecords
+
+    # one synthetic incremental record per (dbid, userid), summing the activity of the active statements
+    # which are not in positions, so that per-database totals of the incremental records stay exact.
+    # min and max are taken over the summed statements; stddev has no meaningful aggregate and is null
+    # (the summed sum of squares keeps the variance of the group exact)
+    def getOtherRecords(self, previous, positions):
+        if previous is None or len(self.records) == 0 or previous.getSize() == 0:
+            return []
+        activity = self._getActivityMatrix(previous)
+        others = (activity[:, self.counter_columns.index(u'calls')] > 0) & ~self._getSelectedMask(positions)
+        rows = np.nonzero(others)[0]
+        if len(rows) == 0:
+            return []
+        groupkeys = [(self.records[row][self.position[u'dbid']], self.records[row][self.position[u'userid']]) for row in rows.tolist()]
+        groups = {}
+        for row, groupkey in zip(rows.tolist(), groupkeys):
+            groups.setdefault(groupkey, row)
+        groupindex = dict([(groupkey, i) for i, groupkey in enumerate(groups)])
+        members = np.fromiter((groupindex[groupkey] for groupkey in groupkeys), dtype=np.int64, count=len(groupkeys))
+        sums = np.zeros((len(groups), activity.shape[1]), dtype=np.float64)
+        np.add.at(sums, members, activity[rows])
+        minimums = np.full((len(groups), len(self.latest_columns)), np.inf)
+        np.minimum.at(minimums, members, self.latest[rows])
+        maximums = np.full((len(groups), len(self.latest_columns)), -np.inf)
+        np.maximum.at(maximums, members, self.latest[rows])
+        latest = np.where(np.array([name.startswith(u'min_') for name in self.latest_columns]), minimums, maximums)
+        values = self._getValues(sums, latest)
+        otherrecords = []
+        for j, row in enumerate(groups.values()):
+            record = list(self.records[row])
+            for name, column in values.items():
+                if name in self.position:
+                    record[self.position[name]] = column[j]
+            record[self.position[u'queryid']] = self.other_queryid
+            record[self.position[u'querytype']] = self.other_queryid
+            record[self.position[u'toplevel']] = True
+            record[self.position[u'stddev_exec_time']] = None
+            record[self.position[u'stddev_plan_time']] = None
+            otherrecords.append(record + [values[self.sumsq_column][j]])
+        return otherrecords
+
+    # records which are new, or whose calls or total_exec_time changed, since previous (capturemode 'full')
+    def getChangedRecords(self, previous):
+        if previous is None or previous.getSize() == 0:
+            return self.records
+        if len(self.records) == 0:
+            return []
+        prevpos = self._getPreviousPositions(previous)
+        matched = prevpos >= 0
+        tracked = [self.counter_columns.index(u'calls'), self.counter_columns.index(u'total_exec_time')]
+        changed = np.ones(len(self.records), dtype=bool)
+        changed[matched] = (self.counters[matched][:, tracked] != previous.counters[prevpos[matched]][:, tracked]).any(axis=1)
+        return [self.records[i] for i in np.nonzero(changed)[0].tolist()]
+
+    # counter activity since previous for every row: the delta where the statement was in previous, the
+    # cumulative values where it is new (every entry is collected, so an absent key is new since previous).
+    # counters move backwards after pg_stat_statements_reset() or entry eviction: the latest cumulative values
+    # are then the activity since the reset
+    def _getActivityMatrix(self, previous):
+        if self.activity[1] is not None and self.activity[0] is previous:
+            return self.activity[1]
+        activity = self.counters.copy()
+        self.activity = (previous, activity)
+        if previous is None or len(self.records) == 0 or previous.getSize() == 0:
+            return activity
+        prevpos = self._getPreviousPositions(previous)
+        matched = np.nonzero(prevpos >= 0)[0]
+        current = self.counters[matched]
+        delta = current - previous.counters[prevpos[matched]]
+        # the derived sum of squares carries rounding error, and does not decide a reset
+        reset = (delta[:, :len(self.counter_columns)] < 0).any(axis=1)
+        delta[reset] = current[reset]
+        activity[matched] = delta
+        return activity
+
+    # report column values from counter activity and latest values: mean_exec_time derived, integer counters rounded.
+    # the sum of squares is at least calls * mean^2 (variance is never negative, whatever the rounding)
+    def _getValues(self, activity, latest):
+        values = {}
+        for i, name in enumerate(self.counter_columns):
+            values[name] = activity[:, i]
+        for i, name in enumerate(self.latest_columns):
+            values[name] = latest[:, i]
+        calls = activity[:, self.counter_columns.index(u'calls')]
+        total = activity[:, self.counter_columns.index(u'total_exec_time')]
+        values[u'mean_exec_time'] = total / calls
+        values[self.sumsq_column] = np.maximum(activity[:, len(self.counter_columns)], total * total / calls)
+        for name in values:
+            if name in self.integer_columns:
+                values[name] = np.rint(values[name]).astype(np.int64).tolist()
+            else:
+                values[name] = values[name].tolist()
+        return values
+
+    def _getSelectedMask(self, positions):
+        selected = np.zeros(len(self.records), dtype=bool)
+        selected[np.asarray(positions, dtype=np.int64)] = True
+        return selected
+
+    # row position of each of this snapshot's keys in previous, -1 where absent
+    def _getPreviousPositions(self, previous):
+        return np.fromiter((previous.index.get(key, -1) for key in self.keys), dtype=np.int64, count=len(self.keys))
+
+    def _getKey(self, record):
+        return (record[self.position[u'userid']], record[self.position[u'dbid']],
+                record[self.position[u'queryid']], record[self.position[u'toplevel']])
+
+    # lifetime sum of squares of each row: calls * (stddev^2 + mean^2)
+    def _getSumsq(self):
+        lifetime = self._getMatrix([u'calls', u'total_exec_time', u'stddev_exec_time'])
+        calls = lifetime[:, 0]
+        mean = np.divide(lifetime[:, 1], calls, out=np.zeros(len(calls)), where=calls > 0)
+        return (calls * (lifetime[:, 2] * lifetime[:, 2] + mean * mean)).reshape(-1, 1)
+
+    def _getMatrix(self, names):
+        positions = [self.position[name] for name in names]
+        matrix = np.zeros((len(self.records), len(positions)), dtype=np.float64)
+        for i, record in enumerate(self.records):
+            matrix[i] = [record[p] if record[p] is not None else 0.0 for p in positions]
+        return matrix
@@ -0,0 +1,83 @@
+import numpy as np
+from postgres_stat_profiler.helpers.sharedslots import sharedslots
+
+# runtime status of each collecting profile, shared between processes in one named shared memory block created
+# by the collector daemon (see helpers/sharedslots.py). each collector writes its own slot after every cycle and
+# every api worker reads it directly, so runtime status never passes through the daemon or the (encrypted) profiles file.
+# each slot has a sequence number, odd while its collector is writing: a read retries until it sees the same
+# even sequence before and after copying the slot
+#
+class statusboard(sharedslots):
+
+    label = u'status'
+    status_bytes = 32
+    error_bytes = 256
+    slot_type = np.dtype([(u'sequence', np.int64), (u'lastcollectepoch', np.float64), (u'lastcollecttime', np.float64),
+                          (u'reportdbstatus', u'S{}'.format(status_bytes)), (u'monitordbstatus', u'S{}'.format(status_bytes)),
+                          (u'lasterror', u'S{}'.format(error_bytes))])
+    read_attempts = 100
+
+    def __init__(self, name=None, create=False):
+        super().__init__(name, create, self.slot_type.itemsize)
+        self.slots = np.ndarray((self.max_slots,), dtype=self.slot_type, buffer=self.shm.buf, offset=self.dataoffset)
+
+    # collector: status after a cycle of the profile in slot. lastcollectepoch, lastcollecttime and lasterror may be None
+    def setStatus(self, slot, reportdbstatus, monitordbstatus, lastcollectepoch, lastcollecttime, lasterror):
+        sequence = self.slots[u'sequence']
+        sequence[slot] += 1
+        self.slots[u'reportdbstatus'][slot] = self._getEncoded(reportdbstatus, self.status_bytes)
+        self.slots[u'monitordbstatus'][slot] = self._getEncoded(monitordbstatus, self.status_bytes)
+        self.slots[u'lastcollectepoch'][slot] = lastcollectepoch or 0
+        self.slots[u'lastcollecttime'][slot] = lastcollecttime or 0
+        self.slots[u'lasterror'][slot] = self._getEncoded(lasterror, self.error_bytes)
+        sequence[slot] += 1
+
+    # api: the profile's status (keyed as the profile's own status properties), None if not reported yet
+    def getStatus(self, name):
+        slot = self.getSlot(name)
+        if slot is None:
+            return None
+        sequence = self.slots[u'sequence']
+        for attempt in range(self.read_attempts):
+            before = int(sequence[slot])
+            if before % 2 == 1:
+                continue
+            entry = self.slots[slot].copy()
+            if int(sequence[slot]) == before:
+                break
+        else:
+            return None
+        if before == 0:
+            return None
+        return {u'reportdbstatus': self._getDecoded(entry[u'reportdbstatus']),
+                u'monitordbstatus': self._getDecoded(entry[u'monitordbstatus']),
+                u'lastcollectepoch': int(entry[u'lastcollectepoch']) or None,
+                u'lastcollecttime': float(entry[u'lastcollecttime']) or None,
+                u'lasterror': self._getDecoded(entry[u'lasterror']) or None}
+
+    def _clearSlot(self, slot):
+        self.slots[slot] = np.zeros((), dtype=self.slot_type)
+
+    def _closeData(self):
+        self.slots = None
+
+    # truncated on a character boundary, so that the stored bytes always decode
+    def _getEncoded(self, value, size):
+        if value is None:
+            return b''
+        encoded = str(value).encode(u'utf-8')[:size]
+        return encoded.decode(u'utf-8', errors=u'ignore').encode(u'utf-8')
+
+    def _getDecoded(self, value):
+        return value.decode(u'utf-8', errors=u'replace')
+
+
+_statusboards = {}
+
+# the status board attached in this process (collector processes inherit the supervisor's attachment)
+def getStatusBoard(name):
+    if name is None:
+        return None
+    if name not in _statusboards:
+        _statusboards[name] = statusboard(name)
+    return _statusboards[name]
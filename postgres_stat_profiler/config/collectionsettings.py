@@ -0,0 +1,125 @@
+import json
+import logging
+
+# per-profile collection settings, held by the profile alongside its connections
+#
+class collectionsettings:
+
+    # intervals (seconds) must divide an hour so that every collection epoch falls on an interval boundary
+    valid_intervals = [5, 10, 15, 20, 30, 60, 120, 300, 600, 900, 1200, 1800, 3600]
+    # pg_stat_statements counters which capturemode 'topn' can rank (and union) statements by
+    valid_rankmetrics = [u'calls', u'total_exec_time', u'rows', u'total_plan_time',
+                         u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                         u'local_blks_read', u'local_blks_written', u'temp_blks_read', u'temp_blks_written',
+                         u'blk_read_time', u'blk_write_time', u'wal_bytes', u'wal_records', u'wal_fpi']
+
+    def __init__(self,data):
+        self.valid = False
+        self.interval = 60
+        self.adaptiveinterval = u'disabled'
+        self.mininterval = 10
+        self.maxinterval = 300
+        self.capturemode = u'topn'
+        self.topn = 100
+        self.rankmetric = u'total_exec_time'
+        self.unionmetrics = []
+        self.coverage = 0.0
+        try:
+           self.valid = self.update(data)
+        except Exception as e:
+           logging.warning('pg-stat-profiler : unexpected collectionsettings error : [{}]'.format(str(e)))
+           self.valid = False
+
+    def getValid(self):
+        return self.valid
+
+    def getInterval(self):
+        return self.interval
+
+    def getAdaptiveInterval(self):
+        return self.adaptiveinterval
+
+    def getMinInterval(self):
+        return self.mininterval
+
+    def getMaxInterval(self):
+        return self.maxinterval
+
+    def getCaptureMode(self):
+        return self.capturemode
+
+    def getTopN(self):
+        return self.topn
+
+    def getRankMetric(self):
+        return self.rankmetric
+
+    def getUnionMetrics(self):
+        return self.unionmetrics
+
+    def getCoverage(self):
+        return self.coverage
+
+    def getAllDetails(self):
+        return self.getApiDetails()
+
+    def getApiDetails(self):
+        try:
+          details = u'"interval": {}, "adaptiveinterval": "{}", "mininterval": {}, "maxinterval": {}, "capturemode": "{}", "topn": {}, "rankmetric": "{}", "unionmetrics": {}, "coverage": {}'.format\
+            (self.interval,self.adaptiveinterval,self.mininterval,self.maxinterval,self.capturemode,self.topn,self.rankmetric,
+             json.dumps(self.unionmetrics),self.coverage)
+          return details
+        except:
+          return u'"error" : "collection settings missing"'
+
+    # returns False (and leaves settings unchanged) if any supplied value is invalid
+    def update(self,data):
+       if not data:
+          return True
+       interval = data.get('interval',self.interval)
+       adaptiveinterval = data.get('adaptiveinterval',self.adaptiveinterval)
+       mininterval = data.get('mininterval',self.mininterval)
+       maxinterval = data.get('maxinterval',self.maxinterval)
+       capturemode = data.get('capturemode',self.capturemode)
+       topn = data.get('topn',self.topn)
+       rankmetric = data.get('rankmetric',self.rankmetric)
+       unionmetrics = data.get('unionmetrics',self.unionmetrics)
+       coverage = data.get('coverage',self.coverage)
+       for value in [interval, mininterval, maxinterval]:
+          if value not in self.valid_intervals:
+             logging.warning(u'pg-stat-profiler : Invalid collection interval [{}], valid intervals are {}'.format(value,self.valid_intervals))
+             return False
+       if adaptiveinterval not in [u'enabled', u'disabled']:
+          return False
+       # topn: top statements by activity (of rankmetric) since the previous cycle. full: every changed entry
+       if capturemode not in [u'topn', u'full']:
+          return False
+       if not isinstance(topn, int) or isinstance(topn, bool) or topn < 1:
+          logging.warning(u'pg-stat-profiler : Invalid topn [{}], must be a positive integer'.format(topn))
+          return False
+       if rankmetric not in self.valid_rankmetrics:
+          logging.warning(u'pg-stat-profiler : Invalid rankmetric [{}], valid metrics are {}'.format(rankmetric,self.valid_rankmetrics))
+          return False
+       if not isinstance(unionmetrics, list) or any([metric not in self.valid_rankmetrics for metric in unionmetrics]):
+          logging.warning(u'pg-stat-profiler : Invalid unionmetrics [{}], valid metrics are {}'.format(unionmetrics,self.valid_rankmetrics))
+          return False
+       # fraction of each metric's total activity to cover (0 : take topn only)
+       if not isinstance(coverage, (int, float)) or isinstance(coverage, bool) or not (0 <= coverage <= 1):
+          logging.warning(u'pg-stat-profiler : Invalid coverage [{}], must be between 0 and 1'.format(coverage))
+          return False
+       if adaptiveinterval == u'enabled' and not (mininterval <= interval <= maxinterval):
+          logging.warning(u'pg-stat-profiler : Collection interval must be within mininterval and maxinterval')
+          return False
+       self.interval = interval
+       self.adaptiveinterval = adaptiveinterval
+       self.mininterval = mininterval
+       self.maxinterval = maxinterval
+       self.capturemode = capturemode
+       self.topn = topn
+       self.rankmetric = rankmetric
+       self.unionmetrics = unionmetrics
+       self.coverage = float(coverage)
+       return True
+
+    def __str__(self):
+        return str(self.__dict__)
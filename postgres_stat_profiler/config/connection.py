@@ -20,7 +20,8 @@ class connection:
                self._setUsernamePassword()
            if 'sslmode' in data:
                self.sslmode = data['sslmode'] 
-               if 'cacert' in data:
+               # 'notsupplied' and 'notapplicable' are how a connection without a cacert is persisted
+               if 'cacert' in data and data['cacert'] not in ['notsupplied', 'notapplicable']:
                    # allow for environment variables in the cacert location
                    self.cacert = os.path.expandvars(data['cacert'])
                    if os.path.isfile(self.cacert):
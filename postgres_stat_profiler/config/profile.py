@@ -1,16 +1,27 @@
+import json
 import logging
 import logging.handlers
 from postgres_stat_profiler.config.connection import connection
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+from postgres_stat_profiler.config.reportsettings import reportsettings
 
 class profile:
+
+  # runtime status properties reported by the collectors
+  status_keys = [u'reportdbstatus', u'monitordbstatus', u'lastcollectepoch', u'lastcollecttime', u'lasterror']
   
   def __init__(self,data):
      self.valid = False
      self.queryencryption = u'disabled'
      self.queryencryptionsecret = u''
+     # reported by the collector after each collection, not persisted
+     self.lastcollectepoch = None
+     self.lastcollecttime = None
+     self.lasterror = None
      if 'name' in data:
         self.name = data['name']
-        if self._setStatuses(data) and self._setConnections(data):
+        if self._setStatuses(data) and self._setConnections(data) and self._setCollectionSettings(data) \
+           and self._setReportSettings(data):
            self.valid = True
      if 'queryencryption' in data and (data['queryencryption'] == u'enabled' or data['queryencryption'] == u'disabled' ) \
      and 'queryencryptionsecret' in data:
@@ -35,9 +46,24 @@ class profile:
      
   def getReportDBconnection(self): 
       return self.report_connection
+
+  def getCollectionSettings(self):
+      return self.collection_settings
+
+  def getReportSettings(self):
+      return self.report_settings
      
   def getValid(self):
      return self.valid
+
+  def getLastCollectEpoch(self):
+     return self.lastcollectepoch
+
+  def getLastCollectTime(self):
+     return self.lastcollecttime
+
+  def getLastError(self):
+     return self.lasterror
   
   def getQueryEncryption(self):
      return self.queryencryption
@@ -48,34 +74,54 @@ class profile:
   # Do not call this method from api handlers. exposes secrets.
   # Use only for storing config persistence into (encrypted) file. 
   def getAllDetails(self):
-     return self._getAllDetails(self.monitored_connection.getAllDetails(),self.report_connection.getAllDetails())
+     return self._getAllDetails(self.monitored_connection.getAllDetails(),self.report_connection.getAllDetails(),\
+                                self.collection_settings.getAllDetails(),self.report_settings.getAllDetails())
   
-  def _getAllDetails(self,monitoredconndetails,reportconndetails):
+  def _getAllDetails(self,monitoredconndetails,reportconndetails,collectiondetails,reportdetails):
      try: 
         return '{{ "name" : "{}", "status": "{}", "queryencryption" : "{}", "queryencryptionsecret" : "{}",\
-           "monitored_connection" : {{{}}}, "monitordbstatus" : "{}", "report_connection" : {{{}}}, "reportdbstatus" : "{}" }}'.\
+           "monitored_connection" : {{{}}}, "monitordbstatus" : "{}", "report_connection" : {{{}}}, "reportdbstatus" : "{}",\
+           "collection_settings" : {{{}}}, "report_settings" : {{{}}} }}'.\
              format(self.name, self.status,self.queryencryption,self.queryencryptionsecret,\
              monitoredconndetails, self.getMonitoredDBstatus(),\
-             reportconndetails, self.getReportDBstatus())
+             reportconndetails, self.getReportDBstatus(), collectiondetails, reportdetails)
      except Exception as e:
         logging.warning('pg-stat-profiler : unexpected profile-getDetails error : [{}]'.format(str(e)))
 
+  # configuration a collector runs with (no statuses): a collector is restarted when this changes
+  # Do not call this method from api handlers. exposes secrets.
+  def getCollectionDetails(self):
+     return u'{}|{}|{}|{}|{}|{}'.format(self.queryencryption,self.queryencryptionsecret,self.monitored_connection.getAllDetails(),
+                                      self.report_connection.getAllDetails(),self.collection_settings.getAllDetails(),
+                                      self.report_settings.getAllDetails())
+
   # Use for api handlers
   # credentials and querysecret not exposed via this method
   def getApiDetails(self):
-     return self._getApiDetails(self.monitored_connection.getApiDetails(),self.report_connection.getApiDetails())
+     return self._getApiDetails(self.monitored_connection.getApiDetails(),self.report_connection.getApiDetails(),\
+                                self.collection_settings.getApiDetails(),self.report_settings.getApiDetails())
 
-  def _getApiDetails(self,monitoredconndetails,reportconndetails):
+  def _getApiDetails(self,monitoredconndetails,reportconndetails,collectiondetails,reportdetails):
      try: 
         return '{{ "name" : "{}", "status": "{}", "queryencryption" : "{}",\
-           "monitored_connection" : {{{}}}, "monitordbstatus": "{}", "report_connection" : {{{}}}, "reportdbstatus": "{}" }}'.\
+           "monitored_connection" : {{{}}}, "monitordbstatus": "{}", "report_connection" : {{{}}}, "reportdbstatus": "{}",\
+           "lastcollecttime": {}, "lasterror": {},\
+           "collection_settings" : {{{}}}, "report_settings" : {{{}}} }}'.\
              format(self.name, self.status,self.queryencryption,\
              monitoredconndetails, self.getMonitoredDBstatus(),\
-             reportconndetails, self.getReportDBstatus())
+             reportconndetails, self.getReportDBstatus(), json.dumps(self.lastcollecttime), json.dumps(self.lasterror),\
+             collectiondetails, reportdetails)
      except Exception as e:
         logging.warning('pg-stat-profiler : unexpected profile-getDetails error : [{}]'.format(str(e)))
      
 
+  # runtime status as reported by the collector (see profilestore.setProfileStatus): never from api data
+  def setRuntimeStatus(self,data):
+     for key in self.status_keys:
+        if key in data:
+           setattr(self,key,data[key])
+
+  # configuration changes, eg from the api: runtime status properties in data are ignored
   def update(self,data):
      try:
            errors = 0
@@ -94,12 +140,14 @@ class profile:
                self.queryencryptionsecret = data['queryencryptionsecret']
              if 'report_connection' in data:
                self.report_connection.update(data['report_connection'])
-             if 'reportdbstatus'in data:
-               self.reportdbstatus = data['reportdbstatus']
              if 'monitored_connection' in data:
                self.monitored_connection.update(data['monitored_connection'])  
-             if 'monitordbstatus'in data:
-               self.monitordbstatus = data['monitordbstatus']
+             if 'collection_settings' in data:
+               if not self.collection_settings.update(data['collection_settings']):
+                  errors = errors + 1
+             if 'report_settings' in data:
+               if not self.report_settings.update(data['report_settings']):
+                  errors = errors + 1
              if errors > 0:
                 return False
              else: 
@@ -123,6 +171,30 @@ class profile:
         logging.warning('pg-stat-profiler : unexpected profile-setConnections error : [{}]'.format(str(e)))
         return False
          
+  def _setCollectionSettings(self,data):
+     try:
+           # optional: profiles created before collection settings existed use the defaults
+           if data and 'collection_settings' in data:
+              self.collection_settings = collectionsettings(data['collection_settings'])
+           else:
+              self.collection_settings = collectionsettings({})
+           return self.collection_settings.getValid()
+     except Exception as e:
+        logging.warning('pg-stat-profiler : unexpected profile-setCollectionSettings error : [{}]'.format(str(e)))
+        return False
+
+  def _setReportSettings(self,data):
+     try:
+           # optional: profiles created before report settings existed use the defaults
+           if data and 'report_settings' in data:
+              self.report_settings = reportsettings(data['report_settings'])
+           else:
+              self.report_settings = reportsettings({})
+           return self.report_settings.getValid()
+     except Exception as e:
+        logging.warning('pg-stat-profiler : unexpected profile-setReportSettings error : [{}]'.format(str(e)))
+        return False
+
   def _setStatuses(self,data):
      try:
            if data and 'status' in data :
@@ -1,12 +1,19 @@
 import os
+import stat
+import fcntl
 import base64
 import json
 import logging
+import threading
+from contextlib import contextmanager
 from cryptography.fernet import Fernet
 from postgres_stat_profiler.config.profile import profile
 
 class profilestore:
 
+    # superseded records tolerated in the profiles file (beyond one per profile) before it is compacted
+    compact_slack = 64
+
     def __init__(self,secret,profilesfilename):
         self.profiles = {}
         self.valid = True
@@ -14,8 +21,22 @@ class profilestore:
         fernetkey = base64.urlsafe_b64encode(secret_bytes.ljust(32)[:32])
         self.fernet = Fernet(fernetkey)
         self.profilesfilename = profilesfilename
+        # api workers: the shared status board collectors report runtime status to (see collection/statusboard.py)
+        self.statusboard = None
+        # records in the profiles file, and records which could not be read (the file is not compacted while
+        # there are any, so that records written with another secret are never discarded)
+        self.filerecords = 0
+        self.unreadable = 0
+        # inode of the profiles file, and the offset up to which its records have been read (see refresh)
+        self.fileinode = None
+        self.fileoffset = 0
+        # threads of this process hold filelock, and the holder of filelock holds the lock file between processes
+        self.filelock = threading.RLock()
+        self.lockfd = None
         if os.path.isfile(self.profilesfilename):
-           self.valid = self._fetchFromProfilesFile()
+           # loaded holding the lock file, so that a last record without a line end is known to be interrupted
+           with self._lockProfilesFile():
+              pass
 
     def hasName(self,name):
         if name in self.profiles:
@@ -34,9 +55,23 @@ class profilestore:
         else:
             return '"error" : Not found"'
         
+    # connection string (with credentials) of the profile's report database, for the report api. None if not found
+    def getReportConnstring(self,name):
+        if name in self.profiles:
+            return self.profiles[name].getReportDBconnection().getPostgresConnectionString()
+        return None
+
+    # epoch of the profile's last collection (None before the first collection since start, or if not found)
+    def getLastCollectEpoch(self,name):
+        if name in self.profiles:
+            self._refreshStatus(name)
+            return self.profiles[name].getLastCollectEpoch()
+        return None
+
     # does not return credentials property
     def getApiDetails(self,name):
         if name in self.profiles:
+            self._refreshStatus(name)
             return self.profiles[name].getApiDetails()
         else:
             return '"error" : Not found"'
@@ -58,10 +93,11 @@ class profilestore:
     def addProfile(self,name,data):
         status = False
         try:
+          with self._lockProfilesFile():
             if name not in self.profiles:
                self.profiles[name] = profile(data)
                if name in self.profiles and self.profiles[name].getValid():
-                     status = self._updateProfilesFile()
+                     status = self._appendProfileRecords([name])
             return status
         except Exception as e:
             logging.warning('pg-stat-profiler : unexpected profile-add error : [{}]'.format(str(e)))
@@ -112,66 +148,218 @@ class profilestore:
     def updateProfile(self,name,data):
         status = False
         try:
+          with self._lockProfilesFile():
             if name in self.profiles:
                result = self.profiles[name].update(data)
                if result == True and name in self.profiles and self.profiles[name].getValid():
-                     status = self._updateProfilesFile()
+                     status = self._appendProfileRecords([name])
             return status
         except Exception as e:
             logging.warning('pg-stat-profiler : unexpected profile-update error : [{}]'.format(str(e)))
             return False
         
+    # runtime status methods - held in memory only, the profiles file is rewritten only by configuration changes
+    def setStatusBoard(self,statusboard):
+        self.statusboard = statusboard
+
+    # status (keyed as the profile's status properties) as reported to the status board
+    def setProfileStatus(self,name,data):
+        try:
+            if name in self.profiles:
+               self.profiles[name].setRuntimeStatus(data)
+               return True
+            return False
+        except Exception as e:
+            logging.warning('pg-stat-profiler : unexpected profile-status error : [{}]'.format(str(e)))
+            return False
+
+    def _refreshStatus(self,name):
+        try:
+            if self.statusboard is not None:
+               status = self.statusboard.getStatus(name)
+               if status is not None:
+                  self.setProfileStatus(name,status)
+        except Exception as e:
+            logging.warning('pg-stat-profiler : unexpected profile-status error : [{}]'.format(str(e)))
+
+    # bulk methods - available via /bulk/profiles
+    # api details (no credentials) of every profile, as objects
+    def getBulkApiDetails(self):
+        details = []
+        for name in list(self.profiles.keys()):
+            self._refreshStatus(name)
+            details.append(json.loads(self.profiles[name].getApiDetails()))
+        return details
+
+    # add or replace each profile supplied (a list, or {"profiles": list}) in one file write.
+    # returns the names imported, and the names (or positions, if unnamed) of the profiles which are invalid
+    def importProfilesApi(self,request):
+        imported = []
+        errors = []
+        try:
+           if request.headers.get('Content-Type'):
+              data = request.get_json()
+              entries = data.get('profiles',[]) if isinstance(data,dict) else data
+              with self._lockProfilesFile():
+                 for i, entry in enumerate(entries):
+                    if not isinstance(entry,dict) or not entry.get('name'):
+                       errors.append(i)
+                       continue
+                    thisprofile = profile(entry)
+                    if thisprofile.getValid():
+                       self.profiles[entry['name']] = thisprofile
+                       imported.append(entry['name'])
+                    else:
+                       errors.append(entry['name'])
+                 if len(imported) > 0 and not self._appendProfileRecords(imported):
+                    return [], errors + imported
+           return imported, errors
+        except Exception as e:
+           logging.warning('pg-stat-profiler : unexpected profile-import error : [{}]'.format(str(e)))
+           return imported, errors + [u'unexpected error']
+
     # delete methods
 
     def deleteProfileApi(self,name):
         status = False
         try:
+          with self._lockProfilesFile():
             if name in self.profiles:
                del self.profiles[name]
-               status = self._updateProfilesFile()
+               status = self._appendProfileRecords([name])
             return status
         except Exception as e:
             logging.warning('pg-stat-profiler : unexpected profile-delete error : [{}]'.format(str(e)))
             return False
         
     # security file persistence methods
-    # idempotent method to rewrite the profiles to persistent file, encrypted by secret
-    def _updateProfilesFile(self):
+    # make the profiles current with the profiles file, reading only the records appended since the last read:
+    # the api workers and the supervisor each call this before using their profiles. the whole file is read again
+    # if it was replaced (compacted) or removed. complete: no write can be in progress (the lock file is held), so
+    # a last record without a line end was interrupted; otherwise it is left to be read once written
+    def refresh(self,complete=False):
+       try:
+          with self.filelock:
+             try:
+                filestat = os.stat(self.profilesfilename)
+             except FileNotFoundError:
+                if self.fileinode is not None:
+                   self._resetProfiles(None)
+                return self.valid
+             if filestat.st_ino != self.fileinode or filestat.st_size < self.fileoffset:
+                self._resetProfiles(filestat.st_ino)
+             if filestat.st_size > self.fileoffset:
+                self._fetchFromProfilesFile(complete)
+       except Exception as e:
+          logging.warning('pg-stat-profiler : unexpected profile-refresh error : [{}]'.format(str(e)))
+       return self.valid
+
+    # serialises changes to the profiles file between the processes and threads sharing it. the profiles are made
+    # current first, so that a change is checked against (and a compaction written from) the latest records
+    @contextmanager
+    def _lockProfilesFile(self):
+       with self.filelock:
+          if self.lockfd is not None:
+             yield
+             return
+          lockfd = os.open(self.profilesfilename + u'.lock', os.O_RDWR | os.O_CREAT, 0o600)
+          try:
+             fcntl.flock(lockfd, fcntl.LOCK_EX)
+             self.lockfd = lockfd
+             self.refresh(True)
+             yield
+          finally:
+             self.lockfd = None
+             os.close(lockfd)
+
+    def _resetProfiles(self,inode):
+       self.profiles = {}
+       self.filerecords = 0
+       self.unreadable = 0
+       self.fileinode = inode
+       self.fileoffset = 0
+       self.valid = True
+
+    # the profiles file is a log of records, one per line, each encrypted by secret: a profile's details, or
+    # the deletion of a profile. the last record of a name wins, so a change appends only that profile's record
+    # (called holding the lock file)
+    def _appendProfileRecords(self,names):
        status = False
-       try: 
-          cf = open(self.profilesfilename,'w')
-          for profile in self.profiles:
-             profilestring = json.dumps(self.profiles[profile].getAllDetails())
-             encryptedstring = self.fernet.encrypt(profilestring.encode('utf-8'))
-             cf.write(encryptedstring.decode('utf-8') + '\n')
-          cf.close()
+       try:
+          records = u''.join([self._getProfileRecord(name) for name in names])
+          with open(self.profilesfilename,'a+b') as cf:
+             # a last record cut short by an interrupted write is ended first, or this record would be joined to it
+             if cf.seek(0,os.SEEK_END) > 0:
+                cf.seek(-1,os.SEEK_END)
+                if cf.read(1) != b'\n':
+                   records = u'\n' + records
+             cf.write(records.encode(u'utf-8'))
+             cf.flush()
+             os.fsync(cf.fileno())
+             # this process's own records need not be read back
+             self.fileinode = os.fstat(cf.fileno()).st_ino
+             self.fileoffset = cf.tell()
+          self.filerecords = self.filerecords + len(names)
+          if self.unreadable == 0 and self.filerecords > 2 * len(self.profiles) + self.compact_slack:
+             self._compactProfilesFile()
           status = True
-       except:
+       except Exception as e:
+          logging.warning('pg-stat-profiler : unexpected profile-file error : [{}]'.format(str(e)))
           status = False
        return status
 
-    def _fetchFromProfilesFile(self):
-       status = False
-       cf = open(self.profilesfilename,'r')
-       cflines = cf.readlines()
+    # rewrite the file with one record per profile, replacing it atomically (called holding the lock file)
+    def _compactProfilesFile(self):
+       tempfilename = self.profilesfilename + u'.tmp'
+       with open(tempfilename,'w') as cf:
+          for name in list(self.profiles.keys()):
+             cf.write(self._getProfileRecord(name))
+          cf.flush()
+          os.fsync(cf.fileno())
+       if os.path.isfile(self.profilesfilename):
+          os.chmod(tempfilename,stat.S_IMODE(os.stat(self.profilesfilename).st_mode))
+       os.replace(tempfilename,self.profilesfilename)
+       filestat = os.stat(self.profilesfilename)
+       self.fileinode = filestat.st_ino
+       self.fileoffset = filestat.st_size
+       self.filerecords = len(self.profiles)
+
+    def _getProfileRecord(self,name):
+       if name in self.profiles:
+          recordstring = json.dumps(self.profiles[name].getAllDetails())
+       else:
+          recordstring = json.dumps({u'name': name, u'deleted': True})
+       return self.fernet.encrypt(recordstring.encode('utf-8')).decode('utf-8') + '\n'
+
+    # one pass over the records from fileoffset, each applied in turn. an unreadable record (eg an interrupted
+    # write) is skipped
+    def _fetchFromProfilesFile(self,complete):
+       with open(self.profilesfilename,'rb') as cf:
+          # replaced since it was checked: read again in full by the next refresh
+          if os.fstat(cf.fileno()).st_ino != self.fileinode:
+             return
+          cf.seek(self.fileoffset)
+          data = cf.read()
+       end = data.rfind(b'\n') + 1
+       if complete and end < len(data):
+          end = len(data)
+       cflines = [cfline for cfline in data[:end].splitlines() if cfline.strip()]
        for cfline in cflines:
           try:
-             result = self.fernet.decrypt(cfline.encode(u"utf-8")).decode("utf-8")
-             if result:
-                try:
-                   # required to convert \' to " characters, required by json.loads
-                   thisprofile = json.loads(json.loads(result).replace("'",'"'))
-                   if thisprofile and 'name' in thisprofile:
-                       status = self.addProfile(thisprofile['name'],thisprofile)
-                except Exception as e:
-                  logging.warning('pg-stat-profiler : unexpected profile-fetch error : [{}]'.format(str(e)))
-                  status = False
-                  break
+             record = json.loads(self.fernet.decrypt(cfline).decode("utf-8"))
+             if isinstance(record,dict) and record.get('deleted'):
+                self.profiles.pop(record['name'],None)
+             else:
+                # required to convert \' to " characters, required by json.loads
+                thisprofile = json.loads(record.replace("'",'"'))
+                if thisprofile and 'name' in thisprofile:
+                   self.profiles[thisprofile['name']] = profile(thisprofile)
           except Exception as e:
-             logging.warning('pg-stat-profiler : unexpected profile-fetch error : [{}]'.format(str(e)))
-             status = False
-             break
-       return status
+             logging.warning('pg-stat-profiler : unexpected profile-fetch error, record skipped : [{}]'.format(str(e)))
+             self.unreadable = self.unreadable + 1
+       self.fileoffset = self.fileoffset + end
+       self.filerecords = self.filerecords + len(cflines)
+       self.valid = self.unreadable == 0 and all([thisprofile.getValid() for thisprofile in self.profiles.values()])
     
     def __str__(self):
         return str(self.__dict__)
@@ -0,0 +1,100 @@
+import logging
+
+# per-profile report database settings, held by the profile alongside its connections.
+# the partition layout is fixed when a report database is initialised: the settings of the profile which
+# initialises it apply to the database (and are recorded in it), later changes apply to new databases only.
+# retention (90 days of minute history by default, expired once rolled up) applies to report databases which
+# record their layout: those initialised before retention existed keep all their history
+#
+class reportsettings:
+
+    valid_partitionintervals = [u'none', u'hourly', u'daily']
+
+    def __init__(self,data):
+        self.valid = False
+        self.partitioninterval = u'daily'
+        self.partitionbyprofile = u'disabled'
+        self.partitionsahead = 2
+        self.retentiondays = 90
+        self.rollups = u'enabled'
+        self.hourlyretentiondays = 365
+        self.dailyretentiondays = 0
+        try:
+           self.valid = self.update(data)
+        except Exception as e:
+           logging.warning('pg-stat-profiler : unexpected reportsettings error : [{}]'.format(str(e)))
+           self.valid = False
+
+    def getValid(self):
+        return self.valid
+
+    def getPartitionInterval(self):
+        return self.partitioninterval
+
+    def getPartitionByProfile(self):
+        return self.partitionbyprofile
+
+    def getPartitionsAhead(self):
+        return self.partitionsahead
+
+    def getRetentionDays(self):
+        return self.retentiondays
+
+    def getRollups(self):
+        return self.rollups
+
+    def getHourlyRetentionDays(self):
+        return self.hourlyretentiondays
+
+    def getDailyRetentionDays(self):
+        return self.dailyretentiondays
+
+    def getAllDetails(self):
+        return self.getApiDetails()
+
+    def getApiDetails(self):
+        try:
+          details = u'"partitioninterval": "{}", "partitionbyprofile": "{}", "partitionsahead": {}, "retentiondays": {}, "rollups": "{}", "hourlyretentiondays": {}, "dailyretentiondays": {}'.format\
+            (self.partitioninterval,self.partitionbyprofile,self.partitionsahead,self.retentiondays,
+             self.rollups,self.hourlyretentiondays,self.dailyretentiondays)
+          return details
+        except:
+          return u'"error" : "report settings missing"'
+
+    # returns False (and leaves settings unchanged) if any supplied value is invalid
+    def update(self,data):
+       if not data:
+          return True
+       partitioninterval = data.get('partitioninterval',self.partitioninterval)
+       partitionbyprofile = data.get('partitionbyprofile',self.partitionbyprofile)
+       partitionsahead = data.get('partitionsahead',self.partitionsahead)
+       retentiondays = data.get('retentiondays',self.retentiondays)
+       rollups = data.get('rollups',self.rollups)
+       hourlyretentiondays = data.get('hourlyretentiondays',self.hourlyretentiondays)
+       dailyretentiondays = data.get('dailyretentiondays',self.dailyretentiondays)
+       if partitioninterval not in self.valid_partitionintervals:
+          logging.warning(u'pg-stat-profiler : Invalid partitioninterval [{}], valid intervals are {}'.format(partitioninterval,self.valid_partitionintervals))
+          return False
+       if partitionbyprofile not in [u'enabled', u'disabled']:
+          return False
+       if not isinstance(partitionsahead, int) or isinstance(partitionsahead, bool) or partitionsahead < 1:
+          logging.warning(u'pg-stat-profiler : Invalid partitionsahead [{}], must be a positive integer'.format(partitionsahead))
+          return False
+       if rollups not in [u'enabled', u'disabled']:
+          return False
+       # 0 : keep all history
+       for days in [retentiondays, hourlyretentiondays, dailyretentiondays]:
+          if not isinstance(days, int) or isinstance(days, bool) or days < 0:
+             logging.warning(u'pg-stat-profiler : Invalid retention [{}], must be 0 or a positive number of days'.format(days))
+             return False
+       self.partitioninterval = partitioninterval
+       self.partitionbyprofile = partitionbyprofile
+       self.partitionsahead = partitionsahead
+       self.retentiondays = retentiondays
+       self.rollups = rollups
+       self.hourlyretentiondays = hourlyretentiondays
+       self.dailyretentiondays = dailyretentiondays
+       return True
+
+    def __str__(self):
+        return str(self.__dict__)
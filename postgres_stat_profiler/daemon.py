@@ -0,0 +1,187 @@
+import sys
+import os
+import fcntl
+import signal
+import logging
+import time
+import multiprocessing
+from postgres_stat_profiler.collection.collectorsupervisor import collectorsupervisor
+from postgres_stat_profiler.collection.statusboard import statusboard
+from postgres_stat_profiler.metrics.metricsblock import metricsblock
+from postgres_stat_profiler.helpers.env_helper import fetch_secbase, fetch_logbase, fetch_secret
+from postgres_stat_profiler.helpers.log_helper import attachQueueHandler, batchedrotatingfilehandler, getLogBatch, \
+     getLogFormatter, getLogQueue, getLogQueueSize, getLogQueuePolicy, getLogFormat, valid_policies
+
+# collector daemon: owns the profile supervisor (and through it every collector process) and the log listener.
+# one daemon runs per install, apart from the api, which any number of wsgi workers may serve (see create_app).
+# the two coordinate through the profiles file (profile changes, notified on the control channel) and the
+# shared status board and metrics block (collector runtime status)
+#
+
+
+# log listener which handles all child process logging to the common log file destination
+# note; logging to same file direct from many child processes is not safe
+# this runs in a child process supervised by check_slavejobs
+# it blocks on the queue while idle, and writes (and flushes) the records queued meanwhile as one batch
+#
+def log_listener(file, queue):
+    listenerlogger = logging.getLogger()
+    h = batchedrotatingfilehandler(file, 'a', 100000000, 10)
+    h.setFormatter(getLogFormatter())
+    # replaces the handler inherited from the main process, which would write each record a second time
+    listenerlogger.handlers = [h]
+    logging.warning('pg_stat-profiler: loglistener started')
+    h.flushBatch()
+    while True:
+        try:
+            for record in getLogBatch(queue):
+                if record is None:  # We send this as a sentinel to tell the listener to quit.
+                    h.flushBatch()
+                    return
+                listenerlogger.handle(record)  # No level or filter logic applied - just do it!
+            h.flushBatch()
+        except Exception as e:
+            print('pg-stat-profiler : loglistener : Unexpected error [{}]'.format(str(e)))
+
+# profile supervisor control function: runs every 10s in the daemon main process
+# returns the log listener and supervisor jobs, restarted if either had stopped
+#
+def check_slavejobs(loggingjob,loggingqueue,logfilename,supervisorjob,supervisor):
+  try:
+   if not supervisorjob.is_alive():
+      supervisorjob.join()
+      supervisorjob = multiprocessing.Process(target=supervisor.run,args=(None,loggingqueue))
+      supervisorjob.start()
+      logging.warning("pg-stat-profiler: supervisor restarted with processid :[{}]".format(str(supervisorjob.pid)))
+   #
+   # restart loglistener if it fails
+   if not loggingjob.is_alive():
+      loggingjob.join()
+      loggingjob = multiprocessing.Process(target=log_listener,args=(logfilename,loggingqueue))
+      loggingjob.start()
+      logging.warning("pg-stat-profiler: loglistener restarted with processid :[{}]".format(str(loggingjob.pid)))
+
+  except Exception as e:
+      logging.warning("pg-stat-profiler: Error checking supervisor and loglistener :[{}]".format(str(e)))
+  return loggingjob, supervisorjob
+
+
+def main():
+
+  # environment checks - fail to start if missing or not expandable
+  installbase, secbase = fetch_secbase()
+  logbase = fetch_logbase()
+  apiconfig_secret = fetch_secret(u'PG_STAT_PROFILER_CONFIG_SECRET')
+
+  # collection mode: 'process' (default) runs one collector process per profile,
+  # 'asyncio' multiplexes many profiles per process on an event loop, over PG_STAT_PROFILER_COLLECTION_WORKERS processes
+  collectionmode = os.getenv(u'PG_STAT_PROFILER_COLLECTION_MODE',u'process').lower().strip()
+  if collectionmode not in [u'process', u'asyncio']:
+      print('pg-stat-profiler: Invalid collection mode, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_COLLECTION_MODE={}]'.format(collectionmode))
+      sys.exit()
+  try:
+      collectionworkers = int(os.getenv(u'PG_STAT_PROFILER_COLLECTION_WORKERS',str(multiprocessing.cpu_count())))
+  except ValueError:
+      print('pg-stat-profiler: Invalid collection workers, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_COLLECTION_WORKERS]')
+      sys.exit()
+
+  # child process logging: bounded queue (full : records dropped, or dropped and summarized), text or json lines
+  try:
+      if getLogQueueSize() < 1:
+          raise ValueError
+  except ValueError:
+      print('pg-stat-profiler: Invalid log queue size, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_LOG_QUEUE_SIZE]')
+      sys.exit()
+  if getLogQueuePolicy() not in valid_policies:
+      print('pg-stat-profiler: Invalid log queue policy, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_LOG_QUEUE_POLICY, valid policies are {}]'.format(valid_policies))
+      sys.exit()
+  if getLogFormat() not in [u'text', u'json']:
+      print('pg-stat-profiler: Invalid log format, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_LOG_FORMAT, valid formats are text, json]')
+      sys.exit()
+
+  # optional local columnar cache of incremental history for offline analysis (see analytics/analyticscache.py)
+  analyticscache = os.getenv(u'PG_STAT_PROFILER_ANALYTICS_CACHE')
+  if analyticscache and not os.path.isdir(os.path.expandvars(analyticscache)):
+      print('pg-stat-profiler: Invalid analytics cache directory, exiting...')
+      print('pg-stat-profiler: Check [Invalid Environment Variable PG_STAT_PROFILER_ANALYTICS_CACHE={}]'.format(analyticscache))
+      sys.exit()
+
+  # one daemon per install: a second would start a second collector for every profile.
+  # the lock is inherited by the daemon's children, so it is held until every collector has stopped
+  try:
+      lockfd = os.open(os.path.join(secbase,u'.pg-stat-profiler.daemon.lock'), os.O_RDWR | os.O_CREAT, 0o600)
+      fcntl.flock(lockfd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+  except OSError as e:
+      print('pg-stat-profiler: Collector daemon already running for this install, exiting... Reason [{}]'.format(str(e)))
+      sys.exit()
+
+  try:
+      # all daemon logging, this main process included, is written by the loggingjob child
+      logfilename = os.path.join(logbase,u'pg-stat-profiler.log')
+      loggingqueue = getLogQueue()
+      attachQueueHandler(loggingqueue)
+      loggingjob = multiprocessing.Process(target=log_listener,args=(logfilename,loggingqueue))
+      loggingjob.start()
+
+      profilesfile = os.path.join(secbase,u'.pg-stat-profiler.prof')
+      controlname = os.path.join(secbase,u'.pg-stat-profiler.ctl')
+
+      # collector metrics, written by the collector processes into a shared memory block read by /metrics
+      try:
+         metricsname = metricsblock(metricsblock.getInstallName(installbase),create=True).getName()
+      except Exception as e:
+         logging.warning('pg-stat-profiler: collector metrics disabled, shared memory unavailable [{}]'.format(str(e)))
+         metricsname = None
+
+      # profile runtime status, written by the collector processes into a shared memory block read by the api
+      try:
+         statusname = statusboard(statusboard.getInstallName(installbase),create=True).getName()
+      except Exception as e:
+         logging.warning('pg-stat-profiler: status board disabled, shared memory unavailable, status not reported [{}]'.format(str(e)))
+         statusname = None
+
+      try:
+         collection_supervisor = collectorsupervisor(apiconfig_secret,profilesfile,collectionmode,collectionworkers,
+                                                     metricsname,statusname,controlname)
+      except Exception as e:
+         print('pg-stat-profiler: Failed to initiate data with secret, exiting... Reason [{}]'.format(str(e)))
+         sys.exit()
+
+      supervisorjob = multiprocessing.Process(target=collection_supervisor.run, args=(None,loggingqueue))
+      supervisorjob.start()
+      logging.warning('pg-stat-profiler: collector daemon started')
+  except Exception as e:
+      logging.warning("pg-stat-profiler: Unexpected Error ["+str(e)+"]")
+      sys.exit()
+
+  jobs = {u'logging': loggingjob, u'supervisor': supervisorjob}
+  daemonpid = os.getpid()
+
+  # stop the supervisor (which stops its collectors), then the log listener once it has written the queued records
+  def stop(signum, frame):
+    if os.getpid() == daemonpid:
+       logging.warning('pg-stat-profiler: collector daemon stopping')
+       jobs[u'supervisor'].terminate()
+       jobs[u'supervisor'].join(10)
+       try:
+          loggingqueue.put(None, timeout=5)
+          jobs[u'logging'].join(5)
+       except Exception:
+          jobs[u'logging'].terminate()
+    sys.exit()
+
+  signal.signal(signal.SIGTERM, stop)
+  signal.signal(signal.SIGINT, stop)
+  while True:
+     time.sleep(10)
+     jobs[u'logging'], jobs[u'supervisor'] = check_slavejobs(jobs[u'logging'],loggingqueue,logfilename,
+                                                              jobs[u'supervisor'],collection_supervisor)
+
+
+if __name__ == "__main__":
+   main()
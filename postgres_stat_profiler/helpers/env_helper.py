@@ -1,4 +1,5 @@
 import os
+import sys
 
 def fetch_env_allow_empty(envname):
 
@@ -7,4 +8,35 @@ def fetch_env_allow_empty(envname):
        value = os.getcwd()
     else:
        value = os.path.expandvars(envresult)
-    return value
\ No newline at end of file
+    return value
+
+# environment checks shared by the api app factory and the collector daemon - fail to start if missing or not expandable
+
+def fetch_secbase():
+
+    installbase = fetch_env_allow_empty(u'PG_STAT_PROFILER_BASE')
+    secbase = os.path.join(installbase,u'postgres_stat_profiler/resources/sec')
+    if not os.path.isdir(secbase):
+       print('pg-stat-profiler: Failed to find security directory, exiting...')
+       print('pg-stat-profiler: Check [Invalid Install base={}]'.format(str(installbase)))
+       print('pg-stat-profiler: Please supply correct environment variable PG_STAT_PROFILER_BASE')
+       sys.exit()
+    return installbase, secbase
+
+def fetch_logbase():
+
+    logbase = fetch_env_allow_empty(u'PG_STAT_PROFILER_LOGBASE')
+    if not os.path.isdir(logbase):
+       print('pg-stat-profiler: Failed to initiate logging, exiting...')
+       print('pg-stat-profiler: Reason [Invalid Environment Variable PG_STAT_PROFILER_LOGBASE={}]'.format(str(logbase)))
+       sys.exit()
+    return logbase
+
+def fetch_secret(envname):
+
+    secret = os.getenv(envname)
+    if not secret:
+       print("pg-stat-profiler: Failed to find secret, exiting...")
+       print("Failed to find environment variable {}".format(envname))
+       sys.exit()
+    return secret
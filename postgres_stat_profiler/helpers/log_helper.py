@@ -0,0 +1,150 @@
+import os
+import json
+import queue
+import logging
+import logging.handlers
+import contextvars
+import multiprocessing
+from datetime import datetime, timezone
+
+# logging pipeline: child processes put records on one bounded queue, read by the log listener process
+# which writes them to the rotating log file in batches, as text or json lines (PG_STAT_PROFILER_LOG_FORMAT)
+
+text_format = '%(asctime)s[%(funcName)-5s] (%(processName)-10s) %(message)s'
+default_queue_size = 10000
+valid_policies = [u'summarize', u'drop']
+batch_size = 500
+
+# profile collected in the current context: the collector process, or the collector's task in a collector group
+currentprofile = contextvars.ContextVar('pg_stat_profiler_profile', default=None)
+
+def setLogProfile(name):
+    currentprofile.set(name)
+
+def getLogQueueSize():
+    return int(os.getenv(u'PG_STAT_PROFILER_LOG_QUEUE_SIZE', str(default_queue_size)))
+
+def getLogQueuePolicy():
+    return os.getenv(u'PG_STAT_PROFILER_LOG_QUEUE_POLICY', u'summarize')
+
+def getLogFormat():
+    return os.getenv(u'PG_STAT_PROFILER_LOG_FORMAT', u'text')
+
+def getLogQueue():
+    return multiprocessing.Queue(maxsize=getLogQueueSize())
+
+def getLogFormatter():
+    if getLogFormat() == u'json':
+        return jsonformatter()
+    return logging.Formatter(text_format)
+
+# child processes: log only via the queue. handlers inherited from the parent process (the api's log file
+# handler, the supervisor's queue handler) are replaced, so that each record is written once
+def attachQueueHandler(loggingqueue):
+    h = boundedqueuehandler(loggingqueue, getLogQueuePolicy())
+    h.addFilter(profilefilter())
+    logging.getLogger().handlers = [h]
+    return h
+
+# log listener: the next batch of records, blocking (without polling) until at least one is available
+def getLogBatch(loggingqueue, size=batch_size):
+    records = [loggingqueue.get()]
+    while len(records) < size:
+        try:
+            records.append(loggingqueue.get_nowait())
+        except queue.Empty:
+            break
+    return records
+
+
+class profilefilter(logging.Filter):
+
+    def filter(self, record):
+        if getattr(record, 'profile', None) is None:
+            record.profile = currentprofile.get()
+        return True
+
+
+# queue handler which never blocks the logging process: when the queue is full the record is dropped and counted.
+# with policy 'summarize' a single record reporting the number dropped is queued once there is room again
+#
+class boundedqueuehandler(logging.handlers.QueueHandler):
+
+    def __init__(self, loggingqueue, policy=u'summarize'):
+        super().__init__(loggingqueue)
+        self.policy = policy
+        # dropped since the last summary, and in total
+        self.dropped = 0
+        self.droppedtotal = 0
+
+    def getDropped(self):
+        return self.droppedtotal
+
+    def enqueue(self, record):
+        if self.dropped > 0 and self.policy == u'summarize' and not self._putSummary():
+            self._drop()
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self._drop()
+
+    def _drop(self):
+        self.dropped = self.dropped + 1
+        self.droppedtotal = self.droppedtotal + 1
+
+    def _putSummary(self):
+        summary = logging.LogRecord(u'pg_stat_profiler', logging.WARNING, __file__, 0,
+                                    'pg-stat-profiler : log queue full : [{}] log records dropped'.format(self.dropped), None, None)
+        summary.dropped = self.dropped
+        summary.profile = currentprofile.get()
+        try:
+            self.queue.put_nowait(self.prepare(summary))
+            self.dropped = 0
+            return True
+        except queue.Full:
+            return False
+
+
+# rotating file handler which leaves flushing to the log listener, once per batch of records
+#
+class batchedrotatingfilehandler(logging.handlers.RotatingFileHandler):
+
+    def __init__(self, *args, **kwargs):
+        self.batching = True
+        super().__init__(*args, **kwargs)
+
+    def flush(self):
+        if not self.batching:
+            super().flush()
+
+    def flushBatch(self):
+        self.batching = False
+        try:
+            super().flush()
+        finally:
+            self.batching = True
+
+    def close(self):
+        self.batching = False
+        super().close()
+
+
+# one json object per line, with the profile (if any) the record was logged for
+#
+class jsonformatter(logging.Formatter):
+
+    def format(self, record):
+        entry = {u'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec=u'milliseconds'),
+                 u'level': record.levelname,
+                 u'process': record.processName,
+                 u'function': record.funcName,
+                 u'profile': getattr(record, 'profile', None),
+                 u'message': record.getMessage()}
+        if getattr(record, 'dropped', None) is not None:
+            entry[u'dropped'] = record.dropped
+        if record.exc_info:
+            entry[u'exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry[u'exception'] = record.exc_text
+        return json.dumps(entry)
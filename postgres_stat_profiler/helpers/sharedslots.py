@@ -0,0 +1,131 @@
+import os
+import uuid
+import hashlib
+import logging
+import numpy as np
+from multiprocessing import shared_memory, resource_tracker
+
+# named shared memory block of per-profile slots, created by the collector daemon and attached by name in the
+# supervisor, collector and api worker processes. the supervisor claims a slot for a profile by writing the profile
+# name into the slot's name row; the slot's data (slotbytes per slot, after all the name rows) is left to subclasses.
+# a name longer than a name row is stored as its prefix and a hash of the whole name, so that two long names
+# with the same prefix have their own slots
+# a block named for the install (see getInstallName) outlives the daemon: a restarted daemon attaches it again,
+# so api workers attached to it keep reading the same block
+#
+class sharedslots:
+
+    max_slots = 1024
+    name_bytes = 128
+    hash_chars = 16
+    # prefix of the block name, and label in log messages
+    label = u'slots'
+
+    # create: create the block, or (if named) attach the block of that name if it exists and is large enough.
+    # only a block created with a generated name is removed by close
+    def __init__(self, name, create, slotbytes):
+        namesize = self.max_slots * self.name_bytes
+        size = namesize + self.max_slots * slotbytes
+        self.creator = create and name is None
+        if self.creator:
+            self.shm = self._createBlock(u'pg_stat_profiler_{}_{}_{}'.format(self.label,os.getpid(),uuid.uuid4().hex[:8]), size)
+        elif create:
+            try:
+                self.shm = self._createBlock(name, size)
+            except FileExistsError:
+                self.shm = shared_memory.SharedMemory(name=name)
+                if self.shm.size < size:
+                    logging.warning('pg-stat-profiler : {} : replacing undersized shared memory block [{}]'.format(self.label,name))
+                    self.shm.unlink()
+                    self.shm.close()
+                    self.shm = self._createBlock(name, size)
+            self._untrack()
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self._untrack()
+        # offset of the slot data in the block
+        self.dataoffset = namesize
+        self.names = np.ndarray((self.max_slots, self.name_bytes), dtype=np.uint8, buffer=self.shm.buf)
+
+    # block name for the install at installbase: the daemon and the api workers of one install share it
+    @classmethod
+    def getInstallName(cls, installbase):
+        return u'pg_stat_profiler_{}_{}'.format(cls.label,hashlib.sha1(os.path.realpath(installbase).encode(u'utf-8')).hexdigest()[:12])
+
+    def getName(self):
+        return self.shm.name
+
+    # supervisor: the slot of profile name, claiming (and clearing) a free slot if it has none. None if all are in use
+    def claimSlot(self, name):
+        slot = self.getSlot(name)
+        if slot is not None:
+            return slot
+        free = np.nonzero(self.names[:, 0] == 0)[0]
+        if len(free) == 0:
+            logging.warning('pg-stat-profiler : {} : no free slot for profile [{}]'.format(self.label,name))
+            return None
+        slot = int(free[0])
+        self._clearSlot(slot)
+        encoded = self._getEncodedName(name)
+        self.names[slot, :len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        return slot
+
+    def releaseSlot(self, name):
+        slot = self.getSlot(name)
+        if slot is not None:
+            self.names[slot] = 0
+            self._clearSlot(slot)
+
+    def getSlot(self, name):
+        encoded = self._getEncodedName(name)
+        row = np.zeros(self.name_bytes, dtype=np.uint8)
+        row[:len(encoded)] = np.frombuffer(encoded, dtype=np.uint8)
+        matches = np.nonzero((self.names == row).all(axis=1))[0]
+        return int(matches[0]) if len(matches) > 0 else None
+
+    # release the slots of every profile not in names
+    def releaseOtherSlots(self, names):
+        kept = set([self._getEncodedName(name) for name in names])
+        for slot in np.nonzero(self.names[:, 0] != 0)[0].tolist():
+            if self.names[slot].tobytes().rstrip(b'\x00') not in kept:
+                self.names[slot] = 0
+                self._clearSlot(slot)
+
+    # (slot, profile name) of every claimed slot. a long name is returned as stored: its prefix and hash
+    def getClaimedSlots(self):
+        return [(slot, self.names[slot].tobytes().rstrip(b'\x00').decode(u'utf-8', errors=u'replace'))
+                for slot in np.nonzero(self.names[:, 0] != 0)[0].tolist()]
+
+    def close(self):
+        self.names = None
+        self._closeData()
+        self.shm.close()
+        if self.creator:
+            self.shm.unlink()
+
+    def _createBlock(self, name, size):
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        shm.buf[:size] = bytes(size)
+        return shm
+
+    # the resource tracker of a process which attaches (or creates) a lasting block would remove the block when the
+    # process exits, under the other processes still using it
+    def _untrack(self):
+        try:
+            resource_tracker.unregister(self.shm._name, u'shared_memory')
+        except Exception as e:
+            logging.warning('pg-stat-profiler : {} : shared memory tracking error [{}]'.format(self.label,str(e)))
+
+    def _clearSlot(self, slot):
+        pass
+
+    # release the subclass's views of the block: the block cannot close while they are held
+    def _closeData(self):
+        pass
+
+    def _getEncodedName(self, name):
+        encoded = name.encode(u'utf-8')
+        if len(encoded) <= self.name_bytes:
+            return encoded
+        prefix = encoded[:self.name_bytes - self.hash_chars - 1].decode(u'utf-8', errors=u'ignore').encode(u'utf-8')
+        return prefix + b'~' + hashlib.sha1(encoded).hexdigest()[:self.hash_chars].encode(u'ascii')
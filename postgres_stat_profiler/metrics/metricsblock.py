@@ -0,0 +1,75 @@
+import numpy as np
+from postgres_stat_profiler.collection.phasetimer import phasetimer
+from postgres_stat_profiler.helpers.sharedslots import sharedslots
+
+# collector metrics shared between processes in one named shared memory block, created by the collector daemon.
+# the supervisor claims a slot per collecting profile (see helpers/sharedslots.py) and each
+# collector process (or collector group task) writes its own slot's values after every collection cycle.
+# each api worker reads every slot for /metrics. writes and reads are not synchronised: each value is an aligned
+# float64, but a read may mix values of two consecutive cycles of a profile
+#
+class metricsblock(sharedslots):
+
+    label = u'metrics'
+    # per slot values: counters (_total), then gauges, then the sum and last value of each collection phase
+    fields = [u'collections_total', u'failures_total', u'rows_collected_total', u'rows_persisted_total',
+              u'consecutive_failures', u'last_rows_collected', u'last_success_timestamp', u'last_collect_epoch',
+              u'schedule_drift_seconds', u'interval_seconds']
+    phase_fields = [u'phase_seconds_sum', u'phase_seconds_last']
+
+    def __init__(self, name=None, create=False):
+        self.phases = phasetimer.phases
+        self.position = dict([(field, i) for i, field in enumerate(self.fields)])
+        self.width = len(self.fields) + len(self.phase_fields) * len(self.phases)
+        super().__init__(name, create, self.width * 8)
+        self.values = np.ndarray((self.max_slots, self.width), dtype=np.float64, buffer=self.shm.buf, offset=self.dataoffset)
+
+    # collector: one collection cycle of the profile in slot
+    def recordCollection(self, slot, success, interval, drift, phasetimes, rowscollected, rowspersisted, epoch, now):
+        values = self.values[slot]
+        values[self.position[u'collections_total']] += 1
+        values[self.position[u'interval_seconds']] = interval
+        values[self.position[u'schedule_drift_seconds']] = drift
+        if success:
+            values[self.position[u'consecutive_failures']] = 0
+            values[self.position[u'rows_collected_total']] += rowscollected
+            values[self.position[u'rows_persisted_total']] += rowspersisted
+            values[self.position[u'last_rows_collected']] = rowscollected
+            values[self.position[u'last_success_timestamp']] = now
+            values[self.position[u'last_collect_epoch']] = epoch
+        else:
+            values[self.position[u'failures_total']] += 1
+            values[self.position[u'consecutive_failures']] += 1
+        for i, phase in enumerate(self.phases):
+            if phase in phasetimes:
+                values[len(self.fields) + i] += phasetimes[phase]
+                values[len(self.fields) + len(self.phases) + i] = phasetimes[phase]
+
+    # api: (profile name, {field: value}, {phase: (sum, last)}) for every claimed slot
+    def getSnapshot(self):
+        values = self.values.copy()
+        snapshot = []
+        for slot, name in self.getClaimedSlots():
+            fields = dict([(field, float(values[slot, i])) for i, field in enumerate(self.fields)])
+            phases = dict([(phase, (float(values[slot, len(self.fields) + i]),
+                                    float(values[slot, len(self.fields) + len(self.phases) + i])))
+                           for i, phase in enumerate(self.phases)])
+            snapshot.append((name, fields, phases))
+        return snapshot
+
+    def _clearSlot(self, slot):
+        self.values[slot] = 0.0
+
+    def _closeData(self):
+        self.values = None
+
+
+_metricsblocks = {}
+
+# the metrics block attached in this process (collector processes inherit the supervisor's attachment)
+def getMetricsBlock(name):
+    if name is None:
+        return None
+    if name not in _metricsblocks:
+        _metricsblocks[name] = metricsblock(name)
+    return _metricsblocks[name]
@@ -0,0 +1,58 @@
+# OpenMetrics text exposition of the collector metrics (see metricsblock.getSnapshot), one series per profile
+#
+class openmetrics:
+
+    content_type = u'application/openmetrics-text; version=1.0.0; charset=utf-8'
+    prefix = u'pg_stat_profiler_'
+    # (metric family, type, help, metricsblock field)
+    families = [(u'collections', u'counter', u'Collection cycles attempted', u'collections_total'),
+                (u'collection_failures', u'counter', u'Collection cycles which failed', u'failures_total'),
+                (u'rows_collected', u'counter', u'pg_stat_statements rows read', u'rows_collected_total'),
+                (u'rows_persisted', u'counter', u'Rows written to the report tables', u'rows_persisted_total'),
+                (u'consecutive_failures', u'gauge', u'Collection cycles failed since the last success', u'consecutive_failures'),
+                (u'last_rows_collected', u'gauge', u'pg_stat_statements rows read by the last successful collection', u'last_rows_collected'),
+                (u'last_success_timestamp_seconds', u'gauge', u'Time of the last successful collection', u'last_success_timestamp'),
+                (u'last_collect_epoch', u'gauge', u'Collection epoch (interval boundary) of the last successful collection', u'last_collect_epoch'),
+                (u'schedule_drift_seconds', u'gauge', u'Start of the last collection after its interval boundary', u'schedule_drift_seconds'),
+                (u'collection_interval_seconds', u'gauge', u'Current collection interval', u'interval_seconds')]
+
+    def getText(self, snapshot, now):
+        lines = []
+        for family, metrictype, description, field in self.families:
+            lines = lines + self._getHeader(family, metrictype, description)
+            suffix = u'_total' if metrictype == u'counter' else u''
+            for name, fields, phases in snapshot:
+                lines.append(self._getSample(family + suffix, {u'profile': name}, fields[field]))
+        # lag: what to alert on before gaps show in the report data
+        lines = lines + self._getHeader(u'collection_lag_seconds', u'gauge', u'Time since the last successful collection')
+        for name, fields, phases in snapshot:
+            if fields[u'last_success_timestamp'] > 0:
+                lines.append(self._getSample(u'collection_lag_seconds', {u'profile': name}, now - fields[u'last_success_timestamp']))
+        lines = lines + self._getHeader(u'collect_phase_seconds', u'summary', u'Duration of each phase of successful collections')
+        for name, fields, phases in snapshot:
+            successes = fields[u'collections_total'] - fields[u'failures_total']
+            for phase, (total, last) in phases.items():
+                labels = {u'profile': name, u'phase': phase}
+                lines.append(self._getSample(u'collect_phase_seconds_sum', labels, total))
+                lines.append(self._getSample(u'collect_phase_seconds_count', labels, successes))
+        lines = lines + self._getHeader(u'collect_phase_last_seconds', u'gauge', u'Duration of each phase of the last successful collection')
+        for name, fields, phases in snapshot:
+            for phase, (total, last) in phases.items():
+                lines.append(self._getSample(u'collect_phase_last_seconds', {u'profile': name, u'phase': phase}, last))
+        lines.append(u'# EOF')
+        return u'\n'.join(lines) + u'\n'
+
+    def _getHeader(self, family, metrictype, description):
+        return [u'# TYPE {}{} {}'.format(self.prefix, family, metrictype),
+                u'# HELP {}{} {}'.format(self.prefix, family, description)]
+
+    def _getSample(self, metric, labels, value):
+        labeltext = u','.join([u'{}="{}"'.format(label, self._getEscaped(labelvalue)) for label, labelvalue in labels.items()])
+        if float(value).is_integer():
+            valuetext = str(int(value))
+        else:
+            valuetext = repr(float(value))
+        return u'{}{}{{{}}} {}'.format(self.prefix, metric, labeltext, valuetext)
+
+    def _getEscaped(self, value):
+        return value.replace(u'\\', u'\\\\').replace(u'"', u'\\"').replace(u'\n', u'\\n')
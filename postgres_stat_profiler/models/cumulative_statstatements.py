@@ -1,16 +1,18 @@
 
 import logging
-from cryptography.fernet import Fernet
 
 class cumulative_statstatements:
 
-    def __init__(self):
+    # partitionclause: eg PARTITION BY RANGE (result_epoch), applied to the table when the report database is initialised
+    def __init__(self,partitionclause=u''):
+        self.partitionclause = partitionclause
         self.create_tables = []
         self._getTableCreateCommands()
         self.create_indexes = []
         self._getIndexCreateCommands()
         self._getCollectQuery()
         self._getInsertQuery()
+        self._getCopyQuery()
        
     def getCreateTables(self):
         return self.create_tables
@@ -18,13 +20,31 @@ class cumulative_statstatements:
     def getCreateIndexes(self):
         return self.create_indexes
     
+    # every entry is read: the statements to persist are selected by the collector, which holds the previous snapshot
     def getCollectQuery(self):
         return self.collectquery
     
     def getInsertQuery(self):
         return self.insertquery
+
+    def getCopyQuery(self):
+        return self.copyquery
+
+    # the same copy in text format, the fallback when binary copy fails
+    def getTextCopyQuery(self):
+        return self.textcopyquery
+
+    def getCopyTypes(self):
+        return self.copytypes
+
+    def getColumns(self):
+        return self.columns
     
-    def getInsertRecord(self,name,recordtime,recordepoch,queryenc,queryfernet,row):
+    def getQueryType(self,query):
+        return self._getQueryType(query)
+
+    # querytype may be supplied by the caller (eg from the collector's query attribute cache)
+    def getInsertRecord(self,name,recordtime,recordepoch,row,querytype=None):
         ir = {}
         ir['profilename'] = name
         ir['result_time'] = recordtime
@@ -33,13 +53,10 @@ class cumulative_statstatements:
         ir['dbname'] = row['dbname']
         ir['dbid'] = row['dbid']
         ir['userid'] = row['userid']
-        ir['querytype'] = self._getQueryType(row['query'])
-        ir['queryid'] = row['queryid']
-        if queryenc == u'enabled':
-          encryptedstring = queryfernet.encrypt(row['query'].encode('utf-8'))
-          ir['query'] = encryptedstring.decode('utf-8')
-        else:
-          ir['query'] = row['query']
+        ir['querytype'] = querytype if querytype is not None else self._getQueryType(row['query'])
+        # queryid is bigint in pg_stat_statements and text in the report tables; binary copy needs the exact type
+        # the query text itself is held once in the query text dictionary (querytext_statstatements)
+        ir['queryid'] = str(row['queryid']) if row['queryid'] is not None else None
         ir['toplevel'] = row['toplevel']
         ir['calls'] = row['calls']
         ir['total_exec_time'] = row['total_exec_time']
@@ -107,7 +124,6 @@ class cumulative_statstatements:
                 userid oid,
                 querytype text,
                 queryid text,
-                query text,
                 toplevel boolean,
                 calls bigint,
                 total_exec_time double precision,
@@ -138,10 +154,22 @@ class cumulative_statstatements:
                 wal_fpi bigint
             )
         """
+        create = create.rstrip() + u' ' + self.partitionclause
         self.create_tables.append(create)
 
+    # created on the (possibly partitioned) table, so also on each partition
     def _getIndexCreateCommands(self):
-        pass
+        profile_epoch = \
+        u"""CREATE INDEX IF NOT EXISTS cumulative_result_pg_stat_statements_profile_epoch_idx
+            ON postgres_stat_profiler.cumulative_result_pg_stat_statements (profilename, result_epoch)
+        """
+        self.create_indexes.append(profile_epoch)
+
+        statement_epoch = \
+        u"""CREATE INDEX IF NOT EXISTS cumulative_result_pg_stat_statements_statement_epoch_idx
+            ON postgres_stat_profiler.cumulative_result_pg_stat_statements (profilename, dbid, userid, queryid, result_epoch)
+        """
+        self.create_indexes.append(statement_epoch)
 
     def _getCollectQuery(self):
         self.collectquery = """
@@ -182,7 +210,6 @@ class cumulative_statstatements:
                 pss.wal_fpi as wal_fpi
          from pg_stat_statements pss, pg_catalog.pg_user pu, pg_catalog.pg_database pd 
          WHERE pss.userid=pu.usesysid AND pss.dbid = pd.oid 
-         order by total_exec_time desc limit 100
         """
 
     def _getInsertQuery(self):
@@ -197,7 +224,6 @@ class cumulative_statstatements:
                 userid,
                 querytype,
                 queryid,
-                query,
                 toplevel,
                 calls,
                 total_exec_time,
@@ -230,6 +256,28 @@ class cumulative_statstatements:
                 %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
                 %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
                 %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
-                %s,%s,%s,%s,%s,%s,%s,%s
+                %s,%s,%s,%s,%s,%s,%s
             )
-        """
\ No newline at end of file
+        """
+    # COPY ... FROM STDIN (binary) streams a whole collection in one statement rather than one INSERT round trip per row
+    # column order and types match getInsertRecord; types are required by binary copy
+    def _getCopyQuery(self):
+        columns = [(u'profilename', u'text'), (u'result_time', u'timestamp'), (u'result_epoch', u'int8'),
+                   (u'username', u'text'), (u'dbname', u'text'), (u'dbid', u'oid'), (u'userid', u'oid'),
+                   (u'querytype', u'text'), (u'queryid', u'text'), (u'toplevel', u'bool'),
+                   (u'calls', u'int8'), (u'total_exec_time', u'float8'), (u'min_exec_time', u'float8'),
+                   (u'max_exec_time', u'float8'), (u'mean_exec_time', u'float8'), (u'stddev_exec_time', u'float8'),
+                   (u'rows', u'int8'), (u'plans', u'int8'), (u'total_plan_time', u'float8'), (u'min_plan_time', u'float8'),
+                   (u'max_plan_time', u'float8'), (u'stddev_plan_time', u'float8'),
+                   (u'shared_blks_hit', u'int8'), (u'shared_blks_read', u'int8'), (u'shared_blks_dirtied', u'int8'),
+                   (u'shared_blks_written', u'int8'), (u'local_blks_hit', u'int8'), (u'local_blks_read', u'int8'),
+                   (u'local_blks_dirtied', u'int8'), (u'local_blks_written', u'int8'),
+                   (u'temp_blks_read', u'int8'), (u'temp_blks_written', u'int8'),
+                   (u'blk_read_time', u'float8'), (u'blk_write_time', u'float8'),
+                   (u'wal_bytes', u'numeric'), (u'wal_records', u'int8'), (u'wal_fpi', u'int8')]
+        self.columns = [c[0] for c in columns]
+        self.copytypes = [c[1] for c in columns]
+        self.copyquery = u'COPY postgres_stat_profiler.cumulative_result_pg_stat_statements ({}) FROM STDIN (FORMAT BINARY)'.format(
+                   u', '.join([c[0] for c in columns]))
+        self.textcopyquery = u'COPY postgres_stat_profiler.cumulative_result_pg_stat_statements ({}) FROM STDIN (FORMAT TEXT)'.format(
+                   u', '.join([c[0] for c in columns]))
@@ -2,12 +2,17 @@
 
 class incremental_statstatements:
 
-    def __init__(self):
+    # partitionclause: eg PARTITION BY RANGE (result_epoch), applied to the table when the report database is initialised
+    def __init__(self,partitionclause=u''):
+        self.partitionclause = partitionclause
         self.create_tables = []
         self._getTableCreateCommands()
         self.create_indexes = []
         self._getIndexCreateCommands()
+        self._getUpgradeCommands()
+        self._getCollectQuery()
         self._getInsertQuery()
+        self._getCopyQuery()
         
        
     def getCreateTables(self):
@@ -15,13 +20,31 @@ class incremental_statstatements:
     
     def getCreateIndexes(self):
         return self.create_indexes
+
+    # columns added after report databases were first initialised
+    def getUpgradeCommands(self):
+        return self.upgrade_commands
     
-    def getCollectQuery(self,name):
-        self._getCollectQuery(name)
+    # the latest two snapshots of one profile, via snapshot_epochs. parameters: profilename, interval (the
+    # largest gap between the snapshots for their difference to be taken as the activity of one interval)
+    def getCollectQuery(self):
         return self.collectquery
     
     def getInsertQuery(self): 
         return self.insertquery
+
+    def getCopyQuery(self):
+        return self.copyquery
+
+    # the same copy in text format, the fallback when binary copy fails
+    def getTextCopyQuery(self):
+        return self.textcopyquery
+
+    def getCopyTypes(self):
+        return self.copytypes
+
+    def getColumns(self):
+        return self.columns
     
     def getInsertRecord(self,row):
         ir = {}
@@ -34,7 +57,6 @@ class incremental_statstatements:
         ir['userid'] = row['userid']
         ir['querytype'] = row['querytype']
         ir['queryid'] = row['queryid']
-        ir['query'] = row['query']
         ir['toplevel'] = row['toplevel']
         ir['calls'] = row['calls']
         ir['total_exec_time'] = row['total_exec_time']
@@ -63,6 +85,7 @@ class incremental_statstatements:
         ir['wal_bytes'] = row['wal_bytes']
         ir['wal_records'] = row['wal_records']
         ir['wal_fpi'] = row['wal_fpi']
+        ir['sumsq_exec_time'] = row['sumsq_exec_time']
         irlist = list(ir.values())
         return irlist
 
@@ -82,7 +105,6 @@ class incremental_statstatements:
                 userid oid,
                 querytype text,
                 queryid text,
-                query text,
                 toplevel boolean,
                 calls bigint,
                 total_exec_time double precision,
@@ -110,15 +132,35 @@ class incremental_statstatements:
                 blk_write_time double precision,
                 wal_bytes numeric,
                 wal_records bigint,
-                wal_fpi bigint
+                wal_fpi bigint,
+                sumsq_exec_time double precision
             )
         """
+        create = create.rstrip() + u' ' + self.partitionclause
         self.create_tables.append(create)
 
+    # sumsq_exec_time: the sum of squared execution times of the interval, which makes the variance mergeable
+    # (see rollup_statstatements). null in rows collected before it was added
+    def _getUpgradeCommands(self):
+        self.upgrade_commands = [u"""ALTER TABLE postgres_stat_profiler.incremental_result_pg_stat_statements
+            ADD COLUMN IF NOT EXISTS sumsq_exec_time double precision
+        """]
+
+    # created on the (possibly partitioned) table, so also on each partition
     def _getIndexCreateCommands(self):
-        pass
+        profile_epoch = \
+        u"""CREATE INDEX IF NOT EXISTS incremental_result_pg_stat_statements_profile_epoch_idx
+            ON postgres_stat_profiler.incremental_result_pg_stat_statements (profilename, result_epoch)
+        """
+        self.create_indexes.append(profile_epoch)
+
+        statement_epoch = \
+        u"""CREATE INDEX IF NOT EXISTS incremental_result_pg_stat_statements_statement_epoch_idx
+            ON postgres_stat_profiler.incremental_result_pg_stat_statements (profilename, dbid, userid, queryid, result_epoch)
+        """
+        self.create_indexes.append(statement_epoch)
 
-    def _getCollectQuery(self,name):
+    def _getCollectQuery(self):
         self.collectquery = """
         SELECT 
         latest.profilename as profilename,
@@ -130,7 +172,6 @@ class incremental_statstatements:
 	    latest.userid as userid,
         latest.querytype as querytype,
 	    latest.queryid as queryid,
-        latest.query as query,
         latest.toplevel as toplevel,
         latest.calls-previous.calls as calls,
         latest.total_exec_time-previous.total_exec_time as total_exec_time,
@@ -158,15 +199,20 @@ class incremental_statstatements:
         latest.blk_write_time-previous.blk_write_time as blk_write_time,
         latest.wal_bytes-previous.wal_bytes as wal_bytes,
         latest.wal_records-previous.wal_records as wal_records,
-        latest.wal_fpi-previous.wal_fpi as wal_fpi
-	    FROM
-        (select * from postgres_stat_profiler.cumulative_result_pg_stat_statements where result_epoch in 
-        (select max(result_epoch) from postgres_stat_profiler.cumulative_result_pg_stat_statements)) latest,
-        (select * from postgres_stat_profiler.cumulative_result_pg_stat_statements where result_epoch in 
-        (select max(result_epoch)-60 from postgres_stat_profiler.cumulative_result_pg_stat_statements)) previous
-        where latest.profilename = '{}' and 
-        (previous.userid = latest.userid and previous.dbid = latest.dbid and previous.queryid = latest.queryid)
-        """.format(name)
+        latest.wal_fpi-previous.wal_fpi as wal_fpi,
+        greatest(latest.calls*(coalesce(latest.stddev_exec_time,0)^2 + (latest.total_exec_time/latest.calls)^2)
+                 - previous.calls*(coalesce(previous.stddev_exec_time,0)^2 + (previous.total_exec_time/greatest(previous.calls,1))^2),
+                 (latest.total_exec_time-previous.total_exec_time)^2/(latest.calls-previous.calls)) as sumsq_exec_time
+        FROM postgres_stat_profiler.snapshot_epochs e
+        JOIN postgres_stat_profiler.cumulative_result_pg_stat_statements latest
+             ON latest.profilename = e.profilename AND latest.result_epoch = e.latest_epoch
+        JOIN postgres_stat_profiler.cumulative_result_pg_stat_statements previous
+             ON previous.profilename = e.profilename AND previous.result_epoch = e.previous_epoch
+             AND previous.dbid = latest.dbid AND previous.userid = latest.userid
+             AND previous.queryid = latest.queryid AND previous.toplevel = latest.toplevel
+        WHERE e.profilename = %s AND e.latest_epoch - e.previous_epoch <= %s
+        AND latest.calls > previous.calls
+        """
 
     def _getInsertQuery(self):
          self.insertquery = """
@@ -180,7 +226,6 @@ class incremental_statstatements:
                 userid,
                 querytype,
                 queryid,
-                query,
                 toplevel,
                 calls,
                 total_exec_time,
@@ -208,7 +253,8 @@ class incremental_statstatements:
                 blk_write_time,
                 wal_bytes,
                 wal_records,
-                wal_fpi
+                wal_fpi,
+                sumsq_exec_time
             ) VALUES (
                 %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
                 %s,%s,%s,%s,%s,%s,%s,%s,%s,%s,
@@ -216,3 +262,27 @@ class incremental_statstatements:
                 %s,%s,%s,%s,%s,%s,%s,%s
             )
         """
+
+    # COPY ... FROM STDIN (binary) streams a whole collection in one statement rather than one INSERT round trip per row
+    # column order and types match getInsertRecord; types are required by binary copy
+    def _getCopyQuery(self):
+        columns = [(u'profilename', u'text'), (u'result_time', u'timestamp'), (u'result_epoch', u'int8'),
+                   (u'username', u'text'), (u'dbname', u'text'), (u'dbid', u'oid'), (u'userid', u'oid'),
+                   (u'querytype', u'text'), (u'queryid', u'text'), (u'toplevel', u'bool'),
+                   (u'calls', u'int8'), (u'total_exec_time', u'float8'), (u'min_exec_time', u'float8'),
+                   (u'max_exec_time', u'float8'), (u'mean_exec_time', u'float8'), (u'stddev_exec_time', u'float8'),
+                   (u'rows', u'int8'), (u'plans', u'int8'), (u'total_plan_time', u'float8'), (u'min_plan_time', u'float8'),
+                   (u'max_plan_time', u'float8'), (u'stddev_plan_time', u'float8'),
+                   (u'shared_blks_hit', u'int8'), (u'shared_blks_read', u'int8'), (u'shared_blks_dirtied', u'int8'),
+                   (u'shared_blks_written', u'int8'), (u'local_blks_hit', u'int8'), (u'local_blks_read', u'int8'),
+                   (u'local_blks_dirtied', u'int8'), (u'local_blks_written', u'int8'),
+                   (u'temp_blks_read', u'int8'), (u'temp_blks_written', u'int8'),
+                   (u'blk_read_time', u'float8'), (u'blk_write_time', u'float8'),
+                   (u'wal_bytes', u'numeric'), (u'wal_records', u'int8'), (u'wal_fpi', u'int8'),
+                   (u'sumsq_exec_time', u'float8')]
+        self.columns = [c[0] for c in columns]
+        self.copytypes = [c[1] for c in columns]
+        self.copyquery = u'COPY postgres_stat_profiler.incremental_result_pg_stat_statements ({}) FROM STDIN (FORMAT BINARY)'.format(
+                   u', '.join([c[0] for c in columns]))
+        self.textcopyquery = u'COPY postgres_stat_profiler.incremental_result_pg_stat_statements ({}) FROM STDIN (FORMAT TEXT)'.format(
+                   u', '.join([c[0] for c in columns]))
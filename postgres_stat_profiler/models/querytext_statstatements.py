@@ -0,0 +1,94 @@
+
+# query text dictionary: one (optionally encrypted) text per (profilename, dbid, queryid)
+# snapshot rows in the cumulative and incremental tables hold only the key
+#
+class querytext_statstatements:
+
+    def __init__(self):
+        self.create_tables = []
+        self._getTableCreateCommands()
+        self.create_indexes = []
+        self._getIndexCreateCommands()
+        self._getUpsertQuery()
+        self._getTouchQuery()
+        self._getKnownKeysQuery()
+
+    def getCreateTables(self):
+        return self.create_tables
+
+    def getCreateIndexes(self):
+        return self.create_indexes
+
+    def getUpsertQuery(self):
+        return self.upsertquery
+
+    def getTouchQuery(self):
+        return self.touchquery
+
+    def getKnownKeysQuery(self):
+        return self.knownkeysquery
+
+    # query: the text as stored, ie already encrypted when query encryption is enabled
+    def getInsertRecord(self,name,recordtime,querytype,query,row):
+        ir = {}
+        ir['profilename'] = name
+        ir['dbid'] = row['dbid']
+        ir['queryid'] = str(row['queryid']) if row['queryid'] is not None else None
+        ir['querytype'] = querytype
+        ir['query'] = query
+        ir['first_seen'] = recordtime
+        ir['last_seen'] = recordtime
+        irlist = list(ir.values())
+        return irlist
+
+    # created with IF NOT EXISTS (no drop): also applied to report databases initialised before this table existed
+    def _getTableCreateCommands(self):
+        create = \
+        u"""CREATE TABLE IF NOT EXISTS postgres_stat_profiler.querytext_pg_stat_statements (
+                profilename text,
+                dbid oid,
+                queryid text,
+                querytype text,
+                query text,
+                first_seen timestamp,
+                last_seen timestamp,
+                PRIMARY KEY (profilename, dbid, queryid)
+            )
+        """
+        self.create_tables.append(create)
+
+    def _getIndexCreateCommands(self):
+        pass
+
+    # new texts are inserted, changed texts replace the stored text; first_seen is kept
+    def _getUpsertQuery(self):
+        self.upsertquery = """
+        INSERT into postgres_stat_profiler.querytext_pg_stat_statements (
+                profilename,
+                dbid,
+                queryid,
+                querytype,
+                query,
+                first_seen,
+                last_seen
+            ) VALUES (
+                %s,%s,%s,%s,%s,%s,%s
+            )
+        ON CONFLICT (profilename, dbid, queryid) DO UPDATE SET
+                querytype = EXCLUDED.querytype,
+                query = EXCLUDED.query,
+                last_seen = EXCLUDED.last_seen
+        """
+
+    # refresh last_seen for a batch of keys in one statement (parameters: time, dbids, queryids, profilename)
+    def _getTouchQuery(self):
+        self.touchquery = """
+        UPDATE postgres_stat_profiler.querytext_pg_stat_statements qt SET last_seen = %s
+        FROM unnest(%s::oid[], %s::text[]) AS k(dbid, queryid)
+        WHERE qt.profilename = %s AND qt.dbid = k.dbid AND qt.queryid = k.queryid
+        """
+
+    def _getKnownKeysQuery(self):
+        self.knownkeysquery = """
+        SELECT dbid, queryid FROM postgres_stat_profiler.querytext_pg_stat_statements WHERE profilename = %s
+        """
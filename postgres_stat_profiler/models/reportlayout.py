@@ -0,0 +1,59 @@
+
+# partition layout of a report database, recorded when it is initialised (one row).
+# the partition manager reads it to maintain partitions for every profile writing to the database
+#
+class reportlayout:
+
+    def __init__(self,settings=None):
+        self.settings = settings
+        self.create_tables = []
+        self.createtable = \
+        u"""CREATE TABLE {}postgres_stat_profiler.report_layout (
+                partitioninterval text,
+                partitionbyprofile text,
+                retentiondays integer
+            )
+        """
+        self.upgradetable = self.createtable.format(u'IF NOT EXISTS ')
+        if settings is not None:
+            self._getTableCreateCommands()
+        self._getSelectQuery()
+
+    def getCreateTables(self):
+        return self.create_tables
+
+    def getCreateIndexes(self):
+        return []
+
+    # the table without its row: report databases initialised before it record no layout until a row is inserted
+    def getUpgradeTables(self):
+        return [self.upgradetable]
+
+    def getSelectQuery(self):
+        return self.selectquery
+
+    # partition clause of the snapshot tables for the recorded layout
+    def getPartitionClause(self):
+        if self.settings is None or self.settings.getPartitionInterval() == u'none':
+            return u''
+        if self.settings.getPartitionByProfile() == u'enabled':
+            return u'PARTITION BY LIST (profilename)'
+        return u'PARTITION BY RANGE (result_epoch)'
+
+    def _getTableCreateCommands(self):
+        drop = \
+        u"DROP TABLE postgres_stat_profiler.report_layout"
+        self.create_tables.append(drop)
+
+        self.create_tables.append(self.createtable.format(u''))
+
+        # values are validated by reportsettings
+        insert = \
+        u"""INSERT INTO postgres_stat_profiler.report_layout VALUES ('{}', '{}', {})""".format(
+            self.settings.getPartitionInterval(), self.settings.getPartitionByProfile(), self.settings.getRetentionDays())
+        self.create_tables.append(insert)
+
+    def _getSelectQuery(self):
+        self.selectquery = """
+        SELECT partitioninterval, partitionbyprofile, retentiondays FROM postgres_stat_profiler.report_layout LIMIT 1
+        """
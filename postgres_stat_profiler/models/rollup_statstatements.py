@@ -0,0 +1,134 @@
+
+# hourly and daily rollups of the incremental statements, keyed by (profilename, bucket_epoch, dbid, userid,
+# queryid, toplevel). counters are summed and min/max kept; sumsq_exec_time (sum of squared execution times)
+# makes the variance mergeable across rows and levels: variance = sumsq/calls - (total/calls)^2.
+# incremental rows carry the exact sum of squares of their interval. rows collected before they did fall back
+# to calls * (stddev^2 + mean^2) with the statement's lifetime stddev: for those the variance is an approximation
+# the watermark table records, per profile and level, the epoch up to which rows have been rolled up
+#
+class rollup_statstatements:
+
+    # level : (bucket seconds, source table, source epoch column)
+    levels = {u'hourly': (3600, u'incremental_result_pg_stat_statements', u'result_epoch'),
+              u'daily': (86400, u'hourly_pg_stat_statements', u'bucket_epoch')}
+    sum_columns = [u'calls', u'total_exec_time', u'rows', u'plans', u'total_plan_time',
+                   u'shared_blks_hit', u'shared_blks_read', u'shared_blks_dirtied', u'shared_blks_written',
+                   u'local_blks_hit', u'local_blks_read', u'local_blks_dirtied', u'local_blks_written',
+                   u'temp_blks_read', u'temp_blks_written', u'blk_read_time', u'blk_write_time',
+                   u'wal_bytes', u'wal_records', u'wal_fpi']
+    key_columns = [u'profilename', u'bucket_epoch', u'dbid', u'userid', u'queryid', u'toplevel']
+
+    def __init__(self):
+        self.create_tables = []
+        self._getTableCreateCommands()
+        self.create_indexes = []
+        self._getIndexCreateCommands()
+        self._getWatermarkQueries()
+
+    def getCreateTables(self):
+        return self.create_tables
+
+    def getCreateIndexes(self):
+        return self.create_indexes
+
+    def getLevels(self):
+        return [u'hourly', u'daily']
+
+    def getBucketSeconds(self,level):
+        return self.levels[level][0]
+
+    # parameters: profilename, from epoch, to epoch
+    def getRollupQuery(self,level):
+        size, source, epochcolumn = self.levels[level]
+        if level == u'hourly':
+            sumsq = u'sum(coalesce(sumsq_exec_time, calls * (coalesce(stddev_exec_time,0)^2 + coalesce(mean_exec_time,0)^2)))'
+        else:
+            sumsq = u'sum(sumsq_exec_time)'
+        sums = u', '.join([u'sum({})'.format(column) for column in self.sum_columns])
+        updates = u', '.join([u'{0} = r.{0} + EXCLUDED.{0}'.format(column) for column in self.sum_columns + [u'sumsq_exec_time']])
+        return """
+        INSERT into postgres_stat_profiler.{level}_pg_stat_statements AS r (
+                profilename, bucket_epoch, dbid, userid, queryid, toplevel, bucket_time, username, dbname, querytype,
+                min_exec_time, max_exec_time, sumsq_exec_time, {columns}
+            )
+        SELECT profilename, {epoch} - ({epoch} %% {size}) AS bucket, dbid, userid, queryid, toplevel,
+                timestamp 'epoch' + ({epoch} - ({epoch} %% {size})) * interval '1 second',
+                max(username), max(dbname), max(querytype),
+                min(min_exec_time), max(max_exec_time), {sumsq}, {sums}
+        FROM postgres_stat_profiler.{source}
+        WHERE profilename = %s AND {epoch} >= %s AND {epoch} < %s AND queryid IS NOT NULL
+        GROUP BY profilename, bucket, dbid, userid, queryid, toplevel
+        ON CONFLICT (profilename, bucket_epoch, dbid, userid, queryid, toplevel) DO UPDATE SET
+                min_exec_time = least(r.min_exec_time, EXCLUDED.min_exec_time),
+                max_exec_time = greatest(r.max_exec_time, EXCLUDED.max_exec_time),
+                {updates}
+        """.format(level=level, columns=u', '.join(self.sum_columns), epoch=epochcolumn, size=size, sumsq=sumsq,
+                   sums=sums, source=source, updates=updates)
+
+    # parameters: profilename, expiry epoch
+    def getRetentionQuery(self,level):
+        return u'DELETE FROM postgres_stat_profiler.{}_pg_stat_statements WHERE profilename = %s AND bucket_epoch < %s'.format(level)
+
+    # parameters: profilename, level
+    def getWatermarkQuery(self):
+        return self.watermarkquery
+
+    # parameters: level. the lowest watermark of the profiles rolled up into the database
+    def getLowestWatermarkQuery(self):
+        return self.lowestwatermarkquery
+
+    # parameters: profilename, level, watermark epoch
+    def getSetWatermarkQuery(self):
+        return self.setwatermarkquery
+
+    # created with IF NOT EXISTS (no drop): also applied to report databases initialised before rollups existed
+    def _getTableCreateCommands(self):
+        for level in self.getLevels():
+            columns = u',\n                '.join([u'{} {}'.format(column, u'numeric' if column == u'wal_bytes' else
+                                                   (u'double precision' if column.endswith(u'_time') else u'bigint'))
+                                                   for column in self.sum_columns])
+            create = \
+            u"""CREATE TABLE IF NOT EXISTS postgres_stat_profiler.{}_pg_stat_statements (
+                profilename text,
+                bucket_epoch bigint,
+                bucket_time timestamp,
+                username text,
+                dbname text,
+                dbid oid,
+                userid oid,
+                querytype text,
+                queryid text,
+                toplevel boolean,
+                min_exec_time double precision,
+                max_exec_time double precision,
+                sumsq_exec_time double precision,
+                {},
+                PRIMARY KEY (profilename, bucket_epoch, dbid, userid, queryid, toplevel)
+            )
+            """.format(level, columns)
+            self.create_tables.append(create)
+
+        create = \
+        u"""CREATE TABLE IF NOT EXISTS postgres_stat_profiler.rollup_watermark (
+                profilename text,
+                level text,
+                watermark_epoch bigint,
+                PRIMARY KEY (profilename, level)
+            )
+        """
+        self.create_tables.append(create)
+
+    def _getIndexCreateCommands(self):
+        pass
+
+    def _getWatermarkQueries(self):
+        self.watermarkquery = """
+        SELECT watermark_epoch FROM postgres_stat_profiler.rollup_watermark WHERE profilename = %s AND level = %s
+        """
+        self.lowestwatermarkquery = """
+        SELECT min(watermark_epoch) AS watermark_epoch FROM postgres_stat_profiler.rollup_watermark WHERE level = %s
+        """
+        self.setwatermarkquery = """
+        INSERT into postgres_stat_profiler.rollup_watermark (profilename, level, watermark_epoch) VALUES (%s, %s, %s)
+        ON CONFLICT (profilename, level) DO UPDATE SET watermark_epoch = EXCLUDED.watermark_epoch
+        """
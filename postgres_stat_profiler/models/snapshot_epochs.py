@@ -0,0 +1,41 @@
+
+# per profile, the epochs of the last two cumulative snapshots written to the report database.
+# updated in the same transaction as each cumulative snapshot, so that the incremental computation in
+# the report database reads exactly those two snapshots (through the (profilename, result_epoch) index)
+#
+class snapshot_epochs:
+
+    def __init__(self):
+        self.create_tables = []
+        self._getTableCreateCommands()
+        self._getUpdateQuery()
+
+    def getCreateTables(self):
+        return self.create_tables
+
+    def getCreateIndexes(self):
+        return []
+
+    # parameters: profilename, epoch
+    def getUpdateQuery(self):
+        return self.updatequery
+
+    # created with IF NOT EXISTS (no drop): also applied to report databases initialised before this table existed
+    def _getTableCreateCommands(self):
+        create = \
+        u"""CREATE TABLE IF NOT EXISTS postgres_stat_profiler.snapshot_epochs (
+                profilename text PRIMARY KEY,
+                latest_epoch bigint,
+                previous_epoch bigint
+            )
+        """
+        self.create_tables.append(create)
+
+    # a repeated epoch (eg a retried collection) does not shift the previous epoch
+    def _getUpdateQuery(self):
+        self.updatequery = """
+        INSERT into postgres_stat_profiler.snapshot_epochs AS e (profilename, latest_epoch, previous_epoch) VALUES (%s, %s, NULL)
+        ON CONFLICT (profilename) DO UPDATE SET
+                previous_epoch = CASE WHEN e.latest_epoch = EXCLUDED.latest_epoch THEN e.previous_epoch ELSE e.latest_epoch END,
+                latest_epoch = EXCLUDED.latest_epoch
+        """
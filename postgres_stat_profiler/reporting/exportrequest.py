@@ -0,0 +1,35 @@
+from postgres_stat_profiler.reporting.reportrequest import reportrequest
+
+# parameters of a report export request: the report window, granularity and filters, plus the output format
+# and 'after', the last epoch a client received in full, to resume an interrupted export from
+#
+class exportrequest(reportrequest):
+
+    valid_formats = [u'ndjson', u'csv']
+    default_window = 86400
+
+    def __init__(self, request):
+        self.format = u'ndjson'
+        self.after = None
+        super().__init__(request)
+
+    # the report window, starting after the resume epoch when one is given
+    def getWindow(self, latestepoch):
+        start, end = super().getWindow(latestepoch)
+        if self.after is not None:
+            start = max(start, self.after + 1)
+        return start, end
+
+    def getFormat(self):
+        return self.format
+
+    def getAfter(self):
+        return self.after
+
+    def _setParameters(self, args):
+        super()._setParameters(args)
+        self.format = args.get('format', self.format)
+        if self.format not in self.valid_formats:
+            raise ValueError('format must be one of {}'.format(self.valid_formats))
+        if args.get('after') is not None:
+            self.after = int(args.get('after'))
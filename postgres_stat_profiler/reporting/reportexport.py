@@ -0,0 +1,49 @@
+import io
+import csv
+import json
+import decimal
+import datetime
+import logging
+
+# formats batches of report rows (dicts, see reportquery.getExportBatches) as a stream of text chunks,
+# one chunk per batch: newline delimited json (one object per row) or csv with a header row.
+# rows are in epoch order: a client whose export ends early (the connection is lost, or the response is aborted
+# without its final chunk) keeps the rows up to the last epoch it received in full and asks for the rest
+# with after=<that epoch>
+#
+class reportexport:
+
+    mimetypes = {u'ndjson': u'application/x-ndjson', u'csv': u'text/csv'}
+
+    def __init__(self, format):
+        self.format = format
+
+    def getMimetype(self):
+        return self.mimetypes[self.format]
+
+    def getChunks(self, batches):
+        columns = None
+        try:
+            for rows in batches:
+                if self.format == u'csv':
+                    output = io.StringIO()
+                    writer = csv.writer(output, lineterminator=u'\n')
+                    if columns is None:
+                        columns = list(rows[0].keys())
+                        writer.writerow(columns)
+                    writer.writerows([[row[column] for column in columns] for row in rows])
+                    yield output.getvalue()
+                else:
+                    yield u''.join([json.dumps(row, default=self._getJsonValue) + u'\n' for row in rows])
+        except Exception as e:
+            # the response has started: raised so that the server aborts it without the final (empty) chunk,
+            # so the client can tell an export ended early from a complete one
+            logging.warning('pg-stat-profiler : report export error [{}]'.format(str(e)))
+            raise
+
+    def _getJsonValue(self, value):
+        if isinstance(value, decimal.Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        return str(value)
@@ -0,0 +1,102 @@
+from postgres_stat_profiler.collection.connectionpool import connectionpool
+
+# read queries for the report api, run against a profile's report database.
+# aggregation happens in the report database; each query runs in its own transaction with a statement timeout,
+# on connections from a pool kept for the api (separate from the collectors' pools)
+#
+class reportquery:
+
+    # summed in every top statements row, in addition to the ranking metric
+    summary_columns = [u'calls', u'total_exec_time', u'rows', u'shared_blks_hit', u'shared_blks_read',
+                       u'temp_blks_written', u'wal_bytes']
+
+    def __init__(self, profilename, connstring, statementtimeout=10000):
+        self.profilename = profilename
+        self.connstring = connstring
+        self.statementtimeout = int(statementtimeout)
+
+    # epoch of the profile's last collection, None before the first
+    def getLatestEpoch(self):
+        rows = self._execute(u'SELECT latest_epoch FROM postgres_stat_profiler.snapshot_epochs WHERE profilename = %s',
+                             [self.profilename])
+        if len(rows) == 0:
+            return None
+        return rows[0][u'latest_epoch']
+
+    # one page of the top statements by metric for start <= epoch < end, and the cursor of the next page (None on the last)
+    # pages are keyset-paginated on (rankvalue, dbid, userid, queryid), all descending. a metric which is null for a
+    # whole group ('other' rows have no stddev, older servers no wal or jit columns) ranks as 0: a null rankvalue
+    # would sort first and compare as null with the cursor, ending or skipping pages
+    def getTopStatements(self, table, metric, start, end, filters, limit, cursor=None):
+        epochcolumn = u'result_epoch' if table.startswith(u'incremental') else u'bucket_epoch'
+        columns = [metric] + [column for column in self.summary_columns if column != metric]
+        where = [u'profilename = %s', u'{0} >= %s'.format(epochcolumn), u'{0} < %s'.format(epochcolumn)]
+        parameters = [self.profilename, start, end]
+        for name, value in sorted(filters.items()):
+            where.append(u'{} = %s'.format(name))
+            parameters.append(value)
+        having = u''
+        if cursor is not None:
+            having = u'HAVING (coalesce(sum({}), 0)::double precision, dbid::bigint, userid::bigint, queryid) < (%s, %s, %s, %s)'.format(metric)
+            parameters = parameters + [float(cursor[0]), int(cursor[1]), int(cursor[2]), str(cursor[3])]
+        query = u"""
+        SELECT dbid::bigint AS dbid, userid::bigint AS userid, queryid,
+               max(dbname) AS dbname, max(username) AS username, max(querytype) AS querytype,
+               coalesce(sum({metric}), 0)::double precision AS rankvalue, {sums},
+               sum(total_exec_time) / nullif(sum(calls), 0) AS mean_exec_time
+        FROM postgres_stat_profiler.{table}
+        WHERE {where}
+        GROUP BY dbid, userid, queryid
+        {having}
+        ORDER BY rankvalue DESC, dbid DESC, userid DESC, queryid DESC
+        LIMIT %s
+        """.format(metric=metric, sums=u', '.join([u'sum({0})::double precision AS {0}'.format(column) for column in columns]),
+                   table=table, where=u' AND '.join(where), having=having)
+        rows = self._execute(query, parameters + [limit + 1])
+        nextcursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            nextcursor = [last[u'rankvalue'], last[u'dbid'], last[u'userid'], last[u'queryid']]
+        return rows, nextcursor
+
+    # every row of table for start <= epoch < end, in epoch order, as lists of at most batchsize rows.
+    # rows are read through a named (server-side) cursor, so only the current batch is held in memory
+    # however long the window; the statement timeout applies to each batch fetched
+    def getExportBatches(self, table, start, end, filters, batchsize=5000):
+        epochcolumn = u'result_epoch' if table.startswith(u'incremental') else u'bucket_epoch'
+        where = [u'profilename = %s', u'{0} >= %s'.format(epochcolumn), u'{0} < %s'.format(epochcolumn)]
+        parameters = [self.profilename, start, end]
+        for name, value in sorted(filters.items()):
+            where.append(u'{} = %s'.format(name))
+            parameters.append(value)
+        query = u"""
+        SELECT * FROM postgres_stat_profiler.{table}
+        WHERE {where}
+        ORDER BY {epochcolumn}
+        """.format(table=table, where=u' AND '.join(where), epochcolumn=epochcolumn)
+        with getReportPool().connection(self.connstring) as conn:
+            conn.execute(u'SET LOCAL statement_timeout = {}'.format(self.statementtimeout))
+            with conn.cursor(name=u'pg_stat_profiler_export') as cur:
+                cur.execute(query, parameters)
+                while True:
+                    rows = cur.fetchmany(batchsize)
+                    if len(rows) == 0:
+                        break
+                    yield rows
+
+    def _execute(self, query, parameters):
+        with getReportPool().connection(self.connstring) as conn:
+            # SET LOCAL: the timeout ends with this transaction, leaving the pooled connection unchanged
+            conn.execute(u'SET LOCAL statement_timeout = {}'.format(self.statementtimeout))
+            return conn.execute(query, parameters).fetchall()
+
+
+_reportpool = None
+
+# pool of report database connections for the api process
+def getReportPool():
+    global _reportpool
+    if _reportpool is None:
+        _reportpool = connectionpool(maxsize=4)
+    return _reportpool
@@ -0,0 +1,101 @@
+import json
+import base64
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+
+# parameters of a report api request (query string), validated. invalid requests carry an error message
+#
+class reportrequest:
+
+    valid_granularities = {u'minute': u'incremental_result_pg_stat_statements',
+                           u'hourly': u'hourly_pg_stat_statements',
+                           u'daily': u'daily_pg_stat_statements'}
+    filter_names = [u'dbname', u'username', u'querytype']
+    default_window = 3600
+    default_limit = 50
+    max_limit = 1000
+
+    def __init__(self, request):
+        self.error = None
+        self.start = None
+        self.end = None
+        self.metric = u'total_exec_time'
+        self.limit = self.default_limit
+        self.granularity = u'minute'
+        self.filters = {}
+        self.cursor = None
+        try:
+           self._setParameters(request.args)
+        except (ValueError, TypeError) as e:
+           self.error = u'Invalid report parameter ({})'.format(str(e))
+
+    def getValid(self):
+        return self.error is None
+
+    def getError(self):
+        return self.error
+
+    # missing start/end default to the window ending at latestepoch (the profile's last collection)
+    def getWindow(self, latestepoch):
+        end = self.end if self.end is not None else latestepoch + 1
+        start = self.start if self.start is not None else end - self.default_window
+        return start, end
+
+    def getMetric(self):
+        return self.metric
+
+    def getLimit(self):
+        return self.limit
+
+    def getTable(self):
+        return self.valid_granularities[self.granularity]
+
+    def getGranularity(self):
+        return self.granularity
+
+    def getFilters(self):
+        return self.filters
+
+    # keyset position after which to continue: [rankvalue, dbid, userid, queryid], or None for the first page
+    def getCursor(self):
+        return self.cursor
+
+    # normalised parameters (eg for cache keys): every parameter, defaults included, in a fixed order
+    def getNormalised(self):
+        return json.dumps([self.start, self.end, self.metric, self.limit, self.granularity,
+                           sorted(self.filters.items()), self.cursor])
+
+    def _setParameters(self, args):
+        if args.get('start') is not None:
+            self.start = int(args.get('start'))
+        if args.get('end') is not None:
+            self.end = int(args.get('end'))
+        if self.start is not None and self.end is not None and self.end <= self.start:
+            raise ValueError('end must be after start')
+        self.metric = args.get('metric', self.metric)
+        if self.metric not in collectionsettings.valid_rankmetrics:
+            raise ValueError('metric must be one of {}'.format(collectionsettings.valid_rankmetrics))
+        self.limit = int(args.get('limit', self.limit))
+        if not (1 <= self.limit <= self.max_limit):
+            raise ValueError('limit must be between 1 and {}'.format(self.max_limit))
+        self.granularity = args.get('granularity', self.granularity)
+        if self.granularity not in self.valid_granularities:
+            raise ValueError('granularity must be one of {}'.format(list(self.valid_granularities.keys())))
+        for name in self.filter_names:
+            if args.get(name) is not None:
+                self.filters[name] = args.get(name)
+        if args.get('cursor'):
+            self.cursor = self.decodeCursor(args.get('cursor'))
+
+    @staticmethod
+    def encodeCursor(position):
+        return base64.urlsafe_b64encode(json.dumps(position).encode('utf-8')).decode('utf-8')
+
+    @staticmethod
+    def decodeCursor(cursor):
+        try:
+            position = json.loads(base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8'))
+        except Exception:
+            raise ValueError('cursor is not valid')
+        if not isinstance(position, list) or len(position) != 4:
+            raise ValueError('cursor is not valid')
+        return position
@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+
+# in-process cache of report api response bodies. report data only changes when a profile's collection
+# completes, so an entry is valid for as long as the profile's last collection epoch is the one it was built at.
+# entries carry an etag (for conditional requests) and, for large bodies, a gzip-compressed copy.
+# least recently used entries are evicted beyond maxentries or maxbytes
+#
+class responsecache:
+
+    def __init__(self, maxentries=512, maxbytes=64 * 1024 * 1024, gzipminsize=1024):
+        self.maxentries = maxentries
+        self.maxbytes = maxbytes
+        self.gzipminsize = gzipminsize
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # flask serves requests on several threads
+        self.lock = threading.Lock()
+
+    def getStats(self):
+        return {u'entries': len(self.entries), u'bytes': self.bytes, u'hits': self.hits, u'misses': self.misses}
+
+    # the entry for key built at epoch, or None. an entry built at an earlier epoch is dropped
+    def get(self, key, epoch):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[u'epoch'] == epoch:
+                self.entries.move_to_end(key)
+                self.hits = self.hits + 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses = self.misses + 1
+            return None
+
+    # builds (and, when epoch is known, caches) the entry for a response body
+    def put(self, key, epoch, body, mimetype=u'application/json'):
+        entry = {u'epoch': epoch, u'body': body, u'mimetype': mimetype,
+                 u'etag': hashlib.sha1(body).hexdigest(), u'gzip': None}
+        if len(body) >= self.gzipminsize:
+            entry[u'gzip'] = gzip.compress(body, compresslevel=6)
+        if epoch is None:
+            return entry
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = entry
+            self.bytes = self.bytes + self._getSize(entry)
+            while len(self.entries) > self.maxentries or (self.bytes > self.maxbytes and len(self.entries) > 1):
+                self._remove(next(iter(self.entries)))
+        return entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.bytes = self.bytes - self._getSize(entry)
+
+    def _getSize(self, entry):
+        return len(entry[u'body']) + (len(entry[u'gzip']) if entry[u'gzip'] is not None else 0)
@@ -1,11 +1,20 @@
+import atexit
+import multiprocessing
 from postgres_stat_profiler import create_app
+from postgres_stat_profiler import daemon
 """
 """
 
+# single host entry point: the collector daemon as a child process, and the api on the flask server.
+# to scale the api, run the daemon once (pg_stat_profiler_daemon) and the api under a wsgi server
+# with any number of workers, eg gunicorn -w 4 'postgres_stat_profiler:create_app()'
 def main():
+    collectordaemon = multiprocessing.Process(target=daemon.main)
+    collectordaemon.start()
+    atexit.register(collectordaemon.terminate)
     app = create_app()
     app.debug = False
     app.run(ssl_context='adhoc')
     
 if __name__ == "__main__":
-   main()
\ No newline at end of file
+   main()
@@ -7,14 +7,15 @@ setup(
     version='0.1.0',
     install_requires=[
         'flask>=3.0.0',
-        'flask_apscheduler>=1.13.1',
         'cryptography>=41.0.7',
-        'psycopg[binary]>=3.1.16'
+        'psycopg[binary]>=3.1.16',
+        'numpy>=1.24.0'
     ],
     url='https://github.com/rombachuk/postgres_stat_profiler',
     entry_points={
       'console_scripts' : [
-          'pg_stat_profiler=postgres_stat_profiler.wsgi:main'
+          'pg_stat_profiler=postgres_stat_profiler.wsgi:main',
+          'pg_stat_profiler_daemon=postgres_stat_profiler.daemon:main'
       ]
     },
     packages=find_packages()
@@ -0,0 +1,41 @@
+import os
+import uuid
+import unittest
+import psycopg
+from postgres_stat_profiler.reporting.reportquery import reportquery
+
+# run against a scratch postgres database, when one is configured
+@unittest.skipUnless(os.getenv('PG_STAT_PROFILER_TEST_REPORTDB'), 'PG_STAT_PROFILER_TEST_REPORTDB not set')
+class TestReportQuery(unittest.TestCase):
+
+    def setUp(self):
+        self.connstring = os.getenv('PG_STAT_PROFILER_TEST_REPORTDB')
+        self.table = 'hourly_test_{}'.format(uuid.uuid4().hex)
+        with psycopg.connect(self.connstring) as conn:
+            conn.execute('CREATE SCHEMA IF NOT EXISTS postgres_stat_profiler')
+            conn.execute("""CREATE TABLE postgres_stat_profiler.{} AS SELECT * FROM (VALUES
+                ('p1', 3600::bigint, 1::oid, 10::oid, '1', 'db1', 'u1', 'select', 5::bigint, 50.0::float8, 10::bigint, 1000::numeric),
+                ('p1', 3600::bigint, 1::oid, 10::oid, '2', 'db1', 'u1', 'select', 4::bigint, 40.0::float8, 10::bigint, 2000::numeric),
+                ('p1', 3600::bigint, 1::oid, 10::oid, '3', 'db1', 'u1', 'select', 3::bigint, 30.0::float8, 10::bigint, NULL::numeric),
+                ('p1', 3600::bigint, 1::oid, 10::oid, '4', 'db1', 'u1', 'select', 2::bigint, 20.0::float8, 10::bigint, NULL::numeric),
+                ('p1', 3600::bigint, 1::oid, 10::oid, '5', 'db1', 'u1', 'select', 1::bigint, 10.0::float8, 10::bigint, 0::numeric))
+                AS t (profilename, bucket_epoch, dbid, userid, queryid, dbname, username, querytype, calls, total_exec_time,
+                      rows, wal_bytes)""".format(self.table))
+            for column in ['shared_blks_hit', 'shared_blks_read', 'temp_blks_written']:
+                conn.execute('ALTER TABLE postgres_stat_profiler.{} ADD COLUMN {} bigint'.format(self.table, column))
+
+    def tearDown(self):
+        with psycopg.connect(self.connstring) as conn:
+            conn.execute('DROP TABLE postgres_stat_profiler.{}'.format(self.table))
+
+    # statements whose metric is null rank as 0, after the others, and pages continue past them
+    def test_null_ranked_pages(self):
+        query = reportquery('p1', self.connstring)
+        seen = []
+        cursor = None
+        while True:
+            rows, cursor = query.getTopStatements(self.table, 'wal_bytes', 0, 7200, {}, 2, cursor)
+            seen = seen + [(row['queryid'], row['rankvalue']) for row in rows]
+            if cursor is None:
+                break
+        assert seen == [('2', 2000.0), ('1', 1000.0), ('5', 0.0), ('4', 0.0), ('3', 0.0)]
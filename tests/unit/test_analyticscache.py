@@ -0,0 +1,52 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.analytics.segmentstore import segmentstore
+from postgres_stat_profiler.analytics.analyticscache import analyticscache
+
+class TestAnalyticscache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.columns = incremental_statstatements().getColumns()
+        self.store = segmentstore(self.tmpdir.name)
+        self.cache = analyticscache(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _getRecord(self, epoch, dbid, queryid, calls, total_exec_time):
+        row = dict([(name, 0) for name in self.columns])
+        row.update({'profilename': 'p1', 'result_time': datetime(2024, 1, 1), 'result_epoch': epoch, 'username': 'u1',
+                    'dbname': 'db{}'.format(dbid), 'dbid': dbid, 'userid': 10, 'querytype': 'select', 'queryid': queryid,
+                    'toplevel': True, 'calls': calls, 'total_exec_time': total_exec_time, 'stddev_exec_time': None})
+        return [row[name] for name in self.columns]
+
+    def test_scan_and_group(self):
+        day = 1704067200
+        for i, epoch in enumerate([day + 60, day + 120, day + 86400 + 60]):
+            self.store.append('p1', epoch, self.columns, [self._getRecord(epoch, 1, '11', 10 + i, 1.0),
+                                                          self._getRecord(epoch, 2, '22', 1, 50.0)])
+        assert self.cache.getDays('p1') == ['20240101', '20240102']
+        scanned = self.cache.scan('p1', day, day + 86400, metrics=['calls'])
+        assert len(scanned['epoch']) == 4
+        assert sorted(scanned['queryid'].tolist()) == ['11', '11', '22', '22']
+        groups = self.cache.groupBy('p1', day, day + 2 * 86400, by=['queryid'], metrics=['total_exec_time', 'calls'])
+        assert groups[0]['queryid'] == '22' and groups[0]['total_exec_time'] == 150.0
+        assert groups[1]['calls'] == 33 and groups[1]['rows'] == 3
+        filtered = self.cache.groupBy('p1', day, day + 2 * 86400, by=['dbname'], metrics=['calls'], where={'dbid': [1]})
+        assert filtered == [{'dbname': 'db1', 'rows': 3, 'calls': 33.0}]
+
+    def test_interrupted_append(self):
+        epoch = 1704067260
+        self.store.append('p1', epoch, self.columns, [self._getRecord(epoch, 1, '11', 1, 1.0)])
+        segment = self.store.getSegmentDir('p1', '20240101')
+        # a column left one row longer than the others
+        with open(os.path.join(segment, 'calls.f8'), 'ab') as columnfile:
+            columnfile.write(b'\0' * 8)
+        assert len(self.cache.scan('p1', epoch, epoch + 60)['calls']) == 1
+        self.store = segmentstore(self.tmpdir.name)
+        self.store.append('p1', epoch + 60, self.columns, [self._getRecord(epoch + 60, 1, '11', 2, 1.0)])
+        assert self.cache.scan('p1', epoch, epoch + 120)['calls'].tolist() == [1.0, 2.0]
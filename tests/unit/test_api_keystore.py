@@ -20,3 +20,22 @@ class TestApi_keystore(unittest.TestCase):
           self.assertNotEqual(key,None)
         assert keystore.checkKeyfile()
 
+
+    def test_check_key(self):
+        keystore = api_keystore(uuid.uuid1().hex,self.unittest_keystorefile)
+        key = keystore.getApiKey(0)
+        assert keystore.checkKey(key)
+        assert not keystore.checkKey(key[:-1])
+        assert not keystore.checkKey(u'')
+        assert key.encode(u'utf-8') not in str(keystore.keyhashes).encode(u'utf-8')
+
+    def test_reload_on_change(self):
+        secret = uuid.uuid1().hex
+        keystore = api_keystore(secret,self.unittest_keystorefile)
+        oldkey = keystore.getApiKey(0)
+        # keys reset by another keystore on the same file
+        other = api_keystore(secret,self.unittest_keystorefile)
+        other.resetKeys()
+        os.utime(self.unittest_keystorefile, ns=(0, 0))
+        assert keystore.checkKey(other.getApiKey(0))
+        assert not keystore.checkKey(oldkey)
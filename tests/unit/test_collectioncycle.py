@@ -0,0 +1,59 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest.mock import MagicMock, patch
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+from postgres_stat_profiler.config.reportsettings import reportsettings
+from postgres_stat_profiler.collection.postgresCollector import postgrescollector
+from postgres_stat_profiler.collection.collectioncycle import collectioncycle
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.models.snapshot_epochs import snapshot_epochs
+
+class TestCollectioncycle(unittest.TestCase):
+
+    def setUp(self):
+        profile = MagicMock()
+        profile.getName.return_value = 'p1'
+        profile.getQueryEncryption.return_value = 'disabled'
+        profile.getCollectionSettings.return_value = collectionsettings({})
+        profile.getReportSettings.return_value = reportsettings({})
+        self.dbcollector = postgrescollector(profile, checkstatus=False)
+        self.dbcollector.querytexts = {}
+
+    # one cycle at epoch over pg_stat_statements rows of (queryid, calls), up to its epoch statements
+    def _getCycle(self, epoch, statements):
+        with patch.object(self.dbcollector, '_getCollectTime',
+                          return_value=(datetime(1970, 1, 1) + timedelta(seconds=epoch), epoch)):
+            cycle = collectioncycle(self.dbcollector, 60)
+        rows = []
+        for queryid, calls in statements:
+            row = dict([(name, 0) for name in cumulative_statstatements().getColumns()])
+            row.update({'username': 'u1', 'dbname': 'db1', 'dbid': 1, 'userid': 10, 'queryid': queryid,
+                        'query': 'select {}'.format(queryid), 'toplevel': True, 'calls': calls, 'total_exec_time': calls * 2.0})
+            rows.append(row)
+        cycle.setCollectRecords(rows)
+        return cycle
+
+    # first cycle: incremental rows are read from the report database, for snapshots at most one interval apart
+    def test_first_cycle(self):
+        cycle = self._getCycle(6000, [(1, 10), (2, 5)])
+        query, parameters = cycle.getIncrementalQuery()
+        assert query == incremental_statstatements().getCollectQuery() and parameters == ['p1', 60]
+        assert 'e.latest_epoch - e.previous_epoch <= %s' in query and query.count('%s') == 2
+        assert cycle.getEpochStatements() == [(snapshot_epochs().getUpdateQuery(), ['p1', 6000], False)]
+
+    # later cycles compute incremental rows in memory, and record each snapshot's epoch when it persists rows
+    def test_later_cycles(self):
+        cycle = self._getCycle(6000, [(1, 10), (2, 5)])
+        cycle.setIncrementalRecords([])
+        cycle.setCompleted()
+        cycle = self._getCycle(6060, [(1, 12), (2, 5)])
+        assert cycle.getIncrementalQuery() is None
+        assert cycle.getEpochStatements() == [(snapshot_epochs().getUpdateQuery(), ['p1', 6060], False)]
+        cycle.setIncrementalRecords()
+        columns = incremental_statstatements().getColumns()
+        assert [(record[columns.index('queryid')], record[columns.index('calls')]) for record in cycle.incrementalrecords] == [('1', 2)]
+        cycle.setCompleted()
+        # nothing persisted (no statements): the recorded epochs stay those of the last snapshot written
+        cycle = self._getCycle(6120, [])
+        assert cycle.getIncrementalQuery() is None and cycle.getEpochStatements() == []
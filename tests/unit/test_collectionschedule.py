@@ -0,0 +1,31 @@
+import unittest
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+from postgres_stat_profiler.collection.collectionschedule import collectionschedule
+
+class TestCollectionschedule(unittest.TestCase):
+
+    def test_invalid_interval(self):
+        settings = collectionsettings({'interval': 45})
+        assert not settings.getValid()
+
+    def test_fixed_interval(self):
+        schedule = collectionschedule(collectionsettings({'interval': 15}))
+        assert schedule.getInterval() == 15
+        assert 0 < schedule.getNextDelay() <= 15.01
+        for i in range(0, 10):
+            assert schedule.update(0, 0) == 15
+
+    def test_adaptive_spike_and_idle(self):
+        settings = collectionsettings({'interval': 60, 'adaptiveinterval': 'enabled', 'mininterval': 15, 'maxinterval': 300})
+        schedule = collectionschedule(settings)
+        schedule.update(10, 600)
+        schedule.update(10, 600)
+        # calls rate far above its average: collect more often
+        assert schedule.update(10, 6000) == 30
+        # idle database: collect less often
+        for i in range(0, 3):
+            schedule.update(0, 0)
+        assert schedule.getInterval() == 60
+        for i in range(0, 3):
+            schedule.update(0, 0)
+        assert schedule.getInterval() == 120
@@ -0,0 +1,53 @@
+import queue
+import asyncio
+import unittest
+from unittest.mock import MagicMock, patch
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+from postgres_stat_profiler.collection.collector import collector
+
+class stopcollector(Exception):
+    pass
+
+class TestCollector(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = MagicMock()
+        self.profile.getMonitoredDBconnection.return_value.getType.return_value = 'postgresql'
+        self.profile.getCollectionSettings.return_value = collectionsettings({'interval': 60})
+        # the collection of a cycle completes epoch 6000
+        self.dbcollector = MagicMock()
+        self.dbcollector.getReportDBstatus.return_value = 'initialised'
+        self.dbcollector.getMonitoredDBstatus.return_value = 'operational'
+        self.dbcollector.getLastError.return_value = None
+        self.dbcollector.getLastActivity.return_value = (10, 10)
+        self.dbcollector.getLastCollectEpoch.return_value = None
+        def collect(interval=60):
+            self.dbcollector.getLastCollectEpoch.return_value = 6000
+            return True
+        self.dbcollector.collect.side_effect = collect
+        async def collectAsync(interval=60):
+            return collect(interval)
+        self.dbcollector.collectAsync.side_effect = collectAsync
+        async def checkStatusAsync():
+            pass
+        self.dbcollector.checkStatusAsync.side_effect = checkStatusAsync
+
+    # status is reported after the cycle's collection: the api sees the epoch just collected
+    def test_status_after_collect(self):
+        profilesqueue = queue.Queue()
+        with patch('postgres_stat_profiler.collection.collector.postgrescollector', return_value=self.dbcollector), \
+             patch('postgres_stat_profiler.collection.collector.attachQueueHandler'), \
+             patch('postgres_stat_profiler.collection.collector.time.sleep', side_effect=stopcollector):
+            collector('p1', self.profile).run(profilesqueue, None)
+        status = profilesqueue.get_nowait()
+        assert status['name'] == 'p1' and status['lastcollectepoch'] == 6000
+        assert status['lastcollecttime'] is not None
+
+    def test_status_after_collect_async(self):
+        profilesqueue = queue.Queue()
+        async def stop(delay):
+            raise stopcollector()
+        with patch('postgres_stat_profiler.collection.collector.asyncpostgrescollector', return_value=self.dbcollector), \
+             patch('postgres_stat_profiler.collection.collector.asyncio.sleep', side_effect=stop):
+            asyncio.run(collector('p1', self.profile).runAsync(profilesqueue))
+        assert profilesqueue.get_nowait()['lastcollectepoch'] == 6000
@@ -0,0 +1,82 @@
+import asyncio
+import unittest
+from unittest.mock import patch
+from postgres_stat_profiler.collection.collectorgroup import collectorgroup
+
+class stopgroup(Exception):
+    pass
+
+# collector whose collection runs until cancelled, or ends at once when the profile says so
+class stubcollector:
+
+    started = []
+
+    def __init__(self, pname, profile, metricsname=None, statusname=None):
+        self.pname = pname
+        self.profile = profile
+        stubcollector.started.append((pname, profile))
+
+    def getValid(self):
+        return self.profile != u'invalid'
+
+    async def runAsync(self, profilesqueue):
+        if self.profile == u'ends':
+            return
+        await asyncio.Event().wait()
+
+class TestCollectorGroup(unittest.TestCase):
+
+    def setUp(self):
+        stubcollector.started = []
+        self.group = collectorgroup(0)
+
+    # each _run loop reads the next scripted batch of control messages, the group stops once they are read.
+    # self.snapshots: the group's tasks at each read
+    def runGroup(self, batches):
+        batches = list(batches)
+        self.snapshots = []
+        def getControlMessages(controlqueue, timeout):
+            self.snapshots.append(dict(self.group.tasks))
+            if len(batches) == 0:
+                raise stopgroup()
+            return batches.pop(0)
+        async def run():
+            try:
+                await self.group._run(None, None)
+            except stopgroup:
+                pass
+            tasks = dict(self.group.tasks)
+            for task in tasks.values():
+                task.cancel()
+            return tasks
+        with patch('postgres_stat_profiler.collection.collectorgroup.collector', stubcollector), \
+             patch.object(self.group, '_getControlMessages', side_effect=getControlMessages):
+            return asyncio.run(run())
+
+    def test_start(self):
+        tasks = self.runGroup([[(u'start', u'p1', u'profile1'), (u'start', u'p2', u'profile2')]])
+        assert sorted(tasks.keys()) == [u'p1', u'p2']
+        assert self.group.profiles == {u'p1': u'profile1', u'p2': u'profile2'}
+        assert stubcollector.started == [(u'p1', u'profile1'), (u'p2', u'profile2')]
+
+    def test_stop(self):
+        tasks = self.runGroup([[(u'start', u'p1', u'profile1'), (u'start', u'p2', u'profile2')],
+                               [(u'stop', u'p1', None), (u'stop', u'unknown', None)]])
+        assert list(tasks.keys()) == [u'p2']
+        assert self.group.profiles == {u'p2': u'profile2'}
+
+    # a start for a running profile cancels its collection, and starts one for the new profile
+    def test_restart_on_start(self):
+        tasks = self.runGroup([[(u'start', u'p1', u'profile1')], [(u'start', u'p1', u'profile1b')]])
+        assert stubcollector.started == [(u'p1', u'profile1'), (u'p1', u'profile1b')]
+        assert self.group.profiles == {u'p1': u'profile1b'}
+        first = self.snapshots[1][u'p1']
+        assert first.cancelled() and tasks[u'p1'] is not first
+
+    # a collection which ends is restarted on the next loop, one which is not collectable is not started
+    def test_restart_ended(self):
+        batches = [[(u'start', u'p1', u'ends'), (u'start', u'p2', u'invalid')], [], []]
+        tasks = self.runGroup(batches)
+        assert list(tasks.keys()) == [u'p1']
+        assert stubcollector.started.count((u'p1', u'ends')) >= 2
+        assert stubcollector.started.count((u'p2', u'invalid')) == 1
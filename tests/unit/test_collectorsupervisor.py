@@ -0,0 +1,62 @@
+import os
+import base64
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock
+from postgres_stat_profiler.config.profilestore import profilestore
+from postgres_stat_profiler.collection.collectorsupervisor import collectorsupervisor
+from postgres_stat_profiler.collection.controlchannel import controlchannel
+
+class TestCollectorsupervisor(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profilesfile = os.path.join(self.directory.name, 'profiles')
+        self.controlname = os.path.join(self.directory.name, 'ctl')
+        self.supervisor = collectorsupervisor('secret', self.profilesfile, controlname=self.controlname)
+        self.supervisor.controlchannel = controlchannel(self.controlname)
+        self.supervisor.controlchannel.listen()
+
+    def tearDown(self):
+        self.supervisor.controlchannel.close()
+        self.directory.cleanup()
+
+    def _data(self, name):
+        credentials = base64.urlsafe_b64encode(b'user:password').decode('utf-8')
+        connection = {'type': 'postgresql', 'host': 'localhost', 'port': 5432, 'credentials': credentials,
+                      'database': 'db', 'sslmode': 'disable'}
+        return {'name': name, 'status': 'disabled', 'monitored_connection': dict(connection),
+                'report_connection': dict(connection)}
+
+    def test_notified_changes(self):
+        # an api worker's store: changes written to the profiles file, then notified
+        api = profilestore('secret', self.profilesfile)
+        api.addProfile('p1', self._data('p1'))
+        api.addProfile('p2', self._data('p2'))
+        api.deleteProfileApi('p1')
+        notified = threading.Timer(0.05, controlchannel(self.controlname).notify)
+        notified.start()
+        self.supervisor._applyChanges(5)
+        notified.join()
+        assert list(self.supervisor.getProfilestore().getProfiles().keys()) == ['p2']
+
+    def test_file_change_reload(self):
+        api = profilestore('secret', self.profilesfile)
+        api.addProfile('p1', self._data('p1'))
+        # not notified: read at the periodic check
+        self.supervisor._applyChanges(0.01)
+        assert 'p1' in self.supervisor.getProfilestore().getProfiles()
+        # file replaced outside the api: read again in full
+        open(self.profilesfile, 'w').close()
+        self.supervisor._applyChanges(0.01)
+        assert self.supervisor.getProfilestore().getProfiles() == {}
+
+    def test_changed_configuration(self):
+        profile = MagicMock()
+        profile.getCollectionDetails.return_value = 'interval 60'
+        assert not self.supervisor._isChanged('p1', profile)
+        self.supervisor.collectorconfigs['p1'] = self.supervisor._getConfig(profile)
+        assert not self.supervisor._isChanged('p1', profile)
+        profile.getCollectionDetails.return_value = 'interval 10'
+        assert self.supervisor._isChanged('p1', profile)
@@ -0,0 +1,151 @@
+import sys
+import time
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch
+from psycopg.pq import TransactionStatus
+from postgres_stat_profiler.collection.connectionpool import connectionpool, asyncconnectionpool
+
+# in place of a psycopg connection: healthy until closed or broken
+class fakeconnection:
+
+    def __init__(self):
+        self.closed = False
+        self.broken = False
+        self.failing = False
+        self.executed = []
+        self.info = type('info', (), {'transaction_status': TransactionStatus.IDLE})()
+
+    def execute(self, query, parameters=None):
+        if self.failing:
+            raise Exception('server closed the connection unexpectedly')
+        self.executed.append(query)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+class fakeasyncconnection(fakeconnection):
+
+    async def execute(self, query, parameters=None):
+        fakeconnection.execute(self, query, parameters)
+
+    async def rollback(self):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+class TestConnectionpool(unittest.TestCase):
+
+    # threads checking connections out and in concurrently never fail, and never keep more than maxsize idle
+    def test_threads(self):
+        pool = connectionpool(maxsize=2)
+        switchinterval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        self.addCleanup(sys.setswitchinterval, switchinterval)
+        errors = []
+        def run():
+            try:
+                for i in range(500):
+                    with pool.connection('db1') as conn:
+                        conn.execute('SELECT 1')
+            except Exception as e:
+                errors.append(e)
+        with patch('postgres_stat_profiler.collection.connectionpool.psycopg.connect', side_effect=lambda *args, **kwargs: fakeconnection()):
+            threads = [threading.Thread(target=run) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert errors == []
+        assert len(pool.idle['db1']) <= 2
+
+    def _getPool(self):
+        self.connects = []
+        def connect(*args, **kwargs):
+            conn = fakeconnection()
+            self.connects.append(conn)
+            return conn
+        patcher = patch('postgres_stat_profiler.collection.connectionpool.psycopg.connect', side_effect=connect)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return connectionpool(maxsize=2, checkinterval=30.0)
+
+    # a connection used within checkinterval is reused without a probe
+    def test_reuse(self):
+        pool = self._getPool()
+        with pool.connection('db1') as conn:
+            first = conn
+        with pool.connection('db1') as conn:
+            assert conn is first and conn.executed == []
+        assert len(self.connects) == 1
+
+    # idle past checkinterval: probed, and reused when healthy
+    def test_stale_healthy(self):
+        pool = self._getPool()
+        conn = fakeconnection()
+        pool.idle['db1'] = [(conn, time.monotonic() - 60)]
+        assert pool.getConnection('db1') is conn
+        assert conn.executed == ['SELECT 1'] and len(self.connects) == 0
+
+    # idle past checkinterval and failing its probe: closed and replaced
+    def test_stale_broken(self):
+        pool = self._getPool()
+        conn = fakeconnection()
+        conn.failing = True
+        pool.idle['db1'] = [(conn, time.monotonic() - 60)]
+        replacement = pool.getConnection('db1')
+        assert replacement is not conn and conn.closed and len(self.connects) == 1
+
+    # closed or broken connections are replaced at checkout, and never returned to the pool
+    def test_closed_broken(self):
+        pool = self._getPool()
+        closed, broken = fakeconnection(), fakeconnection()
+        closed.closed = True
+        broken.broken = True
+        pool.idle['db1'] = [(closed, 0.0), (broken, 0.0)]
+        conn = pool.getConnection('db1')
+        assert conn is self.connects[0] and pool.idle['db1'] == []
+        pool.putConnection('db1', broken)
+        assert pool.idle['db1'] == []
+        pool.putConnection('db1', conn)
+        assert [entry[0] for entry in pool.idle['db1']] == [conn]
+
+    # a connection left in a transaction it cannot roll back is closed rather than pooled
+    def test_put_failing_rollback(self):
+        pool = self._getPool()
+        conn = fakeconnection()
+        conn.info.transaction_status = TransactionStatus.INERROR
+        def rollback():
+            raise Exception('connection lost')
+        conn.rollback = rollback
+        pool.putConnection('db1', conn)
+        assert conn.closed and pool.idle.get('db1', []) == []
+
+    # after a fork the child starts with an empty pool: the parent's connections are neither used nor closed
+    def test_fork(self):
+        pool = self._getPool()
+        conn = fakeconnection()
+        pool.idle['db1'] = [(conn, 1e12)]
+        pool.pid = pool.pid + 1
+        assert pool.getConnection('db1') is self.connects[0]
+        assert not conn.closed and pool.idle == {}
+
+    def test_async_stale_broken(self):
+        pool = asyncconnectionpool(maxsize=2)
+        conn = fakeasyncconnection()
+        conn.failing = True
+        pool.idle['db1'] = [(conn, time.monotonic() - 60)]
+        replacement = fakeasyncconnection()
+        async def connect(*args, **kwargs):
+            return replacement
+        with patch('postgres_stat_profiler.collection.connectionpool.psycopg.AsyncConnection.connect', side_effect=connect):
+            assert asyncio.run(pool.getConnection('db1')) is replacement
+        assert conn.closed
@@ -0,0 +1,56 @@
+import json
+import queue
+import logging
+import unittest
+from postgres_stat_profiler.helpers.log_helper import boundedqueuehandler, jsonformatter, profilefilter, getLogBatch, setLogProfile
+
+class TestLogHelper(unittest.TestCase):
+
+    def _record(self, message):
+        return logging.LogRecord('test', logging.WARNING, __file__, 1, message, None, None)
+
+    def test_drop_policy(self):
+        q = queue.Queue(maxsize=2)
+        h = boundedqueuehandler(q, u'drop')
+        for i in range(5):
+            h.emit(self._record('message {}'.format(i)))
+        assert h.getDropped() == 3
+        q.get_nowait()
+        h.emit(self._record('message 5'))
+        assert [r.getMessage() for r in getLogBatch(q)] == ['message 1', 'message 5']
+
+    def test_summarize_policy(self):
+        q = queue.Queue(maxsize=2)
+        h = boundedqueuehandler(q, u'summarize')
+        for i in range(4):
+            h.emit(self._record('message {}'.format(i)))
+        getLogBatch(q)
+        h.emit(self._record('message 4'))
+        records = getLogBatch(q)
+        assert records[0].dropped == 2
+        assert records[1].getMessage() == 'message 4'
+        assert h.getDropped() == 2
+        # a full queue also drops the summary: the count carries on into the next one
+        for i in range(5, 9):
+            h.emit(self._record('message {}'.format(i)))
+        getLogBatch(q)
+        h.emit(self._record('message 9'))
+        assert getLogBatch(q)[0].dropped == 2
+        assert h.getDropped() == 4
+
+    def test_batch_size(self):
+        q = queue.Queue()
+        for i in range(5):
+            q.put(i)
+        assert getLogBatch(q, 3) == [0, 1, 2]
+        assert getLogBatch(q, 3) == [3, 4]
+
+    def test_json_profile_context(self):
+        setLogProfile('profile1')
+        record = self._record('collected')
+        profilefilter().filter(record)
+        line = json.loads(jsonformatter().format(record))
+        assert line['profile'] == 'profile1'
+        assert line['message'] == 'collected'
+        assert line['level'] == 'WARNING'
+        setLogProfile(None)
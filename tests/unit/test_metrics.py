@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock
+from postgres_stat_profiler.metrics.metricsblock import metricsblock
+from postgres_stat_profiler.metrics.openmetrics import openmetrics
+from postgres_stat_profiler.api_auth.api_request import api_request
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.block = metricsblock(create=True)
+
+    def tearDown(self):
+        self.block.close()
+
+    def test_slots(self):
+        slot = self.block.claimSlot('p1')
+        assert self.block.claimSlot('p1') == slot
+        assert self.block.claimSlot('p2') != slot
+        attached = metricsblock(self.block.getName())
+        assert attached.getSlot('p2') == self.block.getSlot('p2')
+        attached.close()
+        self.block.releaseSlot('p1')
+        assert self.block.getSlot('p1') is None
+        assert [name for name, fields, phases in self.block.getSnapshot()] == ['p2']
+
+    def test_record(self):
+        slot = self.block.claimSlot('p1')
+        self.block.recordCollection(slot, True, 60, 0.5, {'fetch': 0.25, 'commit': 0.125}, 300, 120, 6000, 6001.0)
+        self.block.recordCollection(slot, False, 60, 1.5, {}, 0, 0, 0, 6061.0)
+        self.block.recordCollection(slot, False, 60, 2.5, {}, 0, 0, 0, 6121.0)
+        name, fields, phases = self.block.getSnapshot()[0]
+        assert fields['collections_total'] == 3 and fields['failures_total'] == 2
+        assert fields['consecutive_failures'] == 2
+        assert fields['rows_collected_total'] == 300 and fields['last_collect_epoch'] == 6000
+        assert fields['schedule_drift_seconds'] == 2.5
+        assert phases['fetch'] == (0.25, 0.25)
+        self.block.recordCollection(slot, True, 60, 0.5, {'fetch': 0.5}, 300, 120, 6180, 6181.0)
+        name, fields, phases = self.block.getSnapshot()[0]
+        assert fields['consecutive_failures'] == 0
+        assert phases['fetch'] == (0.75, 0.5)
+
+    def test_openmetrics(self):
+        slot = self.block.claimSlot('p"1')
+        self.block.recordCollection(slot, True, 60, 0.5, {'fetch': 0.25}, 300, 120, 6000, 6001.0)
+        text = openmetrics().getText(self.block.getSnapshot(), 6031.0)
+        lines = text.splitlines()
+        assert lines[-1] == '# EOF'
+        assert 'pg_stat_profiler_collections_total{profile="p\\"1"} 1' in lines
+        assert 'pg_stat_profiler_collection_lag_seconds{profile="p\\"1"} 30' in lines
+        assert 'pg_stat_profiler_collect_phase_seconds_sum{profile="p\\"1",phase="fetch"} 0.25' in lines
+        assert 'pg_stat_profiler_collect_phase_seconds_count{profile="p\\"1",phase="fetch"} 1' in lines
+        assert '# TYPE pg_stat_profiler_collections counter' in lines
+
+    def test_bearer_apikey(self):
+        authorization = MagicMock(type='bearer', token='abc123')
+        req = api_request(MagicMock(authorization=authorization))
+        assert req.getRequestkey() == 'abc123'
@@ -0,0 +1,57 @@
+import unittest
+from unittest.mock import MagicMock
+from postgres_stat_profiler.config.reportsettings import reportsettings
+from postgres_stat_profiler.collection.partitionmanager import partitionmanager
+from postgres_stat_profiler.collection.reportschema import reportschema
+
+class TestPartitionmanager(unittest.TestCase):
+
+    def test_invalid_settings(self):
+        assert not reportsettings({'partitioninterval': 'weekly'}).getValid()
+        assert not reportsettings({'retentiondays': -1}).getValid()
+        assert reportsettings({}).getValid()
+
+    def test_partition_names(self):
+        manager = partitionmanager('', reportsettings({}))
+        name = manager._getPartitionName('incremental_result_pg_stat_statements', 'hourly', 1704070800)
+        assert name == 'incremental_result_pg_stat_statements_2024010101'
+        assert manager._getPartitionStart('incremental_result_pg_stat_statements', 'hourly', name) == 1704070800
+        assert manager._getPartitionStart('incremental_result_pg_stat_statements', 'hourly', 'incremental_result_pg_stat_statements_p1') is None
+
+    def test_is_due(self):
+        manager = partitionmanager('', reportsettings({}))
+        assert manager.isDue(1704070800)
+        manager.layout = {'partitioninterval': 'daily', 'partitionbyprofile': 'disabled', 'retentiondays': 90}
+        manager.bucket = 1704067200
+        assert not manager.isDue(1704070800)
+        assert manager.isDue(1704067200 + 86400)
+
+    def test_partitioned_schema(self):
+        tables = reportschema(reportsettings({'partitionbyprofile': 'enabled'})).getCreateTables()
+        assert any(['PARTITION BY LIST (profilename)' in command for command in tables])
+        tables = reportschema(reportsettings({'partitioninterval': 'none'})).getCreateTables()
+        assert not any(['PARTITION BY' in command for command in tables])
+
+    # expired daily partitions are only dropped once the hourly rollup has covered them
+    def test_expiry_after_rollup(self):
+        day = 86400
+        epoch = 100 * day
+        layout = {'partitioninterval': 'daily', 'partitionbyprofile': 'disabled', 'retentiondays': 10}
+        for watermark, rollups, dropped in [(epoch, 'enabled', 90), (80 * day, 'enabled', 80), (None, 'enabled', 0),
+                                            (None, 'disabled', 90)]:
+            manager = partitionmanager('', reportsettings({'rollups': rollups}))
+            manager.layout = layout
+            parent = 'incremental_result_pg_stat_statements'
+            conn = MagicMock()
+            def execute(query, parameters=None):
+                result = MagicMock()
+                if 'rollup_watermark' in query:
+                    result.fetchone.return_value = {'watermark_epoch': watermark}
+                else:
+                    result.fetchall.return_value = [{'relname': manager._getPartitionName(parent, 'daily', start * day)}
+                                                    for start in range(0, 100)]
+                return result
+            conn.execute.side_effect = execute
+            expiry = manager._getExpiry(conn, 'p1', epoch, 10)
+            manager._dropExpired(conn, parent, 'daily', expiry, day)
+            assert conn.commit.call_count == dropped, (watermark, rollups)
@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+import psycopg
+from datetime import datetime
+from unittest.mock import MagicMock
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+from postgres_stat_profiler.config.reportsettings import reportsettings
+from postgres_stat_profiler.collection.postgresCollector import postgrescollector
+from postgres_stat_profiler.collection.asyncPostgresCollector import asyncpostgrescollector
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+from postgres_stat_profiler.models.incremental_statstatements import incremental_statstatements
+from postgres_stat_profiler.models.querytext_statstatements import querytext_statstatements
+
+# in place of a psycopg copy: binary copies reject the column types when typeerror is set
+class fakecopy:
+
+    def __init__(self, query, typeerror):
+        self.query = query
+        self.typeerror = typeerror
+        self.rows = []
+
+    def set_types(self, types):
+        if self.typeerror:
+            raise psycopg.DataError('cannot dump')
+
+    def write_row(self, row):
+        self.rows.append(row)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+class fakeasynccopy(fakecopy):
+
+    async def write_row(self, row):
+        fakecopy.write_row(self, row)
+
+# in place of a report database connection, recording its copies and rollbacks
+class fakecopyconnection:
+
+    def __init__(self, copyclass=fakecopy):
+        self.copyclass = copyclass
+        self.copies = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return self
+
+    def copy(self, query):
+        self.copies.append(self.copyclass(query, u'FORMAT BINARY' in query))
+        return self.copies[-1]
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+class fakeasynccopyconnection(fakecopyconnection):
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return False
+
+class TestPostgrescollector(unittest.TestCase):
+
+    def setUp(self):
+        self.profile = MagicMock()
+        self.profile.getName.return_value = 'p1'
+        self.profile.getQueryEncryption.return_value = 'disabled'
+        self.profile.getCollectionSettings.return_value = collectionsettings({})
+        self.profile.getReportSettings.return_value = reportsettings({})
+        self.dbcollector = postgrescollector(self.profile, checkstatus=False)
+        self.cumulativess = cumulative_statstatements()
+        self.querytextss = querytext_statstatements()
+
+    def _getCollectRecord(self, dbid, queryid, query):
+        row = dict([(name, 0) for name in self.cumulativess.getColumns()])
+        row.update({'username': 'u1', 'dbname': 'db1', 'dbid': dbid, 'userid': 10, 'queryid': queryid, 'query': query,
+                    'toplevel': True})
+        return row
+
+    # (upserted keys, touched keys, seen) of one cycle at epoch over (dbid, queryid, query) statements
+    def _getQueryTexts(self, epoch, statements):
+        collectrecords = [self._getCollectRecord(*statement) for statement in statements]
+        cumulativerecords = [self.cumulativess.getInsertRecord('p1', datetime(2024, 1, 1), epoch, collectrecord, 'select')
+                             for collectrecord in collectrecords]
+        upserts, touches, seen = self.dbcollector._getQueryTextRecords(self.querytextss, self.cumulativess, datetime(2024, 1, 1),
+                                                                       epoch, None, collectrecords, cumulativerecords)
+        return [(upsert[1], upsert[2]) for upsert in upserts], touches, seen
+
+    def test_new_text(self):
+        self.dbcollector.querytexts = {}
+        # the same (dbid, queryid) for two users is written once
+        upserts, touches, seen = self._getQueryTexts(7200, [(1, 11, 'select 1'), (1, 11, 'select 1'), (2, 11, 'select 1'),
+                                                            (1, None, '<insufficient privilege>')])
+        assert upserts == [(1, '11'), (2, '11')] and touches == []
+        assert seen[(1, '11')] == (hash('select 1'), 7200)
+
+    def test_changed_text(self):
+        self.dbcollector.querytexts = {(1, '11'): (hash('select 1'), 7000)}
+        upserts, touches, seen = self._getQueryTexts(7200, [(1, 11, 'select 2')])
+        assert upserts == [(1, '11')] and touches == []
+        assert seen[(1, '11')] == (hash('select 2'), 7200)
+
+    # unchanged texts are touched (last_seen) once per touch interval
+    def test_unchanged_text(self):
+        interval = postgrescollector.querytext_touch_interval
+        self.dbcollector.querytexts = {(1, '11'): (hash('select 1'), 7000)}
+        upserts, touches, seen = self._getQueryTexts(7000 + interval - 60, [(1, 11, 'select 1')])
+        assert upserts == [] and touches == [] and seen == {}
+        upserts, touches, seen = self._getQueryTexts(7000 + interval, [(1, 11, 'select 1')])
+        assert upserts == [] and touches == [(1, '11')]
+        assert seen[(1, '11')] == (hash('select 1'), 7000 + interval)
+        assert self.dbcollector._getTouchParameters('t', touches) == ['t', [1], ['11'], 'p1']
+
+    # keys loaded from the report database have no text hash: the stored text is kept, and its hash learnt
+    def test_preloaded_text(self):
+        self.dbcollector.querytexts = self.dbcollector._getKnownQueryTexts([{'dbid': 1, 'queryid': '11'}])
+        assert self.dbcollector.querytexts == {(1, '11'): (None, 0)}
+        upserts, touches, seen = self._getQueryTexts(600, [(1, 11, 'select 1')])
+        assert upserts == [] and touches == []
+        assert seen == {(1, '11'): (hash('select 1'), 0)}
+        self.dbcollector.querytexts.update(seen)
+        upserts, touches, seen = self._getQueryTexts(660, [(1, 11, 'select 2')])
+        assert upserts == [(1, '11')]
+        # past the touch interval since the epoch of the load (0), a preloaded key is touched
+        self.dbcollector.querytexts = self.dbcollector._getKnownQueryTexts([{'dbid': 1, 'queryid': '11'}])
+        upserts, touches, seen = self._getQueryTexts(7200, [(1, 11, 'select 1')])
+        assert upserts == [] and touches == [(1, '11')] and seen[(1, '11')] == (hash('select 1'), 7200)
+
+    # the binary copy is rolled back and retried with the explicit text format query
+    def test_copy_text_fallback(self):
+        records = [[1, 'a'], [2, 'b']]
+        for ss in [self.cumulativess, incremental_statstatements()]:
+            rconn = fakecopyconnection()
+            self.dbcollector._copyRecords(rconn, ss.getCopyQuery(), ss.getTextCopyQuery(), ss.getCopyTypes(), records)
+            copies = rconn.copies
+            assert rconn.rollbacks == 1
+            assert [copy.query for copy in copies] == [ss.getCopyQuery(), ss.getTextCopyQuery()]
+            assert copies[1].query.endswith('FROM STDIN (FORMAT TEXT)') and copies[1].rows == records
+            assert copies[1].query.replace('(FORMAT TEXT)', '') == copies[0].query.replace('(FORMAT BINARY)', '')
+
+    def test_copy_text_fallback_async(self):
+        dbcollector = asyncpostgrescollector(self.profile)
+        rconn = fakeasynccopyconnection(fakeasynccopy)
+        ss = self.cumulativess
+        asyncio.run(dbcollector._copyRecordsAsync(rconn, ss.getCopyQuery(), ss.getTextCopyQuery(), ss.getCopyTypes(), [[1, 'a']]))
+        copies = rconn.copies
+        assert rconn.rollbacks == 1
+        assert [copy.query for copy in copies] == [ss.getCopyQuery(), ss.getTextCopyQuery()] and copies[1].rows == [[1, 'a']]
@@ -0,0 +1,125 @@
+import os
+import base64
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+from postgres_stat_profiler.config.profilestore import profilestore
+
+class TestProfilestore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.profilesfile = os.path.join(self.directory.name, 'profiles')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _data(self, name, interval=60):
+        credentials = base64.urlsafe_b64encode(b'user:password').decode('utf-8')
+        connection = {'type': 'postgresql', 'host': 'localhost', 'port': 5432, 'credentials': credentials,
+                      'database': 'db', 'sslmode': 'disable'}
+        return {'name': name, 'status': 'disabled', 'monitored_connection': dict(connection),
+                'report_connection': dict(connection), 'collection_settings': {'interval': interval}}
+
+    def _lines(self):
+        with open(self.profilesfile) as cf:
+            return len(cf.readlines())
+
+    def test_append_and_reload(self):
+        store = profilestore('secret', self.profilesfile)
+        assert store.addProfile('p1', self._data('p1'))
+        assert store.addProfile('p2', self._data('p2'))
+        assert store.updateProfile('p1', {'collection_settings': {'interval': 300}})
+        assert store.deleteProfileApi('p2')
+        assert self._lines() == 4
+        reloaded = profilestore('secret', self.profilesfile)
+        assert list(reloaded.getProfiles().keys()) == ['p1']
+        assert reloaded.getProfiles()['p1'].getCollectionSettings().getInterval() == 300
+        # loading does not write the file
+        assert self._lines() == 4
+
+    def test_compaction(self):
+        store = profilestore('secret', self.profilesfile)
+        store.addProfile('p1', self._data('p1'))
+        for i in range(store.compact_slack + 10):
+            store.updateProfile('p1', {'collection_settings': {'interval': 60 if i % 2 else 300}})
+        assert self._lines() < store.compact_slack
+        assert list(profilestore('secret', self.profilesfile).getProfiles().keys()) == ['p1']
+
+    def test_unreadable_record(self):
+        store = profilestore('secret', self.profilesfile)
+        store.addProfile('p1', self._data('p1'))
+        with open(self.profilesfile, 'a') as cf:
+            cf.write('gAAAAAB-interrupted')
+        reloaded = profilestore('secret', self.profilesfile)
+        assert list(reloaded.getProfiles().keys()) == ['p1']
+        assert not reloaded.valid
+        # the first change after the interrupted write is not lost
+        assert reloaded.updateProfile('p1', {'collection_settings': {'interval': 120}})
+        assert profilestore('secret', self.profilesfile).getProfiles()['p1'].getCollectionSettings().getInterval() == 120
+        # never compacted while a record is unreadable
+        for i in range(reloaded.compact_slack + 10):
+            reloaded.updateProfile('p1', {'collection_settings': {'interval': 60}})
+        assert self._lines() > reloaded.compact_slack
+
+    def test_import(self):
+        store = profilestore('secret', self.profilesfile)
+        store.addProfile('p1', self._data('p1'))
+        request = MagicMock()
+        request.get_json.return_value = {'profiles': [self._data('p1', 300), self._data('p2'), {'name': 'p3'}, {}]}
+        imported, errors = store.importProfilesApi(request)
+        assert imported == ['p1', 'p2'] and errors == ['p3', 3]
+        assert self._lines() == 3
+        reloaded = profilestore('secret', self.profilesfile)
+        assert sorted(reloaded.getProfiles().keys()) == ['p1', 'p2']
+        assert reloaded.getProfiles()['p1'].getCollectionSettings().getInterval() == 300
+        assert [details['name'] for details in reloaded.getBulkApiDetails()] == ['p1', 'p2']
+
+    def test_shared_file(self):
+        # two processes' stores (eg api workers) on one profiles file
+        first = profilestore('secret', self.profilesfile)
+        second = profilestore('secret', self.profilesfile)
+        assert first.addProfile('p1', self._data('p1'))
+        second.refresh()
+        assert list(second.getProfiles().keys()) == ['p1']
+        # a change is checked against the latest records
+        assert not second.addProfile('p1', self._data('p1'))
+        assert second.addProfile('p2', self._data('p2'))
+        first.refresh()
+        assert sorted(first.getProfiles().keys()) == ['p1', 'p2']
+        # compacted by one store, read again in full by the other
+        for i in range(first.compact_slack + 10):
+            first.updateProfile('p1', {'collection_settings': {'interval': 60 if i % 2 else 300}})
+        assert self._lines() < first.compact_slack
+        second.refresh()
+        assert sorted(second.getProfiles().keys()) == ['p1', 'p2']
+        assert second.getProfiles()['p1'].getCollectionSettings().getInterval() == first.getProfiles()['p1'].getCollectionSettings().getInterval()
+
+    def test_partial_record(self):
+        store = profilestore('secret', self.profilesfile)
+        store.addProfile('p1', self._data('p1'))
+        reader = profilestore('secret', self.profilesfile)
+        record = store._getProfileRecord('p1')
+        # a record being written is read once complete
+        with open(self.profilesfile, 'a') as cf:
+            cf.write(record[:20])
+        reader.refresh()
+        assert reader.valid
+        with open(self.profilesfile, 'a') as cf:
+            cf.write(record[20:])
+        reader.refresh()
+        assert reader.valid and reader.filerecords == 2
+
+    def test_runtime_status(self):
+        store = profilestore('secret', self.profilesfile)
+        store.addProfile('p1', self._data('p1'))
+        # api data cannot set runtime status
+        assert store.updateProfile('p1', {'status': 'enabled', 'monitordbstatus': 'operational', 'lastcollectepoch': 9999,
+                                          'lasterror': 'faked'})
+        thisprofile = store.getProfiles()['p1']
+        assert thisprofile.getStatus() == 'enabled'
+        assert thisprofile.getMonitoredDBstatus() == 'unknown'
+        assert thisprofile.getLastCollectEpoch() is None and thisprofile.getLastError() is None
+        assert store.setProfileStatus('p1', {'monitordbstatus': 'operational', 'lastcollectepoch': 6000})
+        assert store.getLastCollectEpoch('p1') == 6000
+        assert thisprofile.getMonitoredDBstatus() == 'operational'
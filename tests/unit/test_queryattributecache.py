@@ -0,0 +1,34 @@
+import base64
+import unittest
+from postgres_stat_profiler.collection.queryattributecache import queryattributecache
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+
+class TestQueryattributecache(unittest.TestCase):
+
+    def test_querytype_cached(self):
+        cache = queryattributecache()
+        cumulativess = cumulative_statstatements()
+        assert cache.getQueryType(1, u'select 1', cumulativess.getQueryType) == u'select'
+        assert cache.getQueryType(1, u'select 1', cumulativess.getQueryType) == u'select'
+        assert cache.getHits() == 1 and cache.getMisses() == 1
+        # changed text for the same queryid is derived again
+        assert cache.getQueryType(1, u'update t set a = 1', cumulativess.getQueryType) == u'update'
+        assert cache.getMisses() == 2
+
+    def test_ciphertext_and_fernet(self):
+        cache = queryattributecache()
+        secret = base64.urlsafe_b64encode(b'secret').decode('utf-8')
+        fernet = cache.getFernet(secret)
+        assert cache.getFernet(secret) is fernet
+        ciphertext = cache.getCipherText(1, u'select 1', fernet)
+        assert cache.getCipherText(1, u'select 1', fernet) == ciphertext
+        assert fernet.decrypt(ciphertext.encode('utf-8')).decode('utf-8') == u'select 1'
+
+    def test_bounded(self):
+        cache = queryattributecache(maxsize=2)
+        for queryid in [1, 2, 3]:
+            cache.getQueryType(queryid, u'select {}'.format(queryid), lambda query: u'select')
+        assert cache.getSize() == 2
+        # least recently used entry (queryid 1) was evicted
+        cache.getQueryType(1, u'select 1', lambda query: u'select')
+        assert cache.getMisses() == 4
@@ -0,0 +1,77 @@
+import csv
+import json
+import decimal
+import datetime
+import unittest
+from flask import Flask, Response, request, stream_with_context
+from postgres_stat_profiler.reporting.exportrequest import exportrequest
+from postgres_stat_profiler.reporting.reportexport import reportexport
+
+class TestReportexport(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+        self.batches = [[{'result_epoch': 60, 'queryid': '1', 'calls': 2, 'wal_bytes': decimal.Decimal('10'),
+                          'result_time': datetime.datetime(2024, 1, 1, 0, 1)},
+                         {'result_epoch': 60, 'queryid': '2', 'calls': 1, 'wal_bytes': decimal.Decimal('0.5'),
+                          'result_time': datetime.datetime(2024, 1, 1, 0, 1)}],
+                        [{'result_epoch': 120, 'queryid': '1', 'calls': 3, 'wal_bytes': None,
+                          'result_time': datetime.datetime(2024, 1, 1, 0, 2)}]]
+
+    def _getRequest(self, querystring):
+        with self.app.test_request_context('/?' + querystring):
+            return exportrequest(request)
+
+    def test_request(self):
+        export = self._getRequest('')
+        assert export.getValid()
+        assert export.getFormat() == 'ndjson'
+        assert export.getWindow(86400) == (1, 86401)
+        export = self._getRequest('format=csv&start=100&end=1000&after=599&granularity=hourly')
+        assert export.getValid()
+        assert export.getWindow(86400) == (600, 1000)
+        assert export.getTable() == 'hourly_pg_stat_statements'
+        assert not self._getRequest('format=xml').getValid()
+        assert not self._getRequest('after=x').getValid()
+
+    def test_ndjson(self):
+        chunks = list(reportexport('ndjson').getChunks(iter(self.batches)))
+        assert len(chunks) == 2
+        rows = [json.loads(line) for line in ''.join(chunks).splitlines()]
+        assert [row['calls'] for row in rows] == [2, 1, 3]
+        assert rows[0]['wal_bytes'] == 10 and rows[1]['wal_bytes'] == 0.5 and rows[2]['wal_bytes'] is None
+        assert rows[0]['result_time'] == '2024-01-01T00:01:00'
+
+    def test_csv(self):
+        chunks = list(reportexport('csv').getChunks(iter(self.batches)))
+        rows = list(csv.reader(''.join(chunks).splitlines()))
+        assert rows[0] == ['result_epoch', 'queryid', 'calls', 'wal_bytes', 'result_time']
+        assert len(rows) == 4
+        assert rows[3][0] == '120' and rows[3][3] == ''
+
+    def test_error_ends_stream(self):
+        def batches():
+            yield self.batches[0]
+            raise ValueError('connection lost')
+        chunks = []
+        with self.assertRaises(ValueError):
+            for chunk in reportexport('ndjson').getChunks(batches()):
+                chunks.append(chunk)
+        assert len(chunks) == 1
+
+    def test_truncated_response(self):
+        def batches():
+            yield self.batches[0]
+            raise ValueError('canceling statement due to statement timeout')
+        app = Flask(__name__)
+        @app.route('/export')
+        def export():
+            return Response(stream_with_context(reportexport('ndjson').getChunks(batches())), mimetype='application/x-ndjson')
+        # the response is not ended as a complete one: the server sees the error after the first chunk
+        response = app.test_client().get('/export', buffered=False)
+        assert response.status_code == 200
+        received = []
+        with self.assertRaises(ValueError):
+            for chunk in response.response:
+                received.append(chunk)
+        assert len(received) == 1
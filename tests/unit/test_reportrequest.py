@@ -0,0 +1,32 @@
+import unittest
+from flask import Flask, request
+from postgres_stat_profiler.reporting.reportrequest import reportrequest
+
+class TestReportrequest(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def _getRequest(self, querystring):
+        with self.app.test_request_context('/?' + querystring):
+            return reportrequest(request)
+
+    def test_defaults(self):
+        report = self._getRequest('')
+        assert report.getValid()
+        assert report.getWindow(7200) == (3601, 7201)
+        assert report.getTable() == 'incremental_result_pg_stat_statements'
+        assert report.getCursor() is None
+
+    def test_parameters(self):
+        cursor = reportrequest.encodeCursor([12.5, 16384, 10, '42'])
+        report = self._getRequest('start=100&end=200&metric=wal_bytes&limit=10&granularity=hourly&dbname=db1&cursor=' + cursor)
+        assert report.getValid()
+        assert report.getWindow(7200) == (100, 200)
+        assert report.getTable() == 'hourly_pg_stat_statements'
+        assert report.getFilters() == {'dbname': 'db1'}
+        assert report.getCursor() == [12.5, 16384, 10, '42']
+
+    def test_invalid(self):
+        for querystring in ['metric=query', 'limit=0', 'start=200&end=100', 'granularity=weekly', 'cursor=xyz', 'start=abc']:
+            assert not self._getRequest(querystring).getValid()
@@ -0,0 +1,39 @@
+import gzip
+import unittest
+from postgres_stat_profiler.reporting.responsecache import responsecache
+
+class TestResponsecache(unittest.TestCase):
+
+    def test_epoch_invalidation(self):
+        cache = responsecache()
+        entry = cache.put('k', 60, b'{"result": []}')
+        assert cache.get('k', 60) is entry
+        assert cache.get('k', 120) is None
+        assert cache.get('k', 60) is None
+        assert cache.getStats()['entries'] == 0
+
+    def test_etag_and_gzip(self):
+        cache = responsecache(gzipminsize=100)
+        small = cache.put('small', 60, b'{}')
+        large = cache.put('large', 60, b'x' * 1000)
+        assert small['gzip'] is None
+        assert gzip.decompress(large['gzip']) == b'x' * 1000
+        assert small['etag'] != large['etag']
+        assert cache.put('again', 60, b'{}')['etag'] == small['etag']
+
+    def test_unknown_epoch_not_cached(self):
+        cache = responsecache()
+        assert cache.put('k', None, b'{}')['etag'] is not None
+        assert cache.getStats()['entries'] == 0
+
+    def test_lru_eviction(self):
+        cache = responsecache(maxentries=2, maxbytes=250, gzipminsize=1000)
+        cache.put('a', 60, b'a' * 100)
+        cache.put('b', 60, b'b' * 100)
+        cache.get('a', 60)
+        cache.put('c', 60, b'c' * 10)
+        assert cache.get('b', 60) is None
+        assert cache.get('a', 60) is not None
+        cache.put('d', 60, b'd' * 100)
+        assert cache.get('c', 60) is None
+        assert cache.getStats()['bytes'] == 200
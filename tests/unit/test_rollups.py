@@ -0,0 +1,63 @@
+import unittest
+from unittest.mock import MagicMock
+from postgres_stat_profiler.config.reportsettings import reportsettings
+from postgres_stat_profiler.collection.rollupmanager import rollupmanager
+from postgres_stat_profiler.collection.partitionmanager import partitionmanager
+from postgres_stat_profiler.models.rollup_statstatements import rollup_statstatements
+
+class TestRollups(unittest.TestCase):
+
+    def test_rollup_queries(self):
+        rollupss = rollup_statstatements()
+        hourly = rollupss.getRollupQuery('hourly')
+        assert 'FROM postgres_stat_profiler.incremental_result_pg_stat_statements' in hourly
+        assert 'stddev_exec_time' in hourly
+        daily = rollupss.getRollupQuery('daily')
+        assert 'FROM postgres_stat_profiler.hourly_pg_stat_statements' in daily
+        assert 'sum(sumsq_exec_time)' in daily
+        assert hourly.count('%s') == 3 and daily.count('%s') == 3
+
+    def test_is_due(self):
+        manager = rollupmanager('', reportsettings({}))
+        assert manager.isDue(1704070800)
+        manager.bucket = 1704070800
+        assert not manager.isDue(1704070800 + 1800)
+        assert manager.isDue(1704070800 + 3600)
+        assert not rollupmanager('', reportsettings({'rollups': 'disabled'})).isDue(1704070800)
+        assert not reportsettings({'hourlyretentiondays': -1}).getValid()
+
+    # minute rows are deleted only past the retention and the hourly watermark, and only when asked to
+    def test_minute_retention(self):
+        day = 86400
+        epoch = 100 * day
+        for watermark, minuteretention, kept in [(epoch, True, 10), (95 * day, True, 10), (85 * day, True, 15),
+                                                 (0, True, 100), (epoch, False, 100)]:
+            rows = {table: list(range(0, epoch, day)) for table in rollupmanager.minute_tables}
+            conn = MagicMock()
+            def execute(query, parameters=None):
+                result = MagicMock()
+                if 'rollup_watermark' in query:
+                    result.fetchone.return_value = {'watermark_epoch': watermark}
+                for table in rows:
+                    if query.startswith('DELETE FROM postgres_stat_profiler.{} '.format(table)):
+                        rows[table] = [row for row in rows[table] if row >= parameters[1]]
+                return result
+            conn.execute.side_effect = execute
+            rollupmanager('', reportsettings({'retentiondays': 10}))._expire(conn, 'p1', epoch, minuteretention)
+            for table in rows:
+                assert len(rows[table]) == kept, (watermark, minuteretention, table)
+
+    # report databases with no recorded layout (initialised before retention existed) keep their minute history
+    def test_minute_retention_recorded(self):
+        manager = partitionmanager('', reportsettings({}))
+        assert not manager.isDeleteExpired()
+        conn = MagicMock()
+        conn.execute.return_value.fetchone.return_value = None
+        manager.layout = manager._getLayout(conn)
+        assert not manager.isDeleteExpired() and manager.layout['retentiondays'] == 0
+        conn.execute.return_value.fetchone.return_value = {'partitioninterval': 'none', 'partitionbyprofile': 'disabled',
+                                                           'retentiondays': 90}
+        manager.layout = manager._getLayout(conn)
+        assert manager.isDeleteExpired()
+        manager.layout = {'partitioninterval': 'daily', 'partitionbyprofile': 'disabled', 'retentiondays': 90}
+        assert not manager.isDeleteExpired()
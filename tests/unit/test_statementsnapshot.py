@@ -0,0 +1,138 @@
+import unittest
+import numpy as np
+from datetime import datetime
+from decimal import Decimal
+from postgres_stat_profiler.models.cumulative_statstatements import cumulative_statstatements
+from postgres_stat_profiler.collection.statementsnapshot import statementsnapshot
+from postgres_stat_profiler.collection.statementselection import statementselection
+from postgres_stat_profiler.config.collectionsettings import collectionsettings
+
+class TestStatementsnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.cumulativess = cumulative_statstatements()
+        self.columns = self.cumulativess.getColumns()
+
+    def _getRecord(self, epoch, queryid, calls, total_exec_time, wal_bytes=0):
+        row = {}
+        for name in self.columns:
+            row[name] = 0
+        row.update({'username': 'u1', 'dbname': 'db1', 'dbid': 1, 'userid': 10, 'queryid': queryid,
+                    'query': 'select {}'.format(queryid), 'toplevel': True, 'calls': calls,
+                    'total_exec_time': total_exec_time, 'min_exec_time': 0.5, 'max_exec_time': 9.5,
+                    'wal_bytes': Decimal(wal_bytes)})
+        return self.cumulativess.getInsertRecord('p1', datetime(2024, 1, 1), epoch, row)
+
+    def test_delta(self):
+        previous = statementsnapshot(self.columns, 60, [self._getRecord(60, 1, 10, 100.0, 1000),
+                                                         self._getRecord(60, 2, 5, 50.0)])
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 14, 120.0, 1500),
+                                                        self._getRecord(120, 2, 5, 50.0),
+                                                        self._getRecord(120, 3, 7, 70.0)])
+        records = latest.getDeltaRecords(previous)
+        # queryid 2 has no new calls, queryid 3 is new: all of its calls are since previous
+        assert len(records) == 2
+        assert dict(zip(self.columns, records[1]))['calls'] == 7
+        record = dict(zip(self.columns, records[0]))
+        assert record['queryid'] == '1'
+        assert record['result_epoch'] == 120
+        assert record['calls'] == 4
+        assert record['total_exec_time'] == 20.0
+        assert record['mean_exec_time'] == 5.0
+        assert record['max_exec_time'] == 9.5
+        assert record['wal_bytes'] == 500
+
+    # the lifetime statistics of queryid 1 after each list of execution times, as pg_stat_statements reports them
+    def _getExecutionsRecord(self, epoch, executions):
+        record = self._getRecord(epoch, 1, len(executions), float(sum(executions)))
+        record[self.columns.index('mean_exec_time')] = float(np.mean(executions))
+        record[self.columns.index('stddev_exec_time')] = float(np.std(executions))
+        return record
+
+    # each interval's sum of squares is exact, so the variance of merged intervals is that of their executions
+    def test_delta_variance(self):
+        executions = [[1.0, 2.0, 3.0, 4.0], [10.0, 20.0], [5.0], [7.0, 7.0, 9.0]]
+        snapshots = [statementsnapshot(self.columns, 60 * (i + 1), [self._getExecutionsRecord(60 * (i + 1), sum(executions[:i + 1], []))])
+                     for i in range(len(executions))]
+        sumsq = []
+        for i in range(1, len(snapshots)):
+            record = snapshots[i].getDeltaRecords(snapshots[i - 1])[0]
+            assert len(record) == len(self.columns) + 1
+            sumsq.append(record[-1])
+            self.assertAlmostEqual(record[-1], sum([x * x for x in executions[i]]))
+        merged = sum(executions[1:], [])
+        calls, total = len(merged), sum(merged)
+        self.assertAlmostEqual(sum(sumsq) / calls - (total / calls) ** 2, float(np.var(merged)))
+        # 'other' records sum the sums of squares of their statements
+        other = snapshots[1].getOtherRecords(snapshots[0], [])[0]
+        self.assertAlmostEqual(other[-1], 500.0)
+
+    def test_delta_after_reset(self):
+        previous = statementsnapshot(self.columns, 60, [self._getRecord(60, 1, 10, 100.0)])
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 3, 6.0)])
+        record = dict(zip(self.columns, latest.getDeltaRecords(previous)[0]))
+        assert record['calls'] == 3
+        assert record['mean_exec_time'] == 2.0
+
+    def test_no_previous(self):
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 3, 6.0)])
+        assert latest.getDeltaRecords(None) == []
+
+    def test_changed(self):
+        previous = statementsnapshot(self.columns, 60, [self._getRecord(60, 1, 10, 100.0),
+                                                         self._getRecord(60, 2, 5, 50.0)])
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 11, 110.0),
+                                                        self._getRecord(120, 2, 5, 50.0),
+                                                        self._getRecord(120, 3, 7, 70.0)])
+        queryids = [dict(zip(self.columns, r))['queryid'] for r in latest.getChangedRecords(previous)]
+        assert queryids == ['1', '3']
+        assert len(latest.getChangedRecords(None)) == 3
+
+    def test_selection_by_recent_activity(self):
+        settings = collectionsettings({'topn': 2})
+        selection = statementselection(settings)
+        # queryid 1 is heavy over its lifetime but idle now, queryid 3 is new and busy
+        previous = statementsnapshot(self.columns, 60, [self._getRecord(60, 1, 1000, 90000.0),
+                                                         self._getRecord(60, 2, 5, 50.0)])
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 1000, 90000.0),
+                                                        self._getRecord(120, 2, 6, 60.0),
+                                                        self._getRecord(120, 3, 20, 400.0)])
+        queryids = [dict(zip(self.columns, r))['queryid'] for r in latest.getRecordsAt(selection.getSelectedPositions(latest, previous))]
+        assert queryids == ['3', '2']
+        # no previous snapshot: lifetime totals
+        queryids = [dict(zip(self.columns, r))['queryid'] for r in latest.getRecordsAt(selection.getSelectedPositions(latest, None))]
+        assert queryids == ['1', '3']
+        # incremental records restricted to the selected rows
+        assert len(latest.getDeltaRecords(previous, [0])) == 0
+        assert len(latest.getDeltaRecords(previous, [1])) == 1
+
+    def test_union_and_other(self):
+        settings = collectionsettings({'topn': 1, 'unionmetrics': ['wal_bytes']})
+        selection = statementselection(settings)
+        previous = statementsnapshot(self.columns, 60, [self._getRecord(60, 1, 10, 100.0),
+                                                         self._getRecord(60, 2, 10, 100.0),
+                                                         self._getRecord(60, 3, 10, 100.0)])
+        # queryid 1 is heaviest in time, queryid 2 in wal, queryid 3 in neither
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 20, 300.0),
+                                                        self._getRecord(120, 2, 12, 110.0, 9000),
+                                                        self._getRecord(120, 3, 15, 150.0, 10)])
+        positions = selection.getSelectedPositions(latest, previous)
+        assert positions == [0, 1]
+        others = latest.getOtherRecords(previous, positions)
+        assert len(others) == 1
+        other = dict(zip(self.columns, others[0]))
+        assert other['queryid'] == 'other'
+        assert other['calls'] == 5
+        assert other['total_exec_time'] == 50.0
+        assert other['mean_exec_time'] == 10.0
+        # per-database totals are exact
+        records = latest.getDeltaRecords(previous, positions) + others
+        assert sum([dict(zip(self.columns, r))['calls'] for r in records]) == 17
+
+    def test_coverage(self):
+        settings = collectionsettings({'topn': 1, 'coverage': 0.9})
+        selection = statementselection(settings)
+        latest = statementsnapshot(self.columns, 120, [self._getRecord(120, 1, 1, 50.0),
+                                                        self._getRecord(120, 2, 1, 45.0),
+                                                        self._getRecord(120, 3, 1, 5.0)])
+        assert selection.getSelectedPositions(latest, None) == [0, 1]
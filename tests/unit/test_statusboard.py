@@ -0,0 +1,57 @@
+import unittest
+from postgres_stat_profiler.collection.statusboard import statusboard
+
+class TestStatusboard(unittest.TestCase):
+
+    def setUp(self):
+        self.board = statusboard(create=True)
+
+    def tearDown(self):
+        self.board.close()
+
+    def test_status(self):
+        slot = self.board.claimSlot('p1')
+        assert self.board.getStatus('p1') is None
+        assert self.board.getStatus('p2') is None
+        self.board.setStatus(slot, 'initialised', 'operational', 6000, 6001.5, None)
+        attached = statusboard(self.board.getName())
+        status = attached.getStatus('p1')
+        attached.close()
+        assert status == {'reportdbstatus': 'initialised', 'monitordbstatus': 'operational',
+                          'lastcollectepoch': 6000, 'lastcollecttime': 6001.5, 'lasterror': None}
+        self.board.setStatus(slot, 'initialised', 'unavailable', 6000, 6001.5, 'connection refused')
+        assert self.board.getStatus('p1')['lasterror'] == 'connection refused'
+
+    def test_release_clears(self):
+        slot = self.board.claimSlot('p1')
+        self.board.setStatus(slot, 'initialised', 'operational', 6000, 6001.5, None)
+        self.board.releaseSlot('p1')
+        assert self.board.claimSlot('p2') == slot
+        assert self.board.getStatus('p2') is None
+        assert [name for slot, name in self.board.getClaimedSlots()] == ['p2']
+
+    def test_write_in_progress(self):
+        slot = self.board.claimSlot('p1')
+        self.board.setStatus(slot, 'initialised', 'operational', 6000, 6001.5, None)
+        self.board.slots['sequence'][slot] += 1
+        assert self.board.getStatus('p1') is None
+
+    def test_truncated_error(self):
+        slot = self.board.claimSlot('p1')
+        self.board.setStatus(slot, 'initialised', 'operational', 6000, 6001.5, u'é' * 200)
+        assert self.board.getStatus('p1')['lasterror'] == u'é' * 128
+
+    # long names with a common prefix have their own slots, and are kept by releaseOtherSlots
+    def test_long_names(self):
+        first, second = u'é' * 100 + u'1', u'é' * 100 + u'2'
+        firstslot, secondslot = self.board.claimSlot(first), self.board.claimSlot(second)
+        assert firstslot != secondslot
+        self.board.setStatus(firstslot, 'initialised', 'operational', 6000, 6001.5, None)
+        self.board.setStatus(secondslot, 'initialised', 'operational', 6060, 6061.5, None)
+        assert self.board.getStatus(first)['lastcollectepoch'] == 6000
+        assert self.board.getStatus(second)['lastcollectepoch'] == 6060
+        assert self.board.claimSlot(first) == firstslot
+        self.board.claimSlot('p1')
+        self.board.releaseOtherSlots([first, 'p1'])
+        assert self.board.getSlot(first) == firstslot and self.board.getSlot(second) is None
+        assert len(self.board.getClaimedSlots()) == 2